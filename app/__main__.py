@@ -2,6 +2,8 @@
 
 import asyncio
 import logging
+from datetime import timedelta
+from functools import partial
 
 import nats
 import tzlocal
@@ -18,11 +20,22 @@ from app.core.handlers.private import menu, adding_email_account
 from app.core.middlewares.db import DbSessionMiddleware
 from app.core.middlewares.i18n import TranslatorRunnerMiddleware
 from app.core.middlewares.nats import JetStreamContextMiddleware
+from app.core.middlewares.throttling import OutboundThrottlingMiddleware
 from app.core.navigations.command import set_bot_commands
 from app.core.templates import build_translator_hub
-from app.services.broker.broadcaster import broadcast_incoming_emails
-from app.services.broker.fetcher import fetch_incoming_emails
+from app.fetcher import set_fetching_schedulers
+from app.services.broker import consts
+from app.services.broker.broadcaster import broadcast_incoming_emails, remove_expired_deliveries
+from app.services.broker.checkpoints import CheckpointWriter
+from app.services.broker.consumer import PullConsumerWorkers
+from app.services.broker.downloader import download_incoming_emails
+from app.services.broker.partitions import get_partition_durable, get_partitions_subjects
+from app.services.broker.topics import TopicsCache
+from app.services.broker.watcher import IdleWatcher
 from app.services.database.connector import setup_get_pool
+from app.services.email.imap.attachments import remove_stale_attachments
+from app.services.email.imap.parsing import EmailParsingPool
+from app.services.email.imap.pool import IMAPConnectionPool
 from app.settings import settings
 from app.settings.config import Config, load_config
 
@@ -34,6 +47,7 @@ async def main() -> None:
     config: Config = load_config()
 
     bot = Bot(config.bot.token, parse_mode=config.bot.parse_mode)
+    bot.session.middleware(OutboundThrottlingMiddleware())
     await set_bot_commands(bot=bot)
     dp = Dispatcher(storage=MemoryStorage())
 
@@ -43,8 +57,17 @@ async def main() -> None:
 
     _set_middlewares(dp=dp, db_session_pool=db_session_pool, jetstream_context=jetstream)
 
+    imap_pool = IMAPConnectionPool()
+    parsing_pool = EmailParsingPool()
+    checkpoint_writer = CheckpointWriter(session_pool=db_session_pool)
+    idle_watcher = IdleWatcher(session_pool=db_session_pool, jetstream=jetstream, imap_pool=imap_pool,
+                               checkpoint_writer=checkpoint_writer)
+
+    consumers = _start_consumers(bot=bot, db_session_pool=db_session_pool, jetstream_context=jetstream,
+                                 imap_pool=imap_pool, parsing_pool=parsing_pool)
     scheduler = _init_scheduler()
-    await _set_schedulers(scheduler=scheduler, bot=bot, db_session_pool=db_session_pool, jetstream_context=jetstream)
+    await _set_schedulers(scheduler=scheduler, db_session_pool=db_session_pool, jetstream_context=jetstream,
+                          imap_pool=imap_pool, idle_watcher=idle_watcher, checkpoint_writer=checkpoint_writer)
 
     # Provide your default handler-modules into register() func.
     factory.register(dp, menu, adding_email_account, creating_email, forum_events, errors, )
@@ -55,6 +78,12 @@ async def main() -> None:
     finally:
         scheduler.remove_all_jobs()
         scheduler.shutdown()
+        for consumer in consumers:
+            await consumer.close()
+        await idle_watcher.close()
+        await checkpoint_writer.flush()
+        await imap_pool.close()
+        parsing_pool.close()
         await nats_connection.close()
         await dp.storage.close()
         await bot.session.close()
@@ -95,21 +124,64 @@ def _set_middlewares(dp: Dispatcher, db_session_pool: async_sessionmaker, jetstr
     dp.callback_query.middleware(JetStreamContextMiddleware(jetstream_context))
 
 
+def _start_consumers(bot: Bot, db_session_pool: async_sessionmaker, jetstream_context: JetStreamContext,
+                     imap_pool: IMAPConnectionPool, parsing_pool: EmailParsingPool) -> list[PullConsumerWorkers]:
+    """Starts one single-worker consumer per subject partition of each stage: downloader & sender"""
+    consumers = list()
+    download_handler = partial(download_incoming_emails, session_pool=db_session_pool, jetstream=jetstream_context,
+                               imap_pool=imap_pool, parsing_pool=parsing_pool)
+    for subject in get_partitions_subjects(subject=consts.EMAILS_SUBJECT, partitions_count=settings.DOWNLOADERS_COUNT):
+        consumers.append(PullConsumerWorkers(
+            jetstream=jetstream_context,
+            subject=subject,
+            durable=get_partition_durable(durable=consts.DOWNLOADER_DURABLE, partition_subject=subject),
+            handler=download_handler,
+            workers_count=1,
+            max_batch_size=settings.DOWNLOAD_BATCH_SIZE
+        ))
+
+    send_handler = partial(broadcast_incoming_emails, bot=bot, session_pool=db_session_pool, topics_cache=TopicsCache())
+    for subject in get_partitions_subjects(subject=consts.RENDERED_EMAILS_SUBJECT,
+                                           partitions_count=settings.SENDERS_COUNT):
+        consumers.append(PullConsumerWorkers(
+            jetstream=jetstream_context,
+            subject=subject,
+            durable=get_partition_durable(durable=consts.SENDER_DURABLE, partition_subject=subject),
+            handler=send_handler,
+            workers_count=1,
+            max_batch_size=settings.BROADCAST_BATCH_SIZE
+        ))
+
+    for consumer in consumers:
+        consumer.start()
+    return consumers
+
+
 async def _set_schedulers(
         scheduler: AsyncIOScheduler,
-        bot: Bot, db_session_pool:
-        async_sessionmaker,
-        jetstream_context: JetStreamContext
+        db_session_pool: async_sessionmaker,
+        jetstream_context: JetStreamContext,
+        imap_pool: IMAPConnectionPool,
+        idle_watcher: IdleWatcher,
+        checkpoint_writer: CheckpointWriter
 ) -> None:
+    if settings.FETCHING_IN_BOT_PROCESS:
+        set_fetching_schedulers(scheduler=scheduler, db_session_pool=db_session_pool,
+                                jetstream_context=jetstream_context, imap_pool=imap_pool, idle_watcher=idle_watcher,
+                                checkpoint_writer=checkpoint_writer)
+    scheduler.add_job(
+        imap_pool.close_idle,
+        IntervalTrigger(seconds=settings.IMAP_POOL_IDLE_TIMEOUT_SEC)
+    )
     scheduler.add_job(
-        broadcast_incoming_emails,
-        IntervalTrigger(seconds=settings.BROADCASTING_SEC_INTERVAL),
-        (bot, db_session_pool, jetstream_context)
+        remove_expired_deliveries,
+        IntervalTrigger(seconds=settings.DELIVERY_LEDGER_CLEANUP_SEC_INTERVAL),
+        (db_session_pool,)
     )
     scheduler.add_job(
-        fetch_incoming_emails,
-        IntervalTrigger(seconds=settings.FETCHING_SEC_INTERVAL),
-        (db_session_pool, jetstream_context)
+        remove_stale_attachments,
+        IntervalTrigger(seconds=settings.ATTACHMENTS_CLEANUP_SEC_INTERVAL),
+        (timedelta(hours=settings.ATTACHMENTS_MAX_AGE_HOURS),)
     )
 
 
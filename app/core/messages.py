@@ -1,4 +1,5 @@
 from contextlib import suppress
+from html import escape
 from typing import Iterable
 
 from aiogram import Bot
@@ -9,6 +10,8 @@ from app.core import urls
 from app.dtos.email import UserEmailDTO
 from app.services.email.base.entities import EmailServers, IncomingEmail, get_service_by_id
 
+EMAIL_TITLE_MAX_SIZE = 500  # Symbols of sender name & subject. With text node & date fits Telegram message limit
+
 
 async def remove_messages(chat_id: int, bot: Bot, ids: Iterable[int]) -> None:
     for message_id in ids:
@@ -42,19 +45,28 @@ def get_imap_params_message(i18n: TranslatorRunner, email_service: EmailServers,
 
 
 def first_email_message(email: IncomingEmail) -> str:
-    return f"<b>{email.from_name}: {email.subject}</b>\n\n{email.text[0]}"
+    return f"<b>{_get_email_title(email)}</b>\n\n{escape(email.text[0], quote=False)}"
+
+
+def middle_email_message(text_node: str) -> str:
+    return escape(text_node, quote=False)
 
 
 def last_email_message(email: IncomingEmail) -> str:
-    return f"{email.text[-1]}\n\n<i>{email.date}</i>"
+    return f"{escape(email.text[-1], quote=False)}\n\n<i>{email.date}</i>"
 
 
 def single_email_message(email: IncomingEmail) -> str:
-    return f"<b>{email.from_name}: {email.subject}</b>\n\n{email.text[0]}\n\n<i>{email.date}</i>"
+    return f"<b>{_get_email_title(email)}</b>\n\n{escape(email.text[0], quote=False)}\n\n<i>{email.date}</i>"
 
 
 def email_message_without_text(email: IncomingEmail) -> str:
-    return f"<b>{email.from_name}: {email.subject}</b>\n\n<i>{email.date}</i>"
+    return f"<b>{_get_email_title(email)}</b>\n\n<i>{email.date}</i>"
+
+
+def _get_email_title(email: IncomingEmail) -> str:
+    """: Returns escaped sender name & subject, cut to EMAIL_TITLE_MAX_SIZE"""
+    return escape(f"{email.from_name}: {email.subject}"[:EMAIL_TITLE_MAX_SIZE], quote=False)
 
 
 def get_email_info(email: UserEmailDTO) -> str:
@@ -0,0 +1,132 @@
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import time
+from typing import TYPE_CHECKING
+
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (CopyMessage, CreateForumTopic, ForwardMessage, Response, SendAnimation, SendAudio,
+                             SendDocument, SendMediaGroup, SendMessage, SendPhoto, SendVideo, SendVoice, TelegramMethod)
+from aiogram.methods.base import TelegramType
+
+from app.settings import settings
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+TEXT_PRIORITY = 0
+ATTACHMENT_PRIORITY = 1
+
+_THROTTLED_METHODS = (CopyMessage, CreateForumTopic, ForwardMessage, SendAnimation, SendAudio, SendDocument,
+                      SendMediaGroup, SendMessage, SendPhoto, SendVideo, SendVoice)
+_ATTACHMENT_METHODS = (SendAnimation, SendAudio, SendDocument, SendMediaGroup, SendPhoto, SendVideo, SendVoice)
+
+
+class TokenBucket:
+    """
+    Allows `rate` acquisitions per second with bursts up to `capacity`. Waiters are served by priority (lower
+    first), then in arrival order. Bucket can be paused, e.g. by Telegram flood control.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()  # Is in the future while bucket is paused
+        self._waiters: list[tuple[int, int, asyncio.Future]] = list()
+        self._waiters_counter = itertools.count()
+        self._timer: asyncio.TimerHandle | None = None
+
+    @property
+    def is_idle(self) -> bool:
+        """: Returns True if nobody waits and bucket is refilled: it can be dropped & recreated without any effect"""
+        self._refill()
+        return not self._waiters and self._tokens >= self._capacity
+
+    async def acquire(self, priority: int = TEXT_PRIORITY) -> None:
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._waiters_counter), future))
+        self._release()
+        await future
+
+    def pause(self, seconds: float) -> None:
+        self._tokens = 0
+        self._updated_at = max(self._updated_at, time.monotonic() + seconds)  # No burst right after the pause
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if now > self._updated_at:
+            self._tokens = min(self._capacity, self._tokens + (now - self._updated_at) * self._rate)
+            self._updated_at = now
+
+    def _release(self) -> None:
+        self._refill()
+        while self._waiters and (self._waiters[0][2].done() or self._tokens >= 1):
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():  # Cancelled waiters don't take tokens
+                future.set_result(None)
+                self._tokens -= 1
+
+        if self._waiters and not self._timer:
+            delay = max(self._updated_at - time.monotonic(), 0) + (1 - self._tokens) / self._rate
+            self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._release()
+
+
+class OutboundThrottlingMiddleware(BaseRequestMiddleware):
+    """
+    Central outbound scheduler for sending methods of every send path. Keeps bot within Telegram limits: global
+    messages per second & per chat messages. Texts are sent before attachments waiting for the same chat. Flood
+    control (RetryAfter) pauses only the affected chat, request is retried after the pause.
+    """
+
+    def __init__(self) -> None:
+        self._global_bucket = TokenBucket(rate=settings.TELEGRAM_MESSAGES_PER_SEC,
+                                          capacity=settings.TELEGRAM_MESSAGES_PER_SEC)
+        self._chats_buckets: dict[int | str, TokenBucket] = dict()
+
+    async def __call__(self, make_request: NextRequestMiddlewareType[TelegramType], bot: Bot,
+                       method: TelegramMethod[TelegramType]) -> Response[TelegramType]:
+        if not isinstance(method, _THROTTLED_METHODS):
+            return await make_request(bot, method)
+
+        chat_bucket = self._get_chat_bucket(method.chat_id)
+        priority = ATTACHMENT_PRIORITY if isinstance(method, _ATTACHMENT_METHODS) else TEXT_PRIORITY
+        for attempt in range(settings.TELEGRAM_RETRY_AFTER_ATTEMPTS_COUNT):
+            await chat_bucket.acquire(priority)
+            await self._global_bucket.acquire(priority)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == settings.TELEGRAM_RETRY_AFTER_ATTEMPTS_COUNT - 1:
+                    raise
+                chat_bucket.pause(float(e.retry_after))
+
+    def _get_chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats_buckets.get(chat_id)
+        if bucket:
+            return bucket
+
+        if len(self._chats_buckets) >= settings.TELEGRAM_CHATS_BUCKETS_MAX_COUNT:
+            self._chats_buckets = {
+                bucket_chat_id: bucket for bucket_chat_id, bucket in self._chats_buckets.items() if not bucket.is_idle
+            }
+        if _is_group(chat_id):
+            bucket = TokenBucket(rate=settings.TELEGRAM_GROUP_MESSAGES_PER_MIN / 60,
+                                 capacity=settings.TELEGRAM_CHAT_BURST_SIZE)
+        else:
+            bucket = TokenBucket(rate=1 / settings.PAUSE_SECONDS_BETWEEN_MESSAGES,
+                                 capacity=settings.TELEGRAM_CHAT_BURST_SIZE)
+        self._chats_buckets[chat_id] = bucket
+        return bucket
+
+
+def _is_group(chat_id: int | str) -> bool:
+    """: Returns True for groups, supergroups (forums) & channels: their ids are negative or @usernames"""
+    return isinstance(chat_id, str) or chat_id < 0
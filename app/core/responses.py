@@ -1,12 +1,10 @@
 from __future__ import annotations
 
-import asyncio
-import logging
 from contextlib import suppress
 
 from aiogram import Bot
 from aiogram.enums import ParseMode
-from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError, TelegramRetryAfter
+from aiogram.exceptions import TelegramBadRequest, TelegramNetworkError
 from aiogram.fsm.context import FSMContext
 from aiogram.types import FSInputFile, Message, InlineKeyboardMarkup, ReplyKeyboardMarkup
 
@@ -53,39 +51,32 @@ async def edit_or_build_email_message(
 
 
 async def send_topic_email(bot: Bot, email: IncomingEmail, topic: TopicDTO,
-                           disable_notification: bool = False) -> None:
-    first_sent_message = await _send_text_email_messages(
+                           disable_notification: bool = False) -> Message | None:
+    """returns first sent message, which attachments reply to"""
+
+    first_sent_message = await send_topic_email_text(
         bot=bot, email=email, topic=topic, disable_notification=disable_notification
     )
-    await _send_email_attachments(
-        bot=bot, email=email, topic=topic, sent_text_message_to_reply=first_sent_message
+    await send_topic_email_attachments(
+        bot=bot, email=email, topic=topic,
+        reply_to_message_id=first_sent_message.message_id if first_sent_message else None
     )
+    return first_sent_message
 
 
 async def _update_email_message_id_memory_storage(state: FSMContext, message_id: int) -> None:
     await state.update_data({EMAIL_PIPELINE_MESSAGE: message_id})
 
 
-async def _send_text_email_messages(bot: Bot, email: IncomingEmail, topic: TopicDTO,
-                                    disable_notification: bool) -> Message:
+async def send_topic_email_text(bot: Bot, email: IncomingEmail, topic: TopicDTO,
+                                disable_notification: bool = False) -> Message | None:
     """returns first sent message"""
 
     first_sent_message = None
     for text in _get_email_texts(email):
         with suppress(TelegramBadRequest):
-            try:
-                msg = await bot.send_message(chat_id=topic.forum_id, message_thread_id=topic.topic_id,
-                                             text=text, disable_notification=disable_notification)
-            except TelegramRetryAfter as e:
-                await asyncio.sleep(float(e.retry_after))
-                msg = await bot.send_message(chat_id=topic.forum_id, message_thread_id=topic.topic_id,
-                                             text=text, disable_notification=disable_notification)
-            except Exception as e:
-                msg = await bot.send_message(chat_id=topic.forum_id, message_thread_id=topic.topic_id,
-                                             text=text, disable_notification=disable_notification,
-                                             parse_mode=None)
-                logging.warning("Parse mode error: " + str(e) + "\n" + "In text: " + text)
-
+            msg = await bot.send_message(chat_id=topic.forum_id, message_thread_id=topic.topic_id, text=text,
+                                         disable_notification=disable_notification, parse_mode=ParseMode.HTML)
             if not first_sent_message:
                 first_sent_message = msg
 
@@ -93,32 +84,29 @@ async def _send_text_email_messages(bot: Bot, email: IncomingEmail, topic: Topic
         with suppress(TelegramBadRequest):
             msg = await bot.send_message(chat_id=topic.forum_id, message_thread_id=topic.topic_id,
                                          text=messages.email_message_without_text(email),
-                                         disable_notification=disable_notification)
+                                         disable_notification=disable_notification, parse_mode=ParseMode.HTML)
             first_sent_message = msg
 
     return first_sent_message
 
 
-async def _send_email_attachments(bot: Bot, email: IncomingEmail, topic: TopicDTO,
-                                  sent_text_message_to_reply: Message) -> None:
+async def send_topic_email_attachments(bot: Bot, email: IncomingEmail, topic: TopicDTO,
+                                       reply_to_message_id: int | None = None) -> None:
     if email.attachments_paths:
         for attachment_path in email.attachments_paths:
-            with suppress(TelegramBadRequest, TelegramNetworkError, FileNotFoundError):
-                try:
-                    await bot.send_document(
-                        chat_id=topic.forum_id,
-                        message_thread_id=topic.topic_id,
-                        reply_to_message_id=sent_text_message_to_reply.message_id,
-                        document=FSInputFile(str(attachment_path))
-                    )
-                except TelegramRetryAfter as e:
-                    await asyncio.sleep(float(e.retry_after))
-                    await bot.send_document(
-                        chat_id=topic.forum_id,
-                        message_thread_id=topic.topic_id,
-                        reply_to_message_id=sent_text_message_to_reply.message_id,
-                        document=FSInputFile(str(attachment_path))
-                    )
+            await send_topic_email_attachment(bot=bot, attachment_path=attachment_path, topic=topic,
+                                              reply_to_message_id=reply_to_message_id)
+
+
+async def send_topic_email_attachment(bot: Bot, attachment_path: str, topic: TopicDTO,
+                                      reply_to_message_id: int | None = None) -> None:
+    with suppress(TelegramBadRequest, TelegramNetworkError, FileNotFoundError):
+        await bot.send_document(
+            chat_id=topic.forum_id,
+            message_thread_id=topic.topic_id,
+            reply_to_message_id=reply_to_message_id,
+            document=FSInputFile(str(attachment_path))
+        )
 
 
 def _get_email_texts(email: IncomingEmail) -> list[str] | list[None]:
@@ -136,5 +124,5 @@ def _get_email_texts(email: IncomingEmail) -> list[str] | list[None]:
         elif text_part == last_text_part_index:
             texts.append(messages.last_email_message(email))
         else:
-            texts.append(text_batch)
+            texts.append(messages.middle_email_message(text_batch))
     return texts
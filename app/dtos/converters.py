@@ -1,5 +1,7 @@
 from datetime import datetime
 
+from sqlalchemy import Row
+
 from app.dtos.email import UserEmailDTO
 from app.dtos.topic import TopicDTO
 from app.dtos.user import UserDTO
@@ -25,8 +27,25 @@ def db_email_to_dto(email: Email) -> UserEmailDTO:
         forum_id=int(str(email.forum_id)) if bool(email.forum_id) else None,
         mail_server=str(email.mail_server),
         mail_address=str(email.mail_address),
-        mail_auth_key=cryptography.decrypt_key(str(email.mail_auth_key)),
-        last_email_id=int(str(email.last_email_id))
+        mail_auth_key=cryptography.decrypt_email_key(email_db_id=int(str(email.id)), code=str(email.mail_auth_key)),
+        last_email_id=int(str(email.last_email_id)),
+        uid_validity=int(str(email.uid_validity)) if email.uid_validity is not None else None,
+        highest_modseq=int(str(email.highest_modseq)) if email.highest_modseq is not None else None
+    )
+
+
+def email_row_to_dto(row: Row) -> UserEmailDTO:
+    """: Returns DTO of row projected by EmailDAO: its values are already of python types"""
+    return UserEmailDTO(
+        email_db_id=row.id,
+        user_id=row.user_id,
+        forum_id=row.forum_id or None,
+        mail_server=row.mail_server,
+        mail_address=row.mail_address,
+        mail_auth_key=cryptography.decrypt_email_key(email_db_id=row.id, code=row.mail_auth_key),
+        last_email_id=row.last_email_id,
+        uid_validity=row.uid_validity,
+        highest_modseq=row.highest_modseq
     )
 
 
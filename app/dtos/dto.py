@@ -6,6 +6,7 @@ from dataclasses import dataclass
 
 @dataclass(frozen=True)
 class DTO(ABC):
+    __slots__ = ()  # Lets slotted DTOs go without instance dict
 
     @abstractmethod
     def to_db_model(self):
@@ -8,7 +8,7 @@ from app.services.database import models
 from app.services.email.base.entities import EmailService
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)  # Every mailbox with forum is scanned on each poll
 class UserEmailDTO(DTO):
     user_id: int
     mail_server: str
@@ -17,6 +17,8 @@ class UserEmailDTO(DTO):
     last_email_id: int = 0
     forum_id: int | None = None
     email_db_id: int | None = None
+    uid_validity: int | None = None  # IMAP UIDVALIDITY last_email_id belongs to
+    highest_modseq: int | None = None  # CONDSTORE HIGHESTMODSEQ of inbox on last poll
 
     def to_db_model(self) -> models.Email:
         if self.last_email_id:
@@ -36,6 +38,14 @@ class UserEmailDTO(DTO):
             mail_auth_key=cryptography.encrypt_key(self.mail_auth_key)
         )
 
+    def to_checkpoint(self) -> MailboxCheckpointDTO:
+        return MailboxCheckpointDTO(
+            email_db_id=self.email_db_id,
+            last_email_id=self.last_email_id,
+            uid_validity=self.uid_validity,
+            highest_modseq=self.highest_modseq
+        )
+
     @classmethod
     def from_email(cls, email_service: EmailService, email_address: str, email_auth_key: str, user_id: int,
                    forum_id: int | None = None):
@@ -46,3 +56,15 @@ class UserEmailDTO(DTO):
             mail_auth_key=email_auth_key,
             forum_id=forum_id
         )
+
+
+@dataclass(frozen=True, slots=True)
+class MailboxCheckpointDTO(DTO):
+    """Handling progress of mailbox. Unknown (None) UIDVALIDITY & HIGHESTMODSEQ keep the stored ones"""
+    email_db_id: int
+    last_email_id: int  # Last handled email id. Moves only forward unless UIDVALIDITY changed
+    uid_validity: int | None = None
+    highest_modseq: int | None = None
+
+    def to_db_model(self):
+        pass
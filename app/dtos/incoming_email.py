@@ -1,8 +1,10 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from datetime import datetime
 
 from app.dtos.dto import DTO
+from app.services.email.base.entities import IncomingEmail
 
 
 @dataclass(frozen=True)
@@ -11,6 +13,62 @@ class IncomingEmailMessageDTO(DTO):
     mailbox_email_id: int
     forum_id: int
     email_db_id: int | None = None
+    uid_validity: int | None = None  # IMAP UIDVALIDITY mailbox_email_id belongs to
 
     def to_db_model(self):
         pass
+
+
+@dataclass(frozen=True)
+class RenderedEmailMessageDTO(DTO):
+    """
+    Downloaded & parsed email, ready for sending to Telegram. Attachments are files on shared disk.
+    Two-phase downloaded email is published twice: its text first, then its attachments as a follow-up.
+    """
+    user_id: int
+    forum_id: int
+    mailbox_email_id: int
+    from_name: str
+    from_address: str
+    to_: str
+    email_db_id: int | None = None
+    uid_validity: int | None = None  # IMAP UIDVALIDITY mailbox_email_id belongs to
+    date: str | None = None  # ISO format
+    subject: str | None = None
+    text: list[str] | None = None
+    attachments_paths: list[str] | None = None
+    is_attachments: bool = False  # Follow-up of already published text: only attachments are sent
+
+    def to_db_model(self):
+        pass
+
+    def to_incoming_email(self) -> IncomingEmail:
+        return IncomingEmail(
+            id_=str(self.mailbox_email_id),
+            from_name=self.from_name,
+            from_address=self.from_address,
+            to_=self.to_,
+            date=datetime.fromisoformat(self.date) if self.date else None,
+            subject=self.subject,
+            text=self.text,
+            attachments_paths=tuple(self.attachments_paths) if self.attachments_paths else None
+        )
+
+    @classmethod
+    def from_incoming_email(cls, email: IncomingEmail, email_message: IncomingEmailMessageDTO,
+                            is_attachments: bool = False):
+        return cls(
+            user_id=email_message.user_id,
+            forum_id=email_message.forum_id,
+            mailbox_email_id=email_message.mailbox_email_id,
+            email_db_id=email_message.email_db_id,
+            uid_validity=email_message.uid_validity,
+            from_name=email.from_name,
+            from_address=email.from_address,
+            to_=email.to_,
+            date=email.date.isoformat() if email.date else None,
+            subject=email.subject,
+            text=email.text,
+            attachments_paths=list(email.attachments_paths) if email.attachments_paths else None,
+            is_attachments=is_attachments
+        )
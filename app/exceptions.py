@@ -20,3 +20,11 @@ class RegisterHandlerError(ApplicationException):
 
 class DaoError(UnexpectedError):
     pass
+
+
+class PublishError(UnexpectedError):
+    pass
+
+
+class EmailFetchError(UnexpectedError):
+    pass
@@ -0,0 +1,133 @@
+"""
+Fetcher launcher: polls & watches mailboxes and publishes new emails to nats, without Telegram bot.
+Run `python -m app.fetcher --shard` in several processes (on one or many hosts) to split mailboxes between them;
+set FETCHING_IN_BOT_PROCESS to False then.
+"""
+
+import argparse
+import asyncio
+import logging
+from datetime import datetime
+
+import nats
+import tzlocal
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.interval import IntervalTrigger
+from nats.js import JetStreamContext
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.services.broker.checkpoints import CheckpointWriter
+from app.services.broker.fetcher import fetch_incoming_emails
+from app.services.broker.polling import PollingScheduler
+from app.services.broker.shards import ShardMembership
+from app.services.broker.watcher import IdleWatcher
+from app.services.database.connector import setup_get_pool
+from app.services.email.imap.limiter import IMAPSessionsLimiter
+from app.services.email.imap.pool import IMAPConnectionPool
+from app.settings import settings
+from app.settings.config import Config, load_config
+
+
+async def main() -> None:
+    """Starts fetching until the process is stopped."""
+
+    args = _parse_args()
+    _configure_logger()
+    config: Config = load_config()
+
+    db_session_pool = await setup_get_pool(db_uri=config.db.get_uri())
+    nats_connection = await nats.connect(["nats://localhost:4222"])
+    jetstream = nats_connection.jetstream()
+
+    imap_pool = IMAPConnectionPool()
+    checkpoint_writer = CheckpointWriter(session_pool=db_session_pool)
+    shard_membership = None
+    if args.shard:
+        shard_membership = ShardMembership(session_pool=db_session_pool)
+        await shard_membership.heartbeat()  # Shard is taken before the first poll
+    idle_watcher = IdleWatcher(session_pool=db_session_pool, jetstream=jetstream, imap_pool=imap_pool,
+                               checkpoint_writer=checkpoint_writer, shard_membership=shard_membership)
+
+    scheduler = AsyncIOScheduler(timezone=str(tzlocal.get_localzone()))
+    scheduler.start()
+    set_fetching_schedulers(scheduler=scheduler, db_session_pool=db_session_pool, jetstream_context=jetstream,
+                            imap_pool=imap_pool, idle_watcher=idle_watcher, checkpoint_writer=checkpoint_writer,
+                            shard_membership=shard_membership)
+    scheduler.add_job(
+        imap_pool.close_idle,
+        IntervalTrigger(seconds=settings.IMAP_POOL_IDLE_TIMEOUT_SEC)
+    )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        scheduler.remove_all_jobs()
+        scheduler.shutdown()
+        await idle_watcher.close()
+        await checkpoint_writer.flush()
+        if shard_membership:
+            await shard_membership.leave()
+        await imap_pool.close()
+        await nats_connection.close()
+
+
+def set_fetching_schedulers(
+        scheduler: AsyncIOScheduler,
+        db_session_pool: async_sessionmaker,
+        jetstream_context: JetStreamContext,
+        imap_pool: IMAPConnectionPool,
+        idle_watcher: IdleWatcher,
+        checkpoint_writer: CheckpointWriter,
+        shard_membership: ShardMembership | None = None
+) -> None:
+    """Schedules polling, IDLE watching & saving mailboxes progress. Used by bot process too"""
+    polling_scheduler = PollingScheduler(session_pool=db_session_pool, shard_membership=shard_membership)
+    scheduler.add_job(
+        polling_scheduler.sync,
+        IntervalTrigger(seconds=settings.POLLING_SYNC_SEC_INTERVAL),
+        next_run_time=datetime.now(tz=tzlocal.get_localzone())
+    )
+    scheduler.add_job(
+        fetch_incoming_emails,
+        IntervalTrigger(seconds=settings.POLLING_TICK_SEC),
+        (jetstream_context, imap_pool, polling_scheduler, IMAPSessionsLimiter(limit=settings.FETCHING_WORKERS_COUNT),
+         checkpoint_writer, idle_watcher.watched_emails_ids),
+        max_instances=settings.FETCHING_WORKERS_COUNT  # Ticks overlap while slow mailboxes are polled
+    )
+    scheduler.add_job(
+        checkpoint_writer.flush,
+        IntervalTrigger(seconds=settings.CHECKPOINTS_FLUSH_SEC_INTERVAL)
+    )
+    if settings.IDLE_MODE_ENABLED:
+        scheduler.add_job(
+            idle_watcher.sync,
+            IntervalTrigger(seconds=settings.IDLE_SYNC_SEC_INTERVAL),
+            next_run_time=datetime.now(tz=tzlocal.get_localzone())
+        )
+    if shard_membership:
+        scheduler.add_job(
+            shard_membership.heartbeat,
+            IntervalTrigger(seconds=settings.SHARD_HEARTBEAT_SEC_INTERVAL)
+        )
+
+
+def _parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m app.fetcher", description="Fetches mailboxes without bot")
+    parser.add_argument("--shard", action="store_true",
+                        help="fetch only a share of mailboxes, split with other running `--shard` fetchers")
+    return parser.parse_args()
+
+
+def _configure_logger() -> None:
+    logging.basicConfig(
+        level=logging.WARNING,
+        format="%(asctime)s - %(levelname)s - %(name)s - %(message)s"
+    )
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except (KeyboardInterrupt, SystemExit):
+        # Logging this is pointless
+        pass
@@ -1,106 +1,122 @@
 from __future__ import annotations
 
 import logging
-from contextlib import suppress
+from datetime import timedelta
 
 import dataclass_factory
 from aiogram import Bot
 from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
 from nats.aio.msg import Msg
-from nats.errors import ConnectionClosedError
-from nats.js import JetStreamContext
 from ormsgpack import ormsgpack
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
 
-from app.core.responses import send_topic_email
-from app.dtos.email import UserEmailDTO
-from app.dtos.incoming_email import IncomingEmailMessageDTO
-from app.dtos.topic import TopicDTO
-from app.services.broker import consts
-from app.services.database.dao.email import EmailDAO
-from app.services.database.dao.topic import TopicDAO
-from app.services.email.base.entities import get_service_by_id, IncomingEmail
-from app.services.email.imap.attachments import IncomingAttachmentsDirectory
-from app.services.email.imap.fetcher.mailbox import BroadcastMailbox
+from app.core.responses import send_topic_email, send_topic_email_attachments
+from app.dtos.incoming_email import RenderedEmailMessageDTO
+from app.services.broker.topics import TopicsCache
+from app.services.database.dao.delivery import DeliveredEmailDAO
+from app.services.email.base.entities import IncomingEmail
+from app.services.email.imap.attachments import remove_attachments
 from app.settings import settings
 
 
-async def broadcast_incoming_emails(bot: Bot, session_pool: async_sessionmaker, jetstream: JetStreamContext) -> None:
+async def broadcast_incoming_emails(pulled_email_messages: list[Msg], bot: Bot, session_pool: async_sessionmaker,
+                                    topics_cache: TopicsCache) -> None:
+    """
+    Sender stage: handles pulled rendered emails, sends them to forums' topics. Talks to Telegram only.
+    Emails found in delivery ledger (redelivered after crash or ack timeout) are acknowledged without re-posting.
+    Emails which failed to be sent (besides rejected by Telegram) are redelivered: delivery is at least once.
+    Mailboxes' progress isn't saved here: fetcher saved it when UIDs were published, within their UIDVALIDITY.
+    """
+
     async with session_pool() as session:
-        email_dao = EmailDAO(session)
-        subscriber = await jetstream.pull_subscribe(stream=consts.STREAM, subject=consts.ANY_SUBJECT,
-                                                    durable=consts.DURABLE)
-        try:
-            pulled_email_messages = await subscriber.fetch(settings.BROADCAST_BATCH_SIZE)
-        except (TimeoutError, ConnectionClosedError):
-            return
-
-        for pulled_email_message in pulled_email_messages:
-            email_message = _unpack_email_message(pulled_email_message)
-            user_email = await email_dao.get_email(user_id=email_message.user_id, forum_id=email_message.forum_id)
-            if not user_email:
-                await pulled_email_message.ack()
+        delivered_email_dao = DeliveredEmailDAO(session)
+        emails_messages = [_unpack_email_message(pulled_email_message) for pulled_email_message in pulled_email_messages]
+        # Attachments follow-up replies to its text: text's message id is looked up too
+        delivered_emails = await delivered_email_dao.get_delivered_emails(
+            ledger_key for email_message in emails_messages
+            for ledger_key in {_get_ledger_key(email_message, is_attachments=email_message.is_attachments),
+                               _get_ledger_key(email_message, is_attachments=False)}
+            if ledger_key
+        )
+        sent_emails = dict()
+        failed_emails_indexes = set()  # Redelivered with their attachments
+        for email_index, email_message in enumerate(emails_messages):
+            email = email_message.to_incoming_email()
+            ledger_key = _get_ledger_key(email_message, is_attachments=email_message.is_attachments)
+            try:
+                if not ledger_key or ledger_key not in delivered_emails:
+                    message_id = await _send_email(
+                        bot=bot, session=session, topics_cache=topics_cache, email=email,
+                        forum_id=email_message.forum_id, is_attachments=email_message.is_attachments,
+                        reply_to_message_id=delivered_emails.get(_get_ledger_key(email_message, is_attachments=False))
+                    )
+                    if ledger_key:
+                        delivered_emails[ledger_key] = sent_emails[ledger_key] = message_id
+            except (TelegramBadRequest, TelegramForbiddenError):  # Won't be sent by retries either
+                pass
+            except Exception as e:
+                logging.error(f"Email {email_message.mailbox_email_id} of email {email_message.email_db_id} "
+                              f"wasn't sent: {e}")
+                failed_emails_indexes.add(email_index)
                 continue
+            remove_attachments(email.attachments_paths or ())
 
-            await email_dao.set_last_sent_email_id(
-                user_id=user_email.user_id,
-                email_address=user_email.mail_address,
-                last_email_id=email_message.mailbox_email_id
-            )
+        # Batch is acknowledged after its deliveries are saved: redelivered messages are found in the ledger
+        try:
+            await delivered_email_dao.add_delivered_emails(sent_emails)
+        except Exception as e:
+            logging.error(f"Delivered emails weren't added to the ledger: {e}")
 
-            await _broadcast(bot=bot, session=session, user_email=user_email, email_message=email_message)
+    for email_index, (pulled_email_message, email_message) in enumerate(zip(pulled_email_messages, emails_messages)):
+        if email_index not in failed_emails_indexes:
             await pulled_email_message.ack()
+        elif pulled_email_message.metadata.num_delivered >= settings.BROADCAST_MAX_DELIVERIES:
+            # Stream has no max deliveries: message which can't be sent would be redelivered forever
+            logging.error(f"Email {email_message.mailbox_email_id} of email {email_message.email_db_id} wasn't "
+                          f"sent after {pulled_email_message.metadata.num_delivered} deliveries, it's dropped")
+            remove_attachments(email_message.attachments_paths or ())
+            await pulled_email_message.term()
+        else:
+            await pulled_email_message.nak(delay=settings.BROADCAST_RETRY_DELAY_SEC)
+
+
+async def remove_expired_deliveries(session_pool: async_sessionmaker) -> None:
+    """Removes delivery ledger records older than any possible redelivery"""
+    async with session_pool() as session:
+        await DeliveredEmailDAO(session).remove_expired(
+            retention=timedelta(hours=settings.DELIVERY_LEDGER_RETENTION_HOURS)
+        )
+
+
+def _get_ledger_key(email_message: RenderedEmailMessageDTO, is_attachments: bool) -> tuple[int, int, int, bool] | None:
+    """
+    : Returns delivery ledger key of email text or of its attachments follow-up. None for messages published without
+    mailbox id or UIDVALIDITY
+    """
 
+    if email_message.email_db_id is None or email_message.uid_validity is None:
+        return None
+    return email_message.email_db_id, email_message.uid_validity, email_message.mailbox_email_id, is_attachments
 
-def _unpack_email_message(pulled_email_message: Msg) -> IncomingEmailMessageDTO:
-    factory = dataclass_factory.Factory()
-    message = factory.load(ormsgpack.unpackb(pulled_email_message.data), IncomingEmailMessageDTO)
+
+def _unpack_email_message(pulled_email_message: Msg) -> RenderedEmailMessageDTO:
+    # Fields are packed with their names as is: `to_` mustn't be looked up as `to`
+    factory = dataclass_factory.Factory(default_schema=dataclass_factory.Schema(trim_trailing_underscore=False))
+    message = factory.load(ormsgpack.unpackb(pulled_email_message.data), RenderedEmailMessageDTO)
     return message
 
 
-async def _broadcast(
-        user_email: UserEmailDTO, bot: Bot, session: AsyncSession, email_message: IncomingEmailMessageDTO
-):
-    with IncomingAttachmentsDirectory(user_id=user_email.user_id) as cache_dir:
-        async with BroadcastMailbox(
-                cache_dir=cache_dir,
-                email_address=user_email.mail_address,
-                email_service=get_service_by_id(service_id=user_email.mail_server).value,
-                email_auth_key=user_email.mail_auth_key,
-                user_id=user_email.user_id
-        ) as mailbox:
-            if mailbox.can_connect():
-                email = await mailbox.get_email(email_id=str(email_message.mailbox_email_id))
-                if email:
-                    try:
-                        await _send_email(bot=bot, session=session, email=email, forum_id=email_message.forum_id)
-                    except (TelegramBadRequest, TelegramForbiddenError):
-                        pass
-                    except Exception as e:
-                        logging.error(e)
-
-
-async def _send_email(bot: Bot, session: AsyncSession, email: IncomingEmail, forum_id: int) -> None:
-    topic_dao = TopicDAO(session)
-    is_topic_created = await topic_dao.is_topic_created(forum_id=forum_id, email_address=email.from_address)
-    if not is_topic_created:
-        await _create_topic(bot=bot, topic_dao=topic_dao, forum_id=forum_id, email=email)
-
-    topic = await topic_dao.get_topic(forum_id=forum_id, email_address=email.from_address)
-
-    try:
-        await send_topic_email(bot=bot, email=email, topic=topic)
-    except Exception as e:
-        logging.error(e)
-
-
-async def _create_topic(bot: Bot, topic_dao: TopicDAO, forum_id: int, email: IncomingEmail):
-    with suppress(TelegramBadRequest):
-        new_topic = await bot.create_forum_topic(chat_id=forum_id, name=email.from_address)
-        await topic_dao.add_topic(
-            TopicDTO(
-                forum_id=forum_id,
-                topic_id=new_topic.message_thread_id,
-                topic_name=email.from_address
-            )
-        )
+async def _send_email(bot: Bot, session: AsyncSession, topics_cache: TopicsCache, email: IncomingEmail,
+                      forum_id: int, is_attachments: bool, reply_to_message_id: int | None) -> int | None:
+    """
+    Sends email text with its attachments, or attachments follow-up replying to already sent text.
+    :return: id of the first sent message of email text
+    """
+
+    topic = await topics_cache.get_or_create_topic(bot=bot, session=session, forum_id=forum_id,
+                                                   email_address=email.from_address)
+    if is_attachments:
+        await send_topic_email_attachments(bot=bot, email=email, topic=topic, reply_to_message_id=reply_to_message_id)
+        return None
+    sent_message = await send_topic_email(bot=bot, email=email, topic=topic)
+    return sent_message.message_id if sent_message else None
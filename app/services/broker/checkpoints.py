@@ -0,0 +1,79 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import replace
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.dtos.email import MailboxCheckpointDTO, UserEmailDTO
+from app.services.database.dao.email import EmailDAO
+
+
+class CheckpointWriter:
+    """
+    Collects mailboxes' handling progress (last email id published by fetcher or IDLE watcher) in memory and saves it
+    with one bulk UPDATE every CHECKPOINTS_FLUSH_SEC_INTERVAL & on shutdown, instead of a transaction per mailbox.
+    Not saved progress is lost on crash: these emails are published again and dropped by JetStream deduplication or
+    delivery ledger.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker) -> None:
+        self._session_pool = session_pool
+        self._checkpoints: dict[int, MailboxCheckpointDTO] = dict()  # Not saved progress by Email db id
+        self._flush_lock = asyncio.Lock()
+
+    def add(self, checkpoint: MailboxCheckpointDTO) -> None:
+        """Merges progress with not saved one of the same mailbox. Checkpoint with new UIDVALIDITY replaces old one"""
+        saved_checkpoint = self._checkpoints.get(checkpoint.email_db_id)
+        if saved_checkpoint:
+            checkpoint = _merge(saved_checkpoint, checkpoint)
+        self._checkpoints[checkpoint.email_db_id] = checkpoint
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            checkpoints, self._checkpoints = self._checkpoints, dict()
+            if not checkpoints:
+                return
+            try:
+                async with self._session_pool() as session:
+                    await EmailDAO(session).set_checkpoints(checkpoints.values())
+            except Exception as e:
+                logging.error(f"Mailboxes checkpoints weren't saved: {e}")
+                for checkpoint in checkpoints.values():  # Saved with the next flush, merged with newer progress
+                    new_checkpoint = self._checkpoints.get(checkpoint.email_db_id)
+                    self._checkpoints[checkpoint.email_db_id] = (
+                        _merge(checkpoint, new_checkpoint) if new_checkpoint else checkpoint
+                    )
+
+
+def merge_progress(stored_email: UserEmailDTO, handled_email: UserEmailDTO) -> UserEmailDTO:
+    """
+    : Returns mailbox from database with the latest progress. Progress handled by this process may be not saved yet,
+    while the saved one may be newer: e.g. made by IDLE watcher while mailbox was polled, or vice versa.
+    :param stored_email: mailbox from database, with fresh credentials & forum.
+    :param handled_email: mailbox with progress handled by this process.
+    """
+    if stored_email.uid_validity != handled_email.uid_validity:
+        # Progress of different inboxes can't be compared. Saved one wins unless it's legacy (without UIDVALIDITY)
+        if stored_email.uid_validity is not None:
+            return stored_email
+        return replace(stored_email, last_email_id=handled_email.last_email_id, uid_validity=handled_email.uid_validity,
+                       highest_modseq=handled_email.highest_modseq)
+    return replace(
+        stored_email,
+        last_email_id=max(stored_email.last_email_id, handled_email.last_email_id),
+        highest_modseq=max((modseq for modseq in (stored_email.highest_modseq, handled_email.highest_modseq)
+                            if modseq is not None), default=None)
+    )
+
+
+def _merge(old: MailboxCheckpointDTO, new: MailboxCheckpointDTO) -> MailboxCheckpointDTO:
+    if new.uid_validity is not None and new.uid_validity != old.uid_validity:
+        return new
+    return MailboxCheckpointDTO(
+        email_db_id=new.email_db_id,
+        last_email_id=max(old.last_email_id, new.last_email_id),
+        uid_validity=old.uid_validity,
+        highest_modseq=new.highest_modseq if new.highest_modseq is not None else old.highest_modseq
+    )
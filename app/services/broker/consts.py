@@ -2,6 +2,7 @@ from typing import Final
 
 STREAM: Final[str] = "lesst"
 EMAIL_MESSAGE: Final[str] = "email_message"
-ANY_SUBJECT: Final[str] = "*"
-DURABLE: Final[str] = "aiogram"
-EMAILS_SUBJECT: Final[str] = "email"
+EMAILS_SUBJECT: Final[str] = "email"  # UIDs of new emails, published by fetcher
+RENDERED_EMAILS_SUBJECT: Final[str] = "rendered_email"  # Downloaded & parsed emails, published by downloader
+DOWNLOADER_DURABLE: Final[str] = "downloader"
+SENDER_DURABLE: Final[str] = "sender"
@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from contextlib import suppress
+from typing import Awaitable, Callable
+
+from nats.aio.msg import Msg
+from nats.errors import ConnectionClosedError
+from nats.js import JetStreamContext, api
+
+from app.services.broker import consts
+from app.settings import settings
+
+
+class PullConsumerWorkers:
+    """
+    Long-lived supervised workers of one durable pull consumer. Every worker keeps its own pull subscription and
+    long-polls the server: quiet stream costs one request per CONSUMER_FETCH_TIMEOUT_SEC, busy one is drained
+    with batches growing up to max_batch_size. Server stops delivering to the consumer when all workers' batches
+    are unacknowledged (max_ack_pending).
+    """
+
+    def __init__(self, jetstream: JetStreamContext, subject: str, durable: str,
+                 handler: Callable[[list[Msg]], Awaitable[None]], workers_count: int, max_batch_size: int) -> None:
+        """
+        :param handler: handles pulled batch. Acknowledges messages itself.
+        """
+
+        self._jetstream = jetstream
+        self._subject = subject
+        self._durable = durable
+        self._handler = handler
+        self._workers_count = workers_count
+        self._max_batch_size = max_batch_size
+        self._tasks: list[asyncio.Task] = list()
+
+    def start(self) -> None:
+        self._tasks = [asyncio.create_task(self._supervise()) for _ in range(self._workers_count)]
+
+    async def close(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _supervise(self) -> None:
+        while True:
+            try:
+                await self._consume()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Consumer {self._durable} worker failed: {e}")
+            await asyncio.sleep(settings.CONSUMER_RESTART_PAUSE_SEC)
+
+    async def _consume(self) -> None:
+        subscriber = await self._jetstream.pull_subscribe(
+            stream=consts.STREAM,
+            subject=self._subject,
+            durable=self._durable,
+            # Applied only when consumer is created
+            config=api.ConsumerConfig(max_ack_pending=self._workers_count * self._max_batch_size)
+        )
+        batch_size = 1
+        try:
+            while True:
+                try:
+                    pulled_messages = await subscriber.fetch(batch_size, timeout=settings.CONSUMER_FETCH_TIMEOUT_SEC)
+                except TimeoutError:  # Nothing came during long poll
+                    batch_size = 1
+                    continue
+                except ConnectionClosedError:
+                    return
+
+                await self._handler(pulled_messages)
+                # Full batch means there is backlog: pull more at once. Partial one means the stream is drained
+                if len(pulled_messages) >= batch_size:
+                    batch_size = min(batch_size * 2, self._max_batch_size)
+                else:
+                    batch_size = max(batch_size // 2, 1)
+        finally:
+            with suppress(Exception):  # Connection is already closed
+                await subscriber.unsubscribe()
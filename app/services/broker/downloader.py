@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import logging
+from dataclasses import replace
+
+import dataclass_factory
+from aioimaplib import aioimaplib
+from nats.aio.msg import Msg
+from nats.js import JetStreamContext
+from ormsgpack import ormsgpack
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.dtos.email import UserEmailDTO
+from app.dtos.incoming_email import IncomingEmailMessageDTO, RenderedEmailMessageDTO
+from app.services.broker import consts
+from app.services.broker.partitions import get_partition_subject
+from app.services.broker.publisher import OutgoingMessage, publish_messages
+from app.services.database.dao.email import EmailDAO
+from app.services.email.base.entities import get_service_by_id, IncomingEmail
+from app.services.email.imap.attachments import IncomingAttachmentsDirectory, remove_attachments
+from app.services.email.imap.fetcher.mailbox import BroadcastMailbox
+from app.services.email.imap.parsing import EmailParsingPool
+from app.services.email.imap.pool import IMAPConnectionPool
+from app.settings import settings
+
+
+async def download_incoming_emails(pulled_email_messages: list[Msg], session_pool: async_sessionmaker,
+                                   jetstream: JetStreamContext, imap_pool: IMAPConnectionPool,
+                                   parsing_pool: EmailParsingPool) -> None:
+    """
+    Downloader stage: handles pulled UIDs of new emails. Downloads & parses emails and publishes them rendered for
+    sender stage. IMAP is the only slow dependency here, Telegram isn't touched.
+    """
+
+    async with session_pool() as session:
+        email_dao = EmailDAO(session)
+        for mailbox_messages in _group_by_mailbox(pulled_email_messages):
+            _, first_email_message = mailbox_messages[0]
+            user_email = await email_dao.get_email(user_id=first_email_message.user_id,
+                                                   forum_id=first_email_message.forum_id)
+            if not user_email:  # Mailbox was removed
+                for pulled_email_message, _ in mailbox_messages:
+                    await pulled_email_message.ack()
+                continue
+            await _download_mailbox_emails(jetstream=jetstream, user_email=user_email, imap_pool=imap_pool,
+                                           parsing_pool=parsing_pool, mailbox_messages=mailbox_messages)
+
+
+def _unpack_email_message(pulled_email_message: Msg) -> IncomingEmailMessageDTO:
+    factory = dataclass_factory.Factory()
+    message = factory.load(ormsgpack.unpackb(pulled_email_message.data), IncomingEmailMessageDTO)
+    return message
+
+
+def _group_by_mailbox(pulled_email_messages: list[Msg]) -> list[list[tuple[Msg, IncomingEmailMessageDTO]]]:
+    """: Groups pulled messages by mailbox (user & forum), keeping order of messages inside each group"""
+    groups: dict[tuple[int, int], list[tuple[Msg, IncomingEmailMessageDTO]]] = dict()
+    for pulled_email_message in pulled_email_messages:
+        email_message = _unpack_email_message(pulled_email_message)
+        groups.setdefault((email_message.user_id, email_message.forum_id), list()).append(
+            (pulled_email_message, email_message)
+        )
+    return list(groups.values())
+
+
+async def _download_mailbox_emails(jetstream: JetStreamContext, user_email: UserEmailDTO,
+                                   imap_pool: IMAPConnectionPool, parsing_pool: EmailParsingPool,
+                                   mailbox_messages: list[tuple[Msg, IncomingEmailMessageDTO]]) -> None:
+    """
+    Downloads all emails of one mailbox with one borrowed session and publishes them in the pulled order.
+    UID is acknowledged once its email is published, or mailbox answered without it (email was removed). UIDs of
+    mailbox which can't be connected or fetched are redelivered later, like UIDs of not published emails.
+    """
+
+    handled_emails_ids = set()  # Published or removed from mailbox
+    try:
+        async with imap_pool.borrow(
+                user_email=user_email,
+                attempts_count=settings.EMAIL_BROADCASTER_CONNECTIONS_ATTEMPTS_COUNT
+        ) as client:
+            if client:
+                with IncomingAttachmentsDirectory(user_id=user_email.user_id) as cache_dir:
+                    mailbox = _build_mailbox(user_email=user_email, cache_dir=cache_dir, client=client,
+                                             parsing_pool=parsing_pool)
+                    if settings.TWO_PHASE_FETCH_ENABLED:
+                        await _download_in_two_phases(jetstream=jetstream, mailbox=mailbox, cache_dir=cache_dir,
+                                                      mailbox_messages=mailbox_messages,
+                                                      handled_emails_ids=handled_emails_ids)
+                    else:
+                        await _download_in_one_phase(jetstream=jetstream, mailbox=mailbox,
+                                                     mailbox_messages=mailbox_messages,
+                                                     handled_emails_ids=handled_emails_ids)
+    except Exception as e:
+        logging.error(f"Emails of email {user_email.email_db_id} weren't downloaded: {e}")
+
+    for pulled_email_message, email_message in mailbox_messages:
+        if str(email_message.mailbox_email_id) in handled_emails_ids:
+            await pulled_email_message.ack()
+        else:
+            await _retry_download(pulled_email_message=pulled_email_message, email_message=email_message)
+
+
+async def _retry_download(pulled_email_message: Msg, email_message: IncomingEmailMessageDTO) -> None:
+    """
+    Redelivers UID after DOWNLOAD_RETRY_DELAY_SEC: mailbox or stream may be unavailable for a while.
+    Stream has no max deliveries: UID which still isn't published after DOWNLOAD_MAX_DELIVERIES is dropped.
+    """
+
+    if pulled_email_message.metadata.num_delivered >= settings.DOWNLOAD_MAX_DELIVERIES:
+        logging.error(f"Email {email_message.mailbox_email_id} of email {email_message.email_db_id} wasn't "
+                      f"published after {pulled_email_message.metadata.num_delivered} deliveries, it's dropped")
+        await pulled_email_message.term()
+    else:
+        await pulled_email_message.nak(delay=settings.DOWNLOAD_RETRY_DELAY_SEC)
+
+
+async def _download_in_one_phase(jetstream: JetStreamContext, mailbox: BroadcastMailbox,
+                                 mailbox_messages: list[tuple[Msg, IncomingEmailMessageDTO]],
+                                 handled_emails_ids: set[str]) -> None:
+    """Fetches whole emails at once and publishes them with their attachments"""
+    emails_ids = [str(email_message.mailbox_email_id) for _, email_message in mailbox_messages]
+    emails = await mailbox.get_emails(emails_ids=emails_ids)
+    handled_emails_ids.update(email_id for email_id in emails_ids if email_id not in emails)
+
+    downloaded_emails = [(email_message, email) for _, email_message in mailbox_messages
+                         if (email := emails.get(str(email_message.mailbox_email_id)))]
+    acks = await publish_messages(jetstream=jetstream, messages=[
+        _build_rendered_message(email=email, email_message=email_message) for email_message, email in downloaded_emails
+    ])
+    for (_, email), ack in zip(downloaded_emails, acks):
+        if ack is not None:
+            handled_emails_ids.add(email.id_)
+        # Sender won't get these attachments: email is downloaded again, or it's already in stream with its own ones
+        if ack is None or ack.duplicate:
+            remove_attachments(email.attachments_paths or ())
+
+
+async def _download_in_two_phases(jetstream: JetStreamContext, mailbox: BroadcastMailbox,
+                                  cache_dir: IncomingAttachmentsDirectory,
+                                  mailbox_messages: list[tuple[Msg, IncomingEmailMessageDTO]],
+                                  handled_emails_ids: set[str]) -> None:
+    """
+    Fetches structures of all emails at once. Each email is published as soon as its text part is downloaded:
+    sender posts the text without waiting for attachments. Attachments parts are downloaded after it & published
+    as a follow-up, attachments above Telegram limit aren't downloaded at all.
+    """
+
+    emails_ids = [str(email_message.mailbox_email_id) for _, email_message in mailbox_messages]
+    structures = await mailbox.get_emails_structures(emails_ids=emails_ids)
+    handled_emails_ids.update(email_id for email_id in emails_ids if email_id not in structures)
+
+    for _, email_message in mailbox_messages:
+        email_id = str(email_message.mailbox_email_id)
+        structure = structures.get(email_id)
+        if not structure:
+            continue
+        email = await mailbox.get_email_preview(email_id=email_id, structure=structure)
+        text_ack, = await publish_messages(jetstream=jetstream, messages=[
+            _build_rendered_message(email=email, email_message=email_message)
+        ])
+        if text_ack is None:
+            continue
+
+        attachments_paths = list()
+        for part in structure.get_attachments_parts():
+            attachment_path = await mailbox.save_attachment(email_id=email_id, part=part)
+            if attachment_path:
+                attachments_paths.append(attachment_path)
+        if attachments_paths:
+            attachments_ack, = await publish_messages(jetstream=jetstream, messages=[_build_rendered_message(
+                email=replace(email, text=None, attachments_paths=tuple(attachments_paths)),
+                email_message=email_message, is_attachments=True
+            )])
+            cache_dir.release_attachments()
+            if attachments_ack is None or attachments_ack.duplicate:
+                remove_attachments(attachments_paths)
+            if attachments_ack is None:
+                continue
+        handled_emails_ids.add(email_id)
+
+
+def _build_rendered_message(email: IncomingEmail, email_message: IncomingEmailMessageDTO,
+                            is_attachments: bool = False) -> OutgoingMessage:
+    """: Returns rendered email for sender stage. Attachments follow-up of email text is deduplicated separately"""
+    msg_id = f"{email_message.email_db_id}.{email_message.uid_validity}.{email_message.mailbox_email_id}"
+    return OutgoingMessage(
+        subject=get_partition_subject(subject=consts.RENDERED_EMAILS_SUBJECT, email_db_id=email_message.email_db_id,
+                                      partitions_count=settings.SENDERS_COUNT),
+        payload=ormsgpack.packb(RenderedEmailMessageDTO.from_incoming_email(email=email, email_message=email_message,
+                                                                            is_attachments=is_attachments)),
+        msg_id=f"{msg_id}.attachments" if is_attachments else msg_id
+    )
+
+
+def _build_mailbox(user_email: UserEmailDTO, cache_dir: IncomingAttachmentsDirectory,
+                   client: aioimaplib.IMAP4_SSL, parsing_pool: EmailParsingPool) -> BroadcastMailbox:
+    return BroadcastMailbox(
+        cache_dir=cache_dir,
+        email_address=user_email.mail_address,
+        email_service=get_service_by_id(service_id=user_email.mail_server).value,
+        email_auth_key=user_email.mail_auth_key,
+        user_id=user_email.user_id,
+        client=client,
+        parsing_pool=parsing_pool
+    )
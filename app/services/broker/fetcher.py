@@ -1,68 +1,160 @@
 from __future__ import annotations
 
+import asyncio
 import logging
+from dataclasses import replace
+from itertools import takewhile
+from typing import Container
 
+from aioimaplib import aioimaplib
 from nats.js import JetStreamContext
 from ormsgpack import ormsgpack
-from sqlalchemy.ext.asyncio import async_sessionmaker
 
 from app.dtos.email import UserEmailDTO
 from app.dtos.incoming_email import IncomingEmailMessageDTO
+from app.exceptions import PublishError
 from app.services.broker import consts
-from app.services.database.dao.email import EmailDAO
-from app.services.email.base.entities import get_service_by_id
+from app.services.broker.checkpoints import CheckpointWriter
+from app.services.broker.partitions import get_partition_subject
+from app.services.broker.polling import PollingScheduler
+from app.services.broker.publisher import OutgoingMessage, publish_messages
+from app.services.email.base.entities import MailboxStatus, get_service_by_id
 from app.services.email.imap.attachments import IncomingAttachmentsDirectory
 from app.services.email.imap.fetcher.mailbox import BroadcastMailbox
+from app.services.email.imap.limiter import IMAPSessionsLimiter
+from app.services.email.imap.pool import IMAPConnectionPool
+from app.settings import settings
 
 
-async def fetch_incoming_emails(session_pool: async_sessionmaker, jetstream: JetStreamContext) -> None:
-    async with session_pool() as session:
-        email_dao = EmailDAO(session)
-        emails_with_forums = await email_dao.get_emails_with_forums()
-
-        for user_email in emails_with_forums:
-            user_email: UserEmailDTO
-
-            not_sent_email_ids = await _get_not_sent_email_ids(user_email=user_email)
-            if not not_sent_email_ids:
-                continue
-
-            for email_id in not_sent_email_ids:
-                try:
-                    await jetstream.publish(
-                        subject=consts.EMAILS_SUBJECT,
-                        payload=ormsgpack.packb(
-                            IncomingEmailMessageDTO(
-                                forum_id=user_email.forum_id,
-                                mailbox_email_id=email_id,
-                                email_db_id=user_email.email_db_id,
-                                user_id=user_email.user_id
-                            )
-                        )
-                    )
-                except Exception as e:
-                    logging.error(e)
-
-            # Update last "handled" email-id. "Handled" means: "added to nats queue"
-            await email_dao.set_last_sent_email_id_by_email_id(
-                email_db_id=user_email.email_db_id,
-                last_email_id=max(not_sent_email_ids)
+async def fetch_incoming_emails(jetstream: JetStreamContext, imap_pool: IMAPConnectionPool,
+                                polling_scheduler: PollingScheduler, limiter: IMAPSessionsLimiter,
+                                checkpoint_writer: CheckpointWriter,
+                                skipped_emails_ids: Container[int] = frozenset()) -> None:
+    """
+    Polls mailboxes due by polling scheduler. Ticks may overlap: slow mailboxes don't delay the next due ones, while
+    mailbox being polled isn't due again until its poll is reported.
+    :param limiter: shared by all ticks.
+    :param skipped_emails_ids: Email db ids that aren't polled. E.g. watched in IMAP IDLE mode: their updates are pushed.
+    """
+
+    polled_emails = list()
+    for user_email in polling_scheduler.pop_due():
+        if user_email.email_db_id in skipped_emails_ids:
+            polling_scheduler.report_skipped(user_email.email_db_id)
+        else:
+            polled_emails.append(user_email)
+
+    await asyncio.gather(
+        *(_fetch_mailbox(user_email=user_email, jetstream=jetstream, imap_pool=imap_pool, limiter=limiter,
+                         polling_scheduler=polling_scheduler, checkpoint_writer=checkpoint_writer)
+          for user_email in polled_emails)
+    )
+
+
+async def _fetch_mailbox(user_email: UserEmailDTO, jetstream: JetStreamContext, imap_pool: IMAPConnectionPool,
+                         limiter: IMAPSessionsLimiter, polling_scheduler: PollingScheduler,
+                         checkpoint_writer: CheckpointWriter) -> None:
+    fetched_email = None
+    async with limiter.acquire(service_id=user_email.mail_server):
+        try:
+            fetched_email = await asyncio.wait_for(
+                _fetch_pooled_mailbox(user_email=user_email, jetstream=jetstream, imap_pool=imap_pool),
+                timeout=settings.FETCHING_MAILBOX_TIMEOUT_SEC
             )
+        except asyncio.TimeoutError:
+            logging.warning(f"Fetching timeout exceeded for email {user_email.email_db_id}")
+        except Exception as e:
+            logging.error(e)
+
+    polling_scheduler.report_polled(email_db_id=user_email.email_db_id, fetched_email=fetched_email)
+    # Update last "handled" email-id. "Handled" means: "added to nats queue". Saved by the next flush
+    if fetched_email and fetched_email is not user_email:
+        checkpoint_writer.add(fetched_email.to_checkpoint())
+
 
+async def _fetch_pooled_mailbox(user_email: UserEmailDTO, jetstream: JetStreamContext,
+                                imap_pool: IMAPConnectionPool) -> UserEmailDTO | None:
+    """
+    : Returns mailbox with new last handled email id (the same mailbox if nothing changed), None if it's unreachable.
+    Raises PublishError if new emails weren't published: the poll is failed, not empty
+    """
+    async with imap_pool.borrow(user_email=user_email) as client:
+        if not client:
+            return None
+        fetched_email = await publish_not_sent_emails(user_email=user_email, jetstream=jetstream, client=client)
+        return fetched_email or user_email
+
+
+async def publish_not_sent_emails(user_email: UserEmailDTO, jetstream: JetStreamContext,
+                                  client: aioimaplib.IMAP4_SSL) -> UserEmailDTO | None:
+    """
+    Publishes to nats queue UIDs of emails that weren't handled yet.
+    :param client: connected IMAP session with selected inbox.
+    :return: email with new last handled email id & UIDVALIDITY, or None if they didn't change.
+    :raises PublishError: if none of new emails was published, e.g. nats is unreachable.
+    """
 
-async def _get_not_sent_email_ids(user_email: UserEmailDTO) -> list[int] | list[None]:
     with IncomingAttachmentsDirectory(user_id=user_email.user_id) as cache_dir:
         async with BroadcastMailbox(
                 cache_dir=cache_dir,
                 email_address=user_email.mail_address,
                 email_service=get_service_by_id(service_id=user_email.mail_server).value,
                 email_auth_key=user_email.mail_auth_key,
-                user_id=user_email.user_id
+                user_id=user_email.user_id,
+                client=client
         ) as mailbox:
-            if mailbox.can_connect():
-                if user_email.last_email_id == 0:  # No sent emails yet. Realize initial Emails fetching
-                    emails_ids = await mailbox.get_initial_emails_ids()
-                else:  # There are already sent emails. Trying it out to fetch new Emails
-                    emails_ids = await mailbox.get_not_sent_emails_ids(last_email_id=user_email.last_email_id)
-                return emails_ids or []
-    return []
+            mailbox_status = await mailbox.get_status()
+            if _is_unchanged(user_email=user_email, mailbox_status=mailbox_status):
+                return None
+            if user_email.last_email_id == 0:  # No sent emails yet. Realize initial Emails fetching
+                not_sent_email_ids = await mailbox.get_initial_emails_ids(messages_count=mailbox_status.messages_count)
+            elif user_email.uid_validity != mailbox_status.uid_validity:
+                # Inbox was recreated or last email id was saved as sequence number: stored id is meaningless.
+                # Nothing is published, handling continues after the current last email.
+                last_email_id = await mailbox.get_last_email_id()
+                return replace(user_email, last_email_id=last_email_id or 0, uid_validity=mailbox_status.uid_validity,
+                               highest_modseq=mailbox_status.highest_modseq)
+            else:  # There are already sent emails. Trying it out to fetch new Emails
+                not_sent_email_ids = await mailbox.get_not_sent_emails_ids(last_email_id=user_email.last_email_id)
+
+    if not not_sent_email_ids:
+        if user_email.highest_modseq == mailbox_status.highest_modseq:
+            return None
+        # Only flags changed. Saved HIGHESTMODSEQ lets the next poll skip searching
+        return replace(user_email, highest_modseq=mailbox_status.highest_modseq)
+
+    acks = await publish_messages(jetstream=jetstream, messages=[
+        OutgoingMessage(
+            subject=get_partition_subject(subject=consts.EMAILS_SUBJECT, email_db_id=user_email.email_db_id,
+                                          partitions_count=settings.DOWNLOADERS_COUNT),
+            payload=ormsgpack.packb(
+                IncomingEmailMessageDTO(
+                    forum_id=user_email.forum_id,
+                    mailbox_email_id=email_id,
+                    email_db_id=user_email.email_db_id,
+                    user_id=user_email.user_id,
+                    uid_validity=mailbox_status.uid_validity
+                )
+            ),
+            msg_id=f"{user_email.email_db_id}.{mailbox_status.uid_validity}.{email_id}"
+        ) for email_id in not_sent_email_ids
+    ])
+    # Progress moves only over acknowledged ids: not published ones are found again by the next poll
+    acked_emails = takewhile(lambda item: item[1] is not None, zip(not_sent_email_ids, acks))
+    published_emails_ids = [email_id for email_id, _ in acked_emails]
+    if not published_emails_ids:
+        raise PublishError(f"New emails of email {user_email.email_db_id} weren't published")
+    if len(published_emails_ids) < len(not_sent_email_ids):  # Old HIGHESTMODSEQ keeps the next poll from skipping
+        return replace(user_email, last_email_id=max(published_emails_ids), uid_validity=mailbox_status.uid_validity)
+    return replace(user_email, last_email_id=max(published_emails_ids), uid_validity=mailbox_status.uid_validity,
+                   highest_modseq=mailbox_status.highest_modseq)
+
+
+def _is_unchanged(user_email: UserEmailDTO, mailbox_status: MailboxStatus) -> bool:
+    """: Returns True if there are definitely no new emails since the last poll, so searching can be skipped"""
+    if not user_email.last_email_id or user_email.uid_validity != mailbox_status.uid_validity:
+        return False
+    if mailbox_status.highest_modseq is not None and mailbox_status.highest_modseq == user_email.highest_modseq:
+        return True
+    # No CONDSTORE or mailbox was modified: UIDs are ascending, so next UID tells if anything was added
+    return mailbox_status.uid_next is not None and mailbox_status.uid_next - 1 <= user_email.last_email_id
@@ -0,0 +1,19 @@
+from __future__ import annotations
+
+
+def get_partition_subject(subject: str, email_db_id: int | None, partitions_count: int) -> str:
+    """
+    : Returns `<subject>.<partition>` subject of mailbox. All messages of one mailbox go to one partition, so they
+    are handled in order, while different partitions are handled in parallel.
+    """
+
+    return f"{subject}.{(email_db_id or 0) % partitions_count}"
+
+
+def get_partitions_subjects(subject: str, partitions_count: int) -> list[str]:
+    return [f"{subject}.{partition}" for partition in range(partitions_count)]
+
+
+def get_partition_durable(durable: str, partition_subject: str) -> str:
+    """: Returns durable consumer name of partition: `downloader_3` for `email.3`"""
+    return f"{durable}_{partition_subject.rsplit('.', 1)[-1]}"
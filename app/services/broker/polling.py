@@ -0,0 +1,129 @@
+from __future__ import annotations
+
+import heapq
+import random
+import time
+from dataclasses import dataclass
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.dtos.email import UserEmailDTO
+from app.services.broker.checkpoints import merge_progress
+from app.services.broker.shards import Shard, ShardMembership
+from app.services.database.dao.email import EmailDAO
+from app.settings import settings
+
+
+@dataclass(slots=True)
+class _MailboxSchedule:
+    email: UserEmailDTO  # With last handled email id known to this process
+    due_at: float  # time.monotonic() of the next poll
+    polled_at: float | None = None  # Last successful poll
+    arrival_rate: float | None = None  # EWMA of emails per second. None until two polls are done
+    failures_count: int = 0  # Failed polls in a row
+    is_polled: bool = False  # Mailbox is out of the queue until its poll is reported
+
+
+class PollingScheduler:
+    """
+    Decides when to poll every mailbox. Interval follows mailbox's arrival rate estimate (EWMA of new UIDs per second):
+    busy inboxes are polled often, quiet ones rarely, within POLLING_MIN/MAX_SEC_INTERVAL. Failing mailboxes back off
+    exponentially. Mailboxes are kept in a heap by next poll time, so polling tick touches only due ones.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, shard_membership: ShardMembership | None = None) -> None:
+        """
+        :param shard_membership: only mailboxes of process's current shard are scheduled. All mailboxes if it isn't given.
+        """
+
+        self._session_pool = session_pool
+        self._shard_membership = shard_membership
+        self._schedules: dict[int, _MailboxSchedule] = dict()
+        self._queue: list[tuple[float, int]] = list()  # Next poll time & Email db id. Outdated entries are skipped
+
+    async def sync(self) -> None:
+        """Schedules new mailboxes with forums, drops removed ones & ones of other shards"""
+        shard = self._shard_membership.shard if self._shard_membership else Shard()
+        schedules = dict()
+        async with self._session_pool() as session:
+            async for user_email in EmailDAO(session).iter_emails_with_forums(shard_index=shard.index,
+                                                                              shards_count=shard.count):
+                schedule = self._schedules.get(user_email.email_db_id)
+                if schedule:
+                    schedule.email = merge_progress(stored_email=user_email, handled_email=schedule.email)
+                else:  # New mailboxes' first polls are spread over the minimal interval
+                    schedule = _MailboxSchedule(
+                        email=user_email,
+                        due_at=time.monotonic() + random.uniform(0, settings.POLLING_MIN_SEC_INTERVAL)
+                    )
+                    heapq.heappush(self._queue, (schedule.due_at, user_email.email_db_id))
+                schedules[user_email.email_db_id] = schedule
+        self._schedules = schedules
+
+    def pop_due(self) -> list[UserEmailDTO]:
+        """: Returns mailboxes to poll now. Each one must be reported with report_polled() or report_skipped()"""
+        now = time.monotonic()
+        due_emails = list()
+        while self._queue and self._queue[0][0] <= now:
+            due_at, email_db_id = heapq.heappop(self._queue)
+            schedule = self._schedules.get(email_db_id)
+            if not schedule or schedule.due_at != due_at or schedule.is_polled:  # Removed or rescheduled
+                continue
+            schedule.is_polled = True
+            due_emails.append(schedule.email)
+        return due_emails
+
+    def report_polled(self, email_db_id: int, fetched_email: UserEmailDTO | None) -> None:
+        """
+        :param fetched_email: mailbox with last handled email id after the poll, None if poll failed
+        """
+
+        schedule = self._schedules.get(email_db_id)
+        if not schedule:  # Removed while polled
+            return
+
+        now = time.monotonic()
+        if not fetched_email:
+            schedule.failures_count += 1
+            interval = min(settings.POLLING_MIN_SEC_INTERVAL * 2 ** schedule.failures_count,
+                           settings.POLLING_MAX_BACKOFF_SEC)
+        else:
+            schedule.failures_count = 0
+            self._update_arrival_rate(schedule=schedule, fetched_email=fetched_email, now=now)
+            schedule.email = fetched_email
+            schedule.polled_at = now
+            interval = _get_interval(schedule.arrival_rate)
+        self._reschedule(schedule=schedule, due_at=now + interval)
+
+    def report_skipped(self, email_db_id: int) -> None:
+        """Mailbox wasn't polled, e.g. it's watched with IDLE. It's checked again after the minimal interval"""
+        schedule = self._schedules.get(email_db_id)
+        if schedule:
+            self._reschedule(schedule=schedule, due_at=time.monotonic() + settings.POLLING_MIN_SEC_INTERVAL)
+
+    def _reschedule(self, schedule: _MailboxSchedule, due_at: float) -> None:
+        schedule.due_at = due_at
+        schedule.is_polled = False
+        heapq.heappush(self._queue, (due_at, schedule.email.email_db_id))
+
+    @staticmethod
+    def _update_arrival_rate(schedule: _MailboxSchedule, fetched_email: UserEmailDTO, now: float) -> None:
+        # UIDs are assigned in ascending order on arrival: their growth counts emails arrived since the last poll
+        if schedule.polled_at is None or fetched_email.uid_validity != schedule.email.uid_validity:
+            return
+        arrived_count = max(fetched_email.last_email_id - schedule.email.last_email_id, 0)
+        rate = arrived_count / max(now - schedule.polled_at, 1)
+        if schedule.arrival_rate is None:
+            schedule.arrival_rate = rate
+        else:
+            schedule.arrival_rate += settings.POLLING_RATE_SMOOTHING * (rate - schedule.arrival_rate)
+
+
+def _get_interval(arrival_rate: float | None) -> float:
+    """: Returns interval expected to bring POLLING_EXPECTED_EMAILS_PER_POLL new emails, within bounds"""
+    if arrival_rate is None:  # Rate isn't estimated yet
+        return settings.POLLING_MIN_SEC_INTERVAL
+    if not arrival_rate:
+        return settings.POLLING_MAX_SEC_INTERVAL
+    interval = settings.POLLING_EXPECTED_EMAILS_PER_POLL / arrival_rate
+    return min(max(interval, settings.POLLING_MIN_SEC_INTERVAL), settings.POLLING_MAX_SEC_INTERVAL)
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Sequence
+
+from nats.js import JetStreamContext
+from nats.js.api import PubAck
+
+from app.settings import settings
+
+_MSG_ID_HEADER = "Nats-Msg-Id"
+
+
+@dataclass(frozen=True)
+class OutgoingMessage:
+    subject: str
+    payload: bytes
+    msg_id: str  # Stream drops messages with already seen id within its duplicates window
+
+
+async def publish_messages(jetstream: JetStreamContext, messages: Sequence[OutgoingMessage],
+                           max_pending_acks: int = settings.PUBLISH_MAX_PENDING_ACKS) -> list[PubAck | None]:
+    """
+    Pipelines publishes: up to max_pending_acks messages wait for PubAck at once instead of one round trip each.
+    Republished message (e.g. after crash before progress was saved) is deduplicated by stream.
+    :return: acknowledgement of every message (None if it wasn't published), in messages order. Acknowledgement of
+    deduplicated message is marked as duplicate.
+    """
+
+    pending_acks = asyncio.Semaphore(max_pending_acks)
+
+    async def publish(message: OutgoingMessage) -> PubAck | None:
+        async with pending_acks:
+            try:
+                return await jetstream.publish(subject=message.subject, payload=message.payload,
+                                               headers={_MSG_ID_HEADER: message.msg_id})
+            except Exception as e:
+                logging.error(f"Message {message.msg_id} wasn't published: {e}")
+                return None
+
+    return list(await asyncio.gather(*(publish(message) for message in messages)))
@@ -0,0 +1,58 @@
+from __future__ import annotations
+
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import timedelta
+
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.services.database.dao.fetcher_worker import FetcherWorkerDAO
+from app.settings import settings
+
+
+@dataclass(frozen=True)
+class Shard:
+    """Mailboxes owned by fetcher process: Email db id mod count equals index"""
+    index: int = 0
+    count: int = 1
+
+    def owns(self, email_db_id: int) -> bool:
+        return email_db_id % self.count == self.index
+
+
+class ShardMembership:
+    """
+    Membership of fetcher process in group of sharded fetchers. Alive processes heartbeat to database, every one
+    takes its shard by position of its id among alive ones. Shards are rebalanced by the next heartbeats when
+    processes join or leave (die). Mailboxes polled twice while shards change are deduplicated by JetStream.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker) -> None:
+        self._session_pool = session_pool
+        self._worker_id = uuid.uuid4().hex
+        self._shard = Shard()
+
+    @property
+    def shard(self) -> Shard:
+        return self._shard
+
+    async def heartbeat(self) -> None:
+        try:
+            async with self._session_pool() as session:
+                workers_ids = await FetcherWorkerDAO(session).heartbeat(
+                    worker_id=self._worker_id, ttl=timedelta(seconds=settings.SHARD_WORKER_TTL_SEC)
+                )
+        except Exception as e:  # Shard is kept until database is back
+            logging.error(f"Fetcher {self._worker_id} heartbeat failed: {e}")
+            return
+
+        shard = Shard(index=workers_ids.index(self._worker_id), count=len(workers_ids))
+        if shard != self._shard:
+            logging.warning(f"Fetcher {self._worker_id} took shard {shard.index} of {shard.count}")
+            self._shard = shard
+
+    async def leave(self) -> None:
+        """Lets other processes take this shard with their next heartbeats"""
+        async with self._session_pool() as session:
+            await FetcherWorkerDAO(session).remove_worker(self._worker_id)
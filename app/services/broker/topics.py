@@ -0,0 +1,95 @@
+from __future__ import annotations
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import suppress
+from dataclasses import dataclass, field
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.dtos.topic import TopicDTO
+from app.services.database.dao.topic import TopicDAO
+from app.settings import settings
+
+
+@dataclass(slots=True)
+class _CreationLock:
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users_count: int = 0  # Coroutines holding or waiting for the lock. It's dropped when nobody uses it
+
+
+class TopicsCache:
+    """
+    Forums' topics by sender address, in front of TopicDAO. Senders usually already have topics, so most emails
+    don't touch the database. Topic creation is serialized per (forum, sender): concurrent emails of a new sender
+    create one Telegram topic.
+    """
+
+    def __init__(self, max_size: int = settings.TOPICS_CACHE_MAX_SIZE,
+                 ttl: float = settings.TOPICS_CACHE_TTL_SEC) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        self._topics: OrderedDict[tuple[int, str], tuple[TopicDTO, float]] = OrderedDict()  # Topic & expiration
+        self._creation_locks: dict[tuple[int, str], _CreationLock] = dict()
+
+    async def get_or_create_topic(self, bot: Bot, session: AsyncSession, forum_id: int, email_address: str) -> TopicDTO:
+        """: Returns topic of sender in forum. Creates it in Telegram if there is none"""
+        key = (forum_id, email_address)
+        topic = self._get(key)
+        if topic:
+            return topic
+
+        creation_lock = self._creation_locks.setdefault(key, _CreationLock())
+        creation_lock.users_count += 1
+        try:
+            async with creation_lock.lock:
+                topic = self._get(key)  # Cached while waiting for the lock
+                if topic:
+                    return topic
+
+                topic_dao = TopicDAO(session)
+                topic = await topic_dao.get_topic(forum_id=forum_id, email_address=email_address)
+                if not topic:
+                    topic = await _create_topic(bot=bot, topic_dao=topic_dao, forum_id=forum_id,
+                                                email_address=email_address)
+                self._put(key, topic)
+                return topic
+        finally:
+            creation_lock.users_count -= 1
+            if not creation_lock.users_count:
+                self._creation_locks.pop(key, None)
+
+    def _get(self, key: tuple[int, str]) -> TopicDTO | None:
+        cached_topic = self._topics.get(key)
+        if not cached_topic:
+            return None
+        topic, expires_at = cached_topic
+        if expires_at < time.monotonic():
+            del self._topics[key]
+            return None
+        self._topics.move_to_end(key)
+        return topic
+
+    def _put(self, key: tuple[int, str], topic: TopicDTO) -> None:
+        self._topics[key] = (topic, time.monotonic() + self._ttl)
+        self._topics.move_to_end(key)
+        while len(self._topics) > self._max_size:
+            self._topics.popitem(last=False)
+
+
+async def _create_topic(bot: Bot, topic_dao: TopicDAO, forum_id: int, email_address: str) -> TopicDTO:
+    new_topic = await bot.create_forum_topic(chat_id=forum_id, name=email_address)
+    topic = await topic_dao.get_or_create_topic(
+        TopicDTO(
+            forum_id=forum_id,
+            topic_id=new_topic.message_thread_id,
+            topic_name=email_address
+        )
+    )
+    if topic.topic_id != new_topic.message_thread_id:  # Another app instance created sender's topic first
+        with suppress(TelegramBadRequest):
+            await bot.delete_forum_topic(chat_id=forum_id, message_thread_id=new_topic.message_thread_id)
+    return topic
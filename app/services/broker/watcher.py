@@ -0,0 +1,187 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import random
+from contextlib import suppress
+
+from aioimaplib import aioimaplib
+from nats.js import JetStreamContext
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app.dtos.email import UserEmailDTO
+from app.services.broker.checkpoints import CheckpointWriter, merge_progress
+from app.services.broker.fetcher import publish_not_sent_emails
+from app.services.broker.shards import Shard, ShardMembership
+from app.services.database.dao.email import EmailDAO
+from app.services.email.base.entities import EmailConnectionType, get_service_by_id
+from app.services.email.imap.fetcher.base import connect
+from app.services.email.imap.pool import IMAPConnectionPool
+from app.settings import settings
+
+_IDLE_CAPABILITY = "IDLE"
+_EXISTS_RESPONSE = b"EXISTS"
+
+
+class IdleWatcher:
+    """
+    Watches mailboxes with IMAP IDLE: one supervised task with dedicated IMAP session per mailbox. New emails are
+    published to nats queue as soon as server pushes EXISTS. Mailboxes of servers without IDLE capability,
+    mailboxes with broken IDLE session and ones above IDLE share of sessions limits are left to interval polling.
+    """
+
+    def __init__(self, session_pool: async_sessionmaker, jetstream: JetStreamContext, imap_pool: IMAPConnectionPool,
+                 checkpoint_writer: CheckpointWriter, shard_membership: ShardMembership | None = None) -> None:
+        """
+        :param imap_pool: IDLE sessions hold its slots: they count against the same sessions limits.
+        :param shard_membership: only mailboxes of process's current shard are watched. All mailboxes if it isn't given.
+        """
+
+        self._session_pool = session_pool
+        self._jetstream = jetstream
+        self._imap_pool = imap_pool
+        self._checkpoint_writer = checkpoint_writer
+        self._shard_membership = shard_membership
+        self._tasks: dict[int, asyncio.Task] = dict()
+        self._emails: dict[int, UserEmailDTO] = dict()  # Watched mailboxes with last handled email id. Reloaded per session
+        self._watched_emails_ids: set[int] = set()
+        self._idle_unsupported_emails_ids: set[int] = set()
+
+    @property
+    def watched_emails_ids(self) -> set[int]:
+        """: Returns live set of Email db ids with established IDLE session. These mailboxes needn't be polled"""
+        return self._watched_emails_ids
+
+    async def sync(self) -> None:
+        """
+        Starts watching new mailboxes with forums, stops watching removed ones & ones of other shards.
+        New sessions are spread over IDLE_START_SPREAD_SEC instead of connecting all at once.
+        """
+
+        shard = self._shard_membership.shard if self._shard_membership else Shard()
+        async with self._session_pool() as session:
+            actual_emails_ids = {user_email.email_db_id async for user_email in EmailDAO(session).iter_emails_with_forums(
+                shard_index=shard.index, shards_count=shard.count
+            )}
+
+        for email_db_id in set(self._tasks) - actual_emails_ids:
+            self._tasks.pop(email_db_id).cancel()
+            self._emails.pop(email_db_id, None)
+            self._watched_emails_ids.discard(email_db_id)
+
+        for email_db_id in actual_emails_ids:
+            if email_db_id in self._tasks or email_db_id in self._idle_unsupported_emails_ids:
+                continue
+            self._tasks[email_db_id] = asyncio.create_task(self._supervise(
+                email_db_id=email_db_id, start_delay=random.uniform(0, settings.IDLE_START_SPREAD_SEC)
+            ))
+
+    async def close(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+        self._emails.clear()
+        self._watched_emails_ids.clear()
+
+    async def _supervise(self, email_db_id: int, start_delay: float) -> None:
+        """Restarts failed IDLE session with exponential backoff. Polling covers mailbox meanwhile"""
+        await asyncio.sleep(start_delay)
+        backoff = settings.IMAP_RECONNECT_BACKOFF_SEC
+        while True:
+            try:
+                if not await self._watch(email_db_id):  # IDLE isn't supported: mailbox is polled
+                    self._tasks.pop(email_db_id, None)
+                    self._emails.pop(email_db_id, None)
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.warning(f"IDLE session of email {email_db_id} failed: {e}")
+            finally:
+                was_watched = email_db_id in self._watched_emails_ids
+                self._watched_emails_ids.discard(email_db_id)
+
+            if was_watched:
+                backoff = settings.IMAP_RECONNECT_BACKOFF_SEC
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, settings.IDLE_RESTART_MAX_BACKOFF_SEC)
+
+    async def _watch(self, email_db_id: int) -> bool:
+        """
+        Runs IDLE session in slot of pool's sessions limits until connection breaks.
+        :return: False if server doesn't support IDLE.
+        """
+
+        user_email = await self._reload_email(email_db_id)
+        if not user_email:  # Removed or forum was unset: watching is stopped by the next sync
+            return True
+        async with self._imap_pool.reserve_dedicated_slot(service_id=user_email.mail_server) as reserved:
+            if not reserved:  # IDLE share of sessions limits is taken: mailbox is polled until a slot is free
+                return True
+            client = await connect(
+                email_service=get_service_by_id(service_id=user_email.mail_server).value,
+                email_address=user_email.mail_address,
+                email_auth_key=user_email.mail_auth_key,
+                attempts_count=settings.EMAIL_CONNECTIONS_ATTEMPTS_COUNT
+            )
+            if not client:
+                return True
+            try:
+                return await self._idle(email_db_id=email_db_id, client=client)
+            finally:
+                with suppress(Exception):
+                    await asyncio.wait_for(client.logout(), timeout=settings.FETCHING_MAILBOX_TIMEOUT_SEC)
+
+    async def _idle(self, email_db_id: int, client: aioimaplib.IMAP4_SSL) -> bool:
+        """: Returns False if server doesn't support IDLE. Otherwise watches inbox until connection breaks"""
+        if client.get_state() != EmailConnectionType.SELECTED:
+            return True
+        if not client.has_capability(_IDLE_CAPABILITY):
+            self._idle_unsupported_emails_ids.add(email_db_id)
+            return False
+
+        self._watched_emails_ids.add(email_db_id)
+        # Emails could arrive between last poll and IDLE start
+        await self._publish_not_sent_emails(email_db_id=email_db_id, client=client)
+        while True:
+            idle = await client.idle_start(timeout=settings.IDLE_RENEW_SEC)
+            server_push = await client.wait_server_push()
+            if client.has_pending_idle():
+                client.idle_done()
+            await asyncio.wait_for(idle, timeout=settings.FETCHING_MAILBOX_TIMEOUT_SEC)
+
+            if _has_new_emails(server_push):
+                await self._publish_not_sent_emails(email_db_id=email_db_id, client=client)
+
+    async def _reload_email(self, email_db_id: int) -> UserEmailDTO | None:
+        """
+        : Returns mailbox from database with the latest of saved & handled progress. Saved progress could be moved by
+        polling while IDLE session was down, and credentials could be changed
+        """
+        async with self._session_pool() as session:
+            stored_email = await EmailDAO(session).get_email_with_forum(email_db_id)
+        if not stored_email:
+            return None
+
+        handled_email = self._emails.get(email_db_id)
+        user_email = merge_progress(stored_email=stored_email, handled_email=handled_email) if handled_email \
+            else stored_email
+        self._emails[email_db_id] = user_email
+        return user_email
+
+    async def _publish_not_sent_emails(self, email_db_id: int, client: aioimaplib.IMAP4_SSL) -> None:
+        fetched_email = await publish_not_sent_emails(
+            user_email=self._emails[email_db_id], jetstream=self._jetstream, client=client
+        )
+        if not fetched_email:
+            return
+
+        self._checkpoint_writer.add(fetched_email.to_checkpoint())
+        self._emails[email_db_id] = fetched_email
+
+
+def _has_new_emails(server_push: list | str) -> bool:
+    if not isinstance(server_push, list):
+        return False
+    return any(isinstance(line, bytes) and line.endswith(_EXISTS_RESPONSE) for line in server_push)
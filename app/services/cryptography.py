@@ -1,17 +1,75 @@
+import time
+from collections import OrderedDict
+
 from cryptography.fernet import Fernet
 
+from app.settings import settings
 from app.settings.config import FERNET_KEY
 
 _ENCODING = "utf-8"
+_FERNET = Fernet(FERNET_KEY)  # Reusable: derives signing & encryption keys once
 
 
 def encrypt_key(email_key: str) -> str:
-    f = Fernet(FERNET_KEY)
-    encrypted_bytes = f.encrypt(bytes(email_key, _ENCODING))
+    encrypted_bytes = _FERNET.encrypt(bytes(email_key, _ENCODING))
     return encrypted_bytes.decode(_ENCODING)
 
 
 def decrypt_key(code: str) -> str:
-    f = Fernet(FERNET_KEY)
-    decrypted_bytes = f.decrypt(bytes(code, _ENCODING))
+    decrypted_bytes = _FERNET.decrypt(bytes(code, _ENCODING))
     return decrypted_bytes.decode(_ENCODING)
+
+
+class _DecryptedKeysCache:
+    """
+    Decrypted mailboxes' keys by Email db id: mailboxes are converted to DTOs on every poll, but keys rarely change.
+    Entry is valid only for the encrypted key it was decrypted from. Evicted keys are overwritten with zeros
+    (python strings made from them can't be).
+    """
+
+    def __init__(self, max_size: int = settings.CREDENTIALS_CACHE_MAX_SIZE,
+                 ttl: float = settings.CREDENTIALS_CACHE_TTL_SEC) -> None:
+        self._max_size = max_size
+        self._ttl = ttl
+        # Encrypted key, decrypted key & expiration. Ordered by expiration: entries aren't moved on access
+        self._keys: OrderedDict[int, tuple[str, bytearray, float]] = OrderedDict()
+
+    def decrypt(self, email_db_id: int, code: str) -> str:
+        self._remove_expired()
+        cached_key = self._keys.get(email_db_id)
+        if cached_key and cached_key[0] == code:
+            return cached_key[1].decode(_ENCODING)
+
+        self.forget(email_db_id)
+        decrypted_key = bytearray(_FERNET.decrypt(bytes(code, _ENCODING)))
+        self._keys[email_db_id] = (code, decrypted_key, time.monotonic() + self._ttl)
+        while len(self._keys) > self._max_size:
+            self.forget(next(iter(self._keys)))
+        return decrypted_key.decode(_ENCODING)
+
+    def forget(self, email_db_id: int) -> None:
+        cached_key = self._keys.pop(email_db_id, None)
+        if cached_key:
+            _, decrypted_key, _ = cached_key
+            decrypted_key[:] = bytes(len(decrypted_key))
+
+    def _remove_expired(self) -> None:
+        now = time.monotonic()
+        while self._keys:
+            email_db_id, (_, _, expires_at) = next(iter(self._keys.items()))
+            if expires_at > now:
+                return
+            self.forget(email_db_id)
+
+
+_decrypted_keys = _DecryptedKeysCache()
+
+
+def decrypt_email_key(email_db_id: int, code: str) -> str:
+    """: Returns decrypted key of mailbox. Decrypts it only if it isn't cached or changed"""
+    return _decrypted_keys.decrypt(email_db_id=email_db_id, code=code)
+
+
+def forget_email_key(email_db_id: int) -> None:
+    """Drops cached decrypted key of mailbox, e.g. removed one"""
+    _decrypted_keys.forget(email_db_id)
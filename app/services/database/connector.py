@@ -1,11 +1,9 @@
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 
-from app.services.database.base import BASE
-
 
 async def setup_get_pool(db_uri: str) -> async_sessionmaker:
     """
-    Setup postgres database, creates tables if not exists. Connect to database.
+    Connect to postgres database. Schema is managed by alembic migrations: `alembic upgrade head`.
     :param db_uri: postgres dsn
     :return sessionmaker: provides to bot instance to manage sessions.
     """
@@ -14,8 +12,6 @@ async def setup_get_pool(db_uri: str) -> async_sessionmaker:
         db_uri,
         future=True
     )
-    async with engine.begin() as conn:
-        await conn.run_sync(BASE.metadata.create_all)
 
     sessionmaker_ = async_sessionmaker(engine, expire_on_commit=False, future=True)
     return sessionmaker_
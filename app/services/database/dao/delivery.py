@@ -0,0 +1,61 @@
+from __future__ import annotations
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, Mapping
+
+from sqlalchemy import select, delete, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.database.dao.base import BaseDAO
+from app.services.database.exception_mapper import exception_mapper
+from app.services.database.models import DeliveredEmail
+
+
+class DeliveredEmailDAO(BaseDAO[DeliveredEmail]):
+
+    def __init__(self, session: AsyncSession):
+        super().__init__(DeliveredEmail, session)
+
+    @exception_mapper
+    async def get_delivered_emails(self, emails: Iterable[tuple[int, int, int, bool]]
+                                   ) -> dict[tuple[int, int, int, bool], int | None]:
+        """
+        :param emails: keys of emails: mailbox id (emails.id), UIDVALIDITY, email_id (IMAP UID) & whether it's
+        attachments follow-up of email text
+        :return: first Telegram message ids of given emails which are already delivered, by their keys
+        """
+
+        emails = list(emails)
+        if not emails:
+            return dict()
+        key_columns = (DeliveredEmail.email_db_id, DeliveredEmail.uid_validity, DeliveredEmail.mailbox_email_id,
+                       DeliveredEmail.is_attachments)
+        result = await self._session.execute(
+            select(*key_columns, DeliveredEmail.message_id).where(tuple_(*key_columns).in_(emails))
+        )
+        return {(email_db_id, uid_validity, mailbox_email_id, is_attachments): message_id
+                for email_db_id, uid_validity, mailbox_email_id, is_attachments, message_id in result}
+
+    @exception_mapper
+    async def add_delivered_emails(self, emails: Mapping[tuple[int, int, int, bool], int | None]) -> None:
+        """
+        Adds emails to the ledger with one INSERT & commit per batch.
+        :param emails: first Telegram message ids of emails by their keys: mailbox id (emails.id), UIDVALIDITY,
+        email_id (IMAP UID) & whether it's attachments follow-up of email text
+        """
+
+        rows = [dict(email_db_id=email_db_id, uid_validity=uid_validity, mailbox_email_id=mailbox_email_id,
+                     is_attachments=is_attachments, message_id=message_id)
+                for (email_db_id, uid_validity, mailbox_email_id, is_attachments), message_id in emails.items()]
+        if not rows:
+            return
+        await self._session.execute(insert(DeliveredEmail).values(rows).on_conflict_do_nothing())
+        await self.commit()
+
+    @exception_mapper
+    async def remove_expired(self, retention: timedelta) -> None:
+        await self._session.execute(
+            delete(DeliveredEmail).where(DeliveredEmail.delivered_date < datetime.now(tz=timezone.utc) - retention)
+        )
+        await self.commit()
@@ -1,14 +1,24 @@
 from __future__ import annotations
 
-from sqlalchemy import update, select, delete, func
-from sqlalchemy.exc import NoResultFound
+from typing import AsyncIterator, Iterable
+
+from sqlalchemy import BigInteger, update, select, delete, func, case, cast, column, values
+from sqlalchemy.exc import NoResultFound, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dtos import converters
-from app.dtos.email import UserEmailDTO
+from app.dtos.email import MailboxCheckpointDTO, UserEmailDTO
+from app.exceptions import DaoError
+from app.services import cryptography
 from app.services.database.dao.base import BaseDAO
 from app.services.database.exception_mapper import exception_mapper
 from app.services.database.models import Email
+from app.settings import settings
+
+
+# Columns of UserEmailDTO: scanned mailboxes aren't loaded as ORM objects
+_EMAIL_COLUMNS = (Email.id, Email.user_id, Email.forum_id, Email.mail_server, Email.mail_address, Email.mail_auth_key,
+                  Email.last_email_id, Email.uid_validity, Email.highest_modseq)
 
 
 class EmailDAO(BaseDAO[Email]):
@@ -20,6 +30,8 @@ class EmailDAO(BaseDAO[Email]):
     async def add_email(self, email: UserEmailDTO) -> None:
         await self._session.merge(email.to_db_model())
         await self.commit()
+        if email.email_db_id is not None:
+            cryptography.forget_email_key(email.email_db_id)
 
     @exception_mapper
     async def email_already_added(self, email_address: str) -> bool:
@@ -40,13 +52,36 @@ class EmailDAO(BaseDAO[Email]):
 
     @exception_mapper
     async def get_emails_with_forums(self) -> list[UserEmailDTO] | list[None]:
+        result = await self._session.execute(
+            select(*_EMAIL_COLUMNS).where(Email.forum_id.isnot(None))
+        )
+        return [converters.email_row_to_dto(row) for row in result]
+
+    @exception_mapper
+    async def get_email_with_forum(self, email_db_id: int) -> UserEmailDTO | None:
+        result = await self._session.execute(
+            select(*_EMAIL_COLUMNS).where(Email.id == email_db_id, Email.forum_id.isnot(None))
+        )
+        row = result.one_or_none()
+        return converters.email_row_to_dto(row) if row else None
+
+    async def iter_emails_with_forums(self, shard_index: int = 0, shards_count: int = 1,
+                                      batch_size: int = settings.DB_STREAM_BATCH_SIZE) -> AsyncIterator[UserEmailDTO]:
+        """
+        Streams mailboxes with forums by batches with server side cursor: memory doesn't grow with mailboxes count.
+        Session's connection is busy until iteration ends.
+        :param shard_index: only mailboxes with Email db id mod shards_count equal to it are streamed
+        """
+
+        query = select(*_EMAIL_COLUMNS).where(Email.forum_id.isnot(None))
+        if shards_count > 1:
+            query = query.where(Email.id % shards_count == shard_index)
         try:
-            result = await self._session.execute(
-                select(Email).where(Email.forum_id.isnot(None))
-            )
-            return [converters.db_email_to_dto(email) for email in result.scalars()]
-        except NoResultFound:
-            return []
+            result = await self._session.stream(query.execution_options(yield_per=batch_size))
+            async for row in result:
+                yield converters.email_row_to_dto(row)
+        except SQLAlchemyError as err:  # exception_mapper doesn't wrap generators
+            raise DaoError from err
 
     @exception_mapper
     async def get_user_emails(self, user_id: int) -> tuple[UserEmailDTO] | None:
@@ -74,23 +109,36 @@ class EmailDAO(BaseDAO[Email]):
             return None
 
     @exception_mapper
-    async def set_last_sent_email_id(self, user_id: int, email_address: str, last_email_id: int) -> None:
+    async def set_checkpoints(self, checkpoints: Iterable[MailboxCheckpointDTO]) -> None:
+        """
+        Saves handling progress of many mailboxes with one UPDATE ... FROM (VALUES ...). Last email id moves only
+        forward, if UIDVALIDITY is unchanged.
+        """
+
+        rows = [(checkpoint.email_db_id, checkpoint.last_email_id, checkpoint.uid_validity, checkpoint.highest_modseq)
+                for checkpoint in checkpoints]
+        if not rows:
+            return
+        checkpoints = values(
+            column("email_db_id", BigInteger),
+            column("last_email_id", BigInteger),
+            column("uid_validity", BigInteger),
+            column("highest_modseq", BigInteger),
+            name="checkpoints"
+        ).data(rows)
+        # Column of NULLs only has text type in VALUES
+        uid_validity = cast(checkpoints.c.uid_validity, BigInteger)
+        highest_modseq = cast(checkpoints.c.highest_modseq, BigInteger)
+        uid_validity_changed = uid_validity.isnot(None) & Email.uid_validity.is_distinct_from(uid_validity)
         await self._session.execute(
-            update(Email).where(
-                Email.user_id == user_id,
-                Email.mail_address == email_address,
-                Email.last_email_id < last_email_id).
-            values(last_email_id=last_email_id)
-        )
-        await self.commit()
-
-    @exception_mapper
-    async def set_last_sent_email_id_by_email_id(self, email_db_id: int, last_email_id: int) -> None:
-        await self._session.execute(
-            update(Email).where(
-                Email.id == email_db_id,
-                Email.last_email_id < last_email_id).
-            values(last_email_id=last_email_id)
+            update(Email).where(Email.id == checkpoints.c.email_db_id).values(
+                last_email_id=case(
+                    (uid_validity_changed, checkpoints.c.last_email_id),
+                    else_=func.greatest(Email.last_email_id, checkpoints.c.last_email_id)
+                ),
+                uid_validity=func.coalesce(uid_validity, Email.uid_validity),
+                highest_modseq=func.coalesce(highest_modseq, Email.highest_modseq)
+            )
         )
         await self.commit()
 
@@ -114,7 +162,10 @@ class EmailDAO(BaseDAO[Email]):
 
     @exception_mapper
     async def remove_email(self, user_id: int, email_address: str) -> None:
-        await self._session.execute(
-            delete(Email).where(Email.user_id == user_id, Email.mail_address == email_address)
+        removed_emails_ids = await self._session.scalars(
+            delete(Email).where(Email.user_id == user_id, Email.mail_address == email_address).returning(Email.id)
         )
+        removed_emails_ids = list(removed_emails_ids)
         await self.commit()
+        for email_db_id in removed_emails_ids:
+            cryptography.forget_email_key(email_db_id)
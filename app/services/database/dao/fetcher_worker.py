@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+from datetime import timedelta
+
+from sqlalchemy import select, delete, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services.database.dao.base import BaseDAO
+from app.services.database.exception_mapper import exception_mapper
+from app.services.database.models import FetcherWorker
+
+
+class FetcherWorkerDAO(BaseDAO[FetcherWorker]):
+
+    def __init__(self, session: AsyncSession):
+        super().__init__(FetcherWorker, session)
+
+    @exception_mapper
+    async def heartbeat(self, worker_id: str, ttl: timedelta) -> list[str]:
+        """
+        Marks worker alive & removes dead ones. Database clock is used: hosts' clocks may differ.
+        :return: sorted ids of alive workers, including given one
+        """
+
+        await self._session.execute(
+            insert(FetcherWorker)
+            .values(id=worker_id, heartbeat_date=func.now())
+            .on_conflict_do_update(index_elements=[FetcherWorker.id], set_=dict(heartbeat_date=func.now()))
+        )
+        await self._session.execute(
+            delete(FetcherWorker).where(FetcherWorker.heartbeat_date < func.now() - ttl)
+        )
+        result = await self._session.execute(
+            select(FetcherWorker.id).order_by(FetcherWorker.id)
+        )
+        workers_ids = list(result.scalars())
+        await self.commit()
+        return workers_ids
+
+    @exception_mapper
+    async def remove_worker(self, worker_id: str) -> None:
+        await self._session.execute(
+            delete(FetcherWorker).where(FetcherWorker.id == worker_id)
+        )
+        await self.commit()
@@ -3,6 +3,7 @@ from __future__ import annotations
 from typing import Iterable
 
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.dtos import converters
@@ -30,11 +31,30 @@ class TopicDAO(BaseDAO[Topic]):
         return bool(response.scalar_one_or_none())
 
     @exception_mapper
-    async def get_topic(self, forum_id: int, email_address: str) -> TopicDTO:
+    async def get_topic(self, forum_id: int, email_address: str) -> TopicDTO | None:
         topic = await self._session.execute(
             select(Topic).where(Topic.forum_id == forum_id, Topic.topic_name == email_address)
         )
-        return converters.db_topic_to_dto(topic.scalar_one())
+        topic = topic.scalar_one_or_none()
+        return converters.db_topic_to_dto(topic) if topic else None
+
+    @exception_mapper
+    async def get_or_create_topic(self, topic: TopicDTO) -> TopicDTO:
+        """
+        Adds topic with one upsert. If forum already has topic with the same name, keeps it.
+        :return: stored topic: given one or already existing
+        """
+
+        stored_topic = await self._session.scalars(
+            insert(Topic)
+            .values(forum_id=topic.forum_id, topic_id=topic.topic_id, topic_name=topic.topic_name)
+            .on_conflict_do_update(index_elements=[Topic.forum_id, Topic.topic_name],
+                                   set_=dict(topic_id=Topic.topic_id))
+            .returning(Topic)
+        )
+        stored_topic = converters.db_topic_to_dto(stored_topic.one())
+        await self.commit()
+        return stored_topic
 
     @exception_mapper
     async def add_topics(self, topics: Iterable[TopicDTO]):
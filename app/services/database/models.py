@@ -1,4 +1,4 @@
-from sqlalchemy import Column, BigInteger, Integer, String, DateTime, func
+from sqlalchemy import Column, BigInteger, Boolean, Integer, String, DateTime, Index, UniqueConstraint, func, text
 
 from app.services.database.base import BASE
 
@@ -22,21 +22,31 @@ class User(BASE):
 
 class Email(BASE):
     __tablename__ = "emails"
+    __table_args__ = (
+        Index("emails_user_id_forum_id_idx", "user_id", "forum_id"),  # User's mailboxes, mailbox by forum
+        Index("emails_forum_id_idx", "forum_id", postgresql_where=text("forum_id IS NOT NULL")),  # Fetched mailboxes
+    )
     id = Column(BigInteger, primary_key=True, unique=True, autoincrement=True)
     user_id = Column(BigInteger)  # User Telegram id
     forum_id = Column(BigInteger, default=None)  # Forum (Telegram chat with emails) id
     mail_server = Column(String)  # Gmail / Yandex / etc.
     mail_address = Column(String, unique=True)  # address@domain
     mail_auth_key = Column(String)  # Generated password. Is encrypted
-    last_email_id = Column(Integer, default=0)  # Last sent email_id. Email_id — id from mailbox
+    last_email_id = Column(BigInteger, default=0)  # Last sent email_id. Email_id — IMAP UID from mailbox
+    uid_validity = Column(BigInteger, default=None)  # IMAP UIDVALIDITY of inbox. last_email_id is valid only with it
+    highest_modseq = Column(BigInteger, default=None)  # CONDSTORE HIGHESTMODSEQ of inbox on last poll
 
     def __repr__(self) -> str:
         return f"Email: {self.id}, {self.user_id}, {self.forum_id}, {self.mail_server} " \
-               f"{self.mail_address}, {self.mail_auth_key}, {self.last_email_id}"
+               f"{self.mail_address}, {self.mail_auth_key}, {self.last_email_id}, {self.uid_validity}, {self.highest_modseq}"
 
 
 class Topic(BASE):
     __tablename__ = "topics"
+    __table_args__ = (
+        # Topic by sender address & forum's topics. Enables get-or-create upsert
+        UniqueConstraint("forum_id", "topic_name", name="topics_forum_id_topic_name_key"),
+    )
     id = Column(BigInteger, primary_key=True, unique=True, autoincrement=True)
     forum_id = Column(BigInteger)  # Forum (Telegram chat with emails) id
     topic_id = Column(Integer)  # Topic id — unique for forum
@@ -45,3 +55,30 @@ class Topic(BASE):
     def __repr__(self) -> str:
         return f"Topic: {self.id}, {self.forum_id}, {self.topic_id} " \
                f"{self.topic_name}"
+
+
+class DeliveredEmail(BASE):
+    """Delivery ledger: emails already sent to forums. Sender checks it, so redelivered messages aren't re-posted"""
+
+    __tablename__ = "delivered_emails"
+    email_db_id = Column(BigInteger, primary_key=True)  # Mailbox id (emails.id)
+    uid_validity = Column(BigInteger, primary_key=True)  # IMAP UIDVALIDITY: UIDs of recreated inbox start over
+    mailbox_email_id = Column(BigInteger, primary_key=True)  # Email_id — IMAP UID from mailbox
+    is_attachments = Column(Boolean, primary_key=True, server_default=text("false"))  # Attachments follow-up of text
+    message_id = Column(BigInteger, default=None)  # First Telegram message of email text. Attachments reply to it
+    delivered_date = Column(DateTime(timezone=True), server_default=func.now(), index=True)  # Rows expire by it
+
+    def __repr__(self) -> str:
+        return f"DeliveredEmail: {self.email_db_id}, {self.uid_validity}, {self.mailbox_email_id}, " \
+               f"{self.is_attachments}, {self.message_id}, {self.delivered_date}"
+
+
+class FetcherWorker(BASE):
+    """Alive fetcher processes (`python -m app.fetcher --shard`). Mailboxes are split between them"""
+
+    __tablename__ = "fetcher_workers"
+    id = Column(String, primary_key=True)  # Random id of process
+    heartbeat_date = Column(DateTime(timezone=True), server_default=func.now())  # Worker is dead if it's too old
+
+    def __repr__(self) -> str:
+        return f"FetcherWorker: {self.id}, {self.heartbeat_date}"
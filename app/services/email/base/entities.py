@@ -17,6 +17,14 @@ class IncomingEmail:
     attachments_paths: tuple[str] | None = None
 
 
+@dataclass(frozen=True)
+class MailboxStatus:
+    uid_validity: int
+    uid_next: int | None  # Servers may omit it
+    messages_count: int
+    highest_modseq: int | None = None  # Only for servers with CONDSTORE capability
+
+
 @dataclass(frozen=True)
 class OutgoingEmail:
     send_to: list[str]
@@ -53,6 +61,7 @@ class EmailFlagPattern(str, Enum):
 class IMAP:
     server: str
     port: int
+    sessions_limit: int = 10  # Max simultaneous sessions we open to this server
 
 
 @dataclass(frozen=True)
@@ -73,19 +82,19 @@ class EmailServers(Enum):
     gmail = EmailService(
         id_="gmail",
         title="Gmail",
-        imap=IMAP(server="imap.gmail.com", port=993),
+        imap=IMAP(server="imap.gmail.com", port=993, sessions_limit=50),
         smtp=SMTP(server="smtp.gmail.com", port=465)
     )
     mail_ru = EmailService(
         id_="vk",
         title="Mail.ru",
-        imap=IMAP(server="imap.mail.ru", port=993),
+        imap=IMAP(server="imap.mail.ru", port=993, sessions_limit=20),
         smtp=SMTP(server="smtp.mail.ru", port=465)
     )
     yandex = EmailService(
         id_="yandex",
         title="Яндекс",
-        imap=IMAP(server="imap.yandex.ru", port=993),
+        imap=IMAP(server="imap.yandex.ru", port=993, sessions_limit=30),
         smtp=SMTP(server="smtp.yandex.ru", port=465)
     )
 
@@ -1,52 +1,181 @@
 from __future__ import annotations
 
+import base64
+import binascii
+import logging
 import os
-import shutil
+import quopri
+import re
+import time
+from contextlib import suppress
+from datetime import timedelta
+from email.errors import HeaderParseError
+from email.header import decode_header, make_header
+from email.message import Message
 from pathlib import PurePath
-
-from mailparser import MailParser
+from typing import BinaryIO, Iterable
 
 from app.settings.paths import ROOT_DIR
+from app.settings.settings import ATTACHMENT_CHUNK_SIZE
+
+_NOT_BASE64_SYMBOLS_PATTERN = re.compile(rb"[^A-Za-z0-9+/=]")
+_CACHE_DIR = PurePath(ROOT_DIR / "app/.income_cache")
+
+
+class AttachmentWriter:
+    """Decodes transfer-encoded (base64 / quoted-printable / raw) attachment chunk by chunk straight to file"""
+
+    def __init__(self, path: str, encoding: str) -> None:
+        self.path = path
+        self._encoding = encoding
+        self._undecoded = b""  # Tail of previous chunk which can't be decoded alone
+        self._file: BinaryIO | None = None
+
+    def __enter__(self) -> AttachmentWriter:
+        self._file = open(self.path, "wb")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self._file.write(self._decode(self._undecoded))
+        self._file.close()
+
+    def write(self, chunk: bytes) -> None:
+        data = self._undecoded + chunk
+        if self._encoding == "base64":
+            data = _NOT_BASE64_SYMBOLS_PATTERN.sub(b"", data)
+            decodable_size = len(data) - len(data) % 4  # base64 is decoded by 4 symbols
+        elif self._encoding == "quoted-printable":
+            decodable_size = data.rfind(b"\n") + 1  # Escape sequences don't cross lines
+        else:
+            decodable_size = len(data)
+        self._undecoded = data[decodable_size:]
+        self._file.write(self._decode(data[:decodable_size]))
+
+    def _decode(self, data: bytes) -> bytes:
+        if not data:
+            return b""
+        if self._encoding == "base64":
+            try:  # Only the tail may lack padding
+                return base64.b64decode(data + b"=" * (-len(data) % 4))
+            except binascii.Error as e:  # Single symbol tail carries no whole byte
+                logging.warning(f"Attachment {self.path} has broken base64 tail {data[-8:]!r}: {e}")
+                return b""
+        if self._encoding == "quoted-printable":
+            return quopri.decodestring(data)
+        return data
 
 
 class IncomingAttachmentsDirectory:
+    """
+    Directory of user's downloaded attachments. Attachments outlive the directory context: they are sent by
+    another pipeline stage, which removes them with remove_attachments. Attachments opened by failed download are
+    removed on exit, unless they were released as published. Ones saved by parsing processes are left to
+    remove_stale_attachments.
+    """
 
     def __init__(self, user_id: int) -> None:
         self._user_id = user_id
+        self._attachments_paths: list[str] = list()  # Opened within the context
 
     def __enter__(self) -> IncomingAttachmentsDirectory:
         self._path = self._build_base_path()
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._remove()
+        if exc_type is not None:
+            remove_attachments(self._attachments_paths)
+        self._attachments_paths = list()
 
-    def save_attachments(self, email: MailParser, email_id: int) -> tuple[str] | None:
-        """: Returns saved attachments paths"""
-        if email.attachments:
-            email.write_attachments(base_path=str(self._build_path(email_id)))
-            return self._get_saved_attachments_paths(email_id)
+    def release_attachments(self) -> None:
+        """Attachments opened so far are handed over to sender stage: they aren't removed on failed exit"""
+        self._attachments_paths = list()
+
+    def save_attachments(self, parts: Iterable[Message], email_id: int) -> tuple[str] | None:
+        """
+        Decodes attachments parts of parsed email straight to files by ATTACHMENT_CHUNK_SIZE chunks: decoded
+        attachment is never held in memory as a whole. This path isn't memory-bounded though: parsed email holds
+        encoded payloads, and not transfer-encoded payload is copied whole. Two-phase fetching downloads attachments
+        by chunks instead.
+        :return: saved attachments paths.
+        """
 
-    def _get_saved_attachments_paths(self, email_id: int) -> tuple[str] | None:
         attachments_paths = list()
+        for part in parts:
+            encoding = str(part.get("Content-Transfer-Encoding", "7bit")).strip().lower()
+            if encoding in ("base64", "quoted-printable"):
+                payload = part.get_payload()
+                chunks = (payload[i:i + ATTACHMENT_CHUNK_SIZE].encode("ascii", errors="ignore")
+                          for i in range(0, len(payload), ATTACHMENT_CHUNK_SIZE))
+            else:
+                payload = part.get_payload(decode=True) or b""
+                chunks = (payload[i:i + ATTACHMENT_CHUNK_SIZE] for i in range(0, len(payload), ATTACHMENT_CHUNK_SIZE))
+
+            with self.open_attachment(email_id=email_id, filename=_get_filename(part) or "attachment",
+                                      encoding=encoding) as writer:
+                for chunk in chunks:
+                    writer.write(chunk)
+            attachments_paths.append(writer.path)
+        return tuple(attachments_paths) if attachments_paths else None
+
+    def open_attachment(self, email_id: int, filename: str, encoding: str) -> AttachmentWriter:
+        """: Returns writer of a new attachment file. Same-named attachments of one email get numeric suffixes"""
         path = self._build_path(email_id)
-        try:
-            for file_name in os.listdir(path):
-                attachments_paths.append(str(path / file_name))
-            if not attachments_paths:
-                return None
-            return tuple(attachments_paths)
-        except FileNotFoundError:
-            return None
-
-    def _remove(self) -> None:
-        shutil.rmtree(self._path, ignore_errors=True)
+        os.makedirs(path, exist_ok=True)
+        name, extension = os.path.splitext(os.path.basename(filename) or "attachment")
+        attachment_path = str(path / f"{name}{extension}")
+        duplicates_count = 0
+        while os.path.exists(attachment_path):
+            duplicates_count += 1
+            attachment_path = str(path / f"{name}_{duplicates_count}{extension}")
+        self._attachments_paths.append(attachment_path)
+        return AttachmentWriter(path=attachment_path, encoding=encoding)
 
     def _build_base_path(self) -> PurePath:
-        cache_dir = PurePath(ROOT_DIR / "app/.income_cache")
-        path = PurePath(cache_dir / str(self._user_id))
+        path = PurePath(_CACHE_DIR / str(self._user_id))
         return path
 
     def _build_path(self, email_id: int) -> PurePath:
         path = PurePath(self._path / str(email_id))
         return path
+
+
+def remove_attachments(attachments_paths: Iterable[str]) -> None:
+    """Removes sent attachments and their email directories if nothing else is left there"""
+    for attachment_path in attachments_paths:
+        with suppress(FileNotFoundError):
+            os.remove(attachment_path)
+        with suppress(OSError):  # Directory has attachments of another email with the same id
+            os.rmdir(os.path.dirname(attachment_path))
+
+
+def remove_stale_attachments(max_age: timedelta) -> None:
+    """
+    Removes attachments which weren't sent for max_age and empty directories. They are left by emails dropped between
+    pipeline stages, e.g. by a crash after download.
+    """
+
+    expired_before = time.time() - max_age.total_seconds()
+    # Directories are checked before their files are removed: removing changes their modification time
+    expired_dirs_paths = {dir_path for dir_path, _, _ in os.walk(_CACHE_DIR)
+                          if dir_path != str(_CACHE_DIR) and os.path.getmtime(dir_path) < expired_before}
+    for dir_path, _, files_names in os.walk(_CACHE_DIR, topdown=False):
+        for file_name in files_names:
+            with suppress(FileNotFoundError):
+                attachment_path = os.path.join(dir_path, file_name)
+                if os.path.getmtime(attachment_path) < expired_before:
+                    os.remove(attachment_path)
+        if dir_path in expired_dirs_paths:
+            with suppress(OSError):  # Isn't empty
+                os.rmdir(dir_path)
+
+
+def _get_filename(part: Message) -> str | None:
+    """: Returns filename of attachment part: RFC 2231 parameter or RFC 2047 encoded words, which mail clients use too"""
+    filename = part.get_filename()
+    if not filename:
+        return None
+    try:
+        return str(make_header(decode_header(filename)))
+    except (HeaderParseError, LookupError, UnicodeDecodeError):
+        return filename
@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import email.utils
+import re
+from dataclasses import dataclass
+from email.header import decode_header, make_header
+from itertools import takewhile
+from typing import Any, Iterator
+from urllib.parse import unquote
+
+_TOKEN_PATTERN = re.compile(rb'\(|\)|"(?:[^"\\]|\\.)*"|\{\d+\}$|[^\s()"\[]+(?:\[[^\]]*\][^\s()]*)?')
+_LITERAL_PATTERN = re.compile(rb"\{(\d+)\}")
+_NIL = b"NIL"
+_FETCH = b"FETCH"
+
+# Index of disposition field in single part BODYSTRUCTURE (RFC 3501 body-type-1part): basic, text, message/rfc822
+_BASIC_DISPOSITION_INDEX = 8
+_TEXT_DISPOSITION_INDEX = 9
+_MESSAGE_DISPOSITION_INDEX = 11
+
+
+class _Literal(bytes):
+    """Literal string: `{size}` with raw bytes. Unlike atoms, is never NIL or parenthesis"""
+
+
+@dataclass(frozen=True)
+class BodyPart:
+    number: str  # Section for BODY[<number>]: "1", "2.1"
+    content_type: str  # text/plain
+    encoding: str  # Content-Transfer-Encoding: 7bit / base64 / quoted-printable
+    size: int  # Encoded size in bytes
+    charset: str | None = None
+    filename: str | None = None
+    is_attachment: bool = False
+
+    @property
+    def decoded_size(self) -> int:
+        """: Returns approximated size of decoded part"""
+        if self.encoding == "base64":
+            return self.size * 3 // 4
+        return self.size
+
+
+@dataclass(frozen=True)
+class EmailStructure:
+    headers: bytes  # Raw header fields
+    parts: tuple[BodyPart, ...]
+
+    def get_text_part(self) -> BodyPart | None:
+        """: Returns text/plain body part, or text/html one if there is no plain text"""
+        text_parts = [part for part in self.parts if not part.is_attachment and part.content_type.startswith("text/")]
+        for part in text_parts:
+            if part.content_type == "text/plain":
+                return part
+        for part in text_parts:
+            if part.content_type == "text/html":
+                return part
+        return None
+
+    def get_attachments_parts(self) -> tuple[BodyPart, ...]:
+        return tuple(part for part in self.parts if part.is_attachment)
+
+
+def parse_fetch_response(response_data: list) -> Iterator[dict[str, Any]]:
+    """
+    Yields attributes of each message from FETCH response: {"UID": b"5", "BODYSTRUCTURE": [...], "BODY[1]": b"..."}.
+    Lists are python lists, NIL is None, strings & literals are bytes.
+    """
+
+    tokens = _tokenize(response_data)
+    while True:
+        token = next(tokens, None)
+        if token is None:
+            return
+        if token != _FETCH:
+            continue
+        token = next(tokens, None)
+        if token != b"(":
+            continue
+        attributes = _parse_list(tokens)
+        yield {
+            bytes(name).decode().upper(): value for name, value in zip(attributes[::2], attributes[1::2])
+        }
+
+
+def parse_body_structure(body_structure: list) -> tuple[BodyPart, ...]:
+    return tuple(_get_parts(body_structure, section=""))
+
+
+def _tokenize(response_data: list) -> Iterator[bytes | _Literal]:
+    for line in response_data:
+        if isinstance(line, bytearray):
+            yield _Literal(line)
+            continue
+        for token in _TOKEN_PATTERN.findall(line):
+            if _LITERAL_PATTERN.fullmatch(token):  # Literal itself is the next response item
+                continue
+            yield token
+
+
+def _parse_list(tokens: Iterator[bytes]) -> list:
+    """Parses parenthesized list. Opening parenthesis is already consumed"""
+    stack: list[list] = [list()]
+    for token in tokens:
+        if isinstance(token, _Literal):
+            stack[-1].append(bytes(token))
+        elif token == b"(":
+            stack.append(list())
+        elif token == b")":
+            closed = stack.pop()
+            if not stack:
+                return closed
+            stack[-1].append(closed)
+        elif token == _NIL:
+            stack[-1].append(None)
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb"\\(.)", rb"\1", token[1:-1]))
+        else:
+            stack[-1].append(token)
+    return stack[0]
+
+
+def _get_parts(body_structure: list, section: str) -> Iterator[BodyPart]:
+    if isinstance(body_structure[0], list):  # Multipart: child parts are followed by subtype & extension data
+        for index, child in enumerate(takewhile(lambda item: isinstance(item, list), body_structure), start=1):
+            yield from _get_parts(child, section=f"{section}.{index}" if section else str(index))
+        return
+
+    maintype, subtype = _decode(body_structure[0]).lower(), _decode(body_structure[1]).lower()
+    content_type = f"{maintype}/{subtype}"
+    params = _get_params(body_structure[2])
+    if maintype == "text":
+        disposition_index = _TEXT_DISPOSITION_INDEX
+    elif content_type == "message/rfc822":
+        disposition_index = _MESSAGE_DISPOSITION_INDEX
+    else:
+        disposition_index = _BASIC_DISPOSITION_INDEX
+    disposition_type, disposition_params = None, dict()
+    if len(body_structure) > disposition_index and isinstance(body_structure[disposition_index], list):
+        disposition = body_structure[disposition_index]
+        disposition_type = _decode(disposition[0]).lower()
+        disposition_params = _get_params(disposition[1]) if len(disposition) > 1 else dict()
+
+    filename = _get_filename(disposition_params) or _get_filename(params)
+    if not filename and content_type == "message/rfc822":
+        filename = "message.eml"
+    yield BodyPart(
+        number=section or "1",
+        content_type=content_type,
+        encoding=_decode(body_structure[5]).lower() if body_structure[5] else "7bit",
+        size=int(body_structure[6] or 0),
+        charset=params.get("charset"),
+        filename=filename,
+        is_attachment=disposition_type == "attachment" or bool(filename) or maintype not in ("text", "multipart")
+    )
+
+
+def _get_params(params: list | None) -> dict[str, str]:
+    if not params:
+        return dict()
+    return {_decode(name).lower(): _decode(value) for name, value in zip(params[::2], params[1::2])}
+
+
+def _get_filename(params: dict[str, str]) -> str | None:
+    if "filename*" in params or "name*" in params:  # RFC 2231: charset'language'percent-encoded
+        charset, _, value = email.utils.decode_rfc2231(params.get("filename*") or params["name*"])
+        return unquote(value, encoding=charset or "utf-8", errors="replace")
+    filename = params.get("filename") or params.get("name")
+    if not filename:
+        return None
+    try:
+        return str(make_header(decode_header(filename)))  # RFC 2047 encoded words
+    except (LookupError, UnicodeDecodeError):
+        return filename
+
+
+def _decode(value: bytes | None) -> str:
+    if value is None:
+        return ""
+    return bytes(value).decode("utf-8", errors="replace")
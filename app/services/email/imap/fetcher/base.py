@@ -1,49 +1,105 @@
 from __future__ import annotations
 
 import asyncio
-import email
+import re
 from contextlib import suppress
+from typing import Iterator, Sequence
 
 from aioimaplib import aioimaplib
-from mailparser import mailparser
 
+from app.exceptions import EmailFetchError
 from app.services.email.base.entities import EmailService, EmailConnectionType, IncomingEmail
 from app.services.email.imap import parser
 from app.services.email.imap.attachments import IncomingAttachmentsDirectory
-from app.services.email.imap.parser import get_email_text
-from app.settings.settings import EMAIL_CONNECTIONS_ATTEMPTS_COUNT
+from app.services.email.imap.bodystructure import BodyPart, EmailStructure, parse_body_structure, parse_fetch_response
+from app.services.email.imap.parsing import EmailParsingPool, EmailParsingTask
+from app.settings.settings import EMAIL_CONNECTIONS_ATTEMPTS_COUNT, IMAP_RECONNECT_BACKOFF_SEC, \
+    TELEGRAM_DOCUMENT_SIZE_LIMIT, ATTACHMENT_CHUNK_SIZE
+
+_FETCH_UID_PATTERN = re.compile(rb"UID (\d+)")
+_HEADERS_SECTION = "BODY.PEEK[HEADER.FIELDS (FROM SUBJECT DATE)]"
+
+
+async def connect(email_service: EmailService, email_address: str, email_auth_key: str,
+                  attempts_count: int) -> aioimaplib.IMAP4_SSL | None:
+    """
+    Opens IMAP session with selected inbox. Attempts fail by timeout or connection error, pause between them grows
+    exponentially. Session of failed attempt is closed before the next one.
+    Returned client should be checked for state: it isn't authenticated if all attempts failed.
+    Returns None if no attempt was made.
+    """
+
+    backoff = IMAP_RECONNECT_BACKOFF_SEC
+    client = None
+    for attempt in range(attempts_count):
+        if client is not None:
+            await _close_client(client)
+        try:
+            client = aioimaplib.IMAP4_SSL(
+                host=email_service.imap.server,
+                port=email_service.imap.port
+            )
+            await client.wait_hello_from_server()
+            await client.login(email_address, email_auth_key)
+            await client.select("inbox")
+            break
+        except (TimeoutError, OSError):  # ConnectionError is OSError too
+            if attempt == attempts_count - 1:
+                break
+
+        await asyncio.sleep(backoff)
+        backoff *= 2
+    return client
+
+
+async def _close_client(client: aioimaplib.IMAP4_SSL) -> None:
+    """Logs out of abandoned session & closes its connection, which timed out session may keep open"""
+    with suppress(Exception):
+        await client.logout()
+    transport = client.protocol.transport if client.protocol else None
+    if transport is not None and not transport.is_closing():
+        transport.close()
 
 
 class Mailbox:
 
     def __init__(self, email_service: EmailService, email_address: str, email_auth_key: str,
-                 user_id: int, cache_dir: IncomingAttachmentsDirectory) -> None:
+                 user_id: int, cache_dir: IncomingAttachmentsDirectory,
+                 client: aioimaplib.IMAP4_SSL | None = None, parsing_pool: EmailParsingPool | None = None) -> None:
+        """
+        :param client: already opened (e.g. borrowed from pool) IMAP session. Mailbox doesn't log out from it.
+        :param parsing_pool: worker processes for parsing fetched emails. Emails are parsed inline without it.
+        """
+
         self._email_service = email_service
         self._email_address = email_address
         self._email_auth_key = email_auth_key
         self._user_id = user_id
         self._cache_dir = cache_dir
+        self._client = client
+        self._owns_client = client is None
+        self._parsing_pool = parsing_pool or EmailParsingPool(processes_count=0)
 
     async def __aenter__(self) -> Mailbox:
-        while connection_attempts := 0 < EMAIL_CONNECTIONS_ATTEMPTS_COUNT:
-            with suppress(TimeoutError):
-                self._client = aioimaplib.IMAP4_SSL(
-                    host=self._email_service.imap.server,
-                    port=self._email_service.imap.port
-                )
-                await self._client.wait_hello_from_server()
-                await self._client.login(self._email_address, self._email_auth_key)
-                await self._client.select("inbox")
-                break
-
-            await asyncio.sleep(0.1)
-            connection_attempts += 1
+        if self._owns_client:
+            self._client = await self._connect(attempts_count=EMAIL_CONNECTIONS_ATTEMPTS_COUNT)
         return self
 
     async def __aexit__(self, exc_type, exc_val, exc_tb):
-        await self._client.logout()
+        if self._owns_client and self._client:
+            await self._client.logout()
+
+    async def _connect(self, attempts_count: int) -> aioimaplib.IMAP4_SSL | None:
+        return await connect(
+            email_service=self._email_service,
+            email_address=self._email_address,
+            email_auth_key=self._email_auth_key,
+            attempts_count=attempts_count
+        )
 
     def can_connect(self) -> bool:
+        if not self._client:
+            return False
         connection_state = self._client.get_state()
         if connection_state in (EmailConnectionType.AUTH, EmailConnectionType.SELECTED):
             return True
@@ -63,29 +119,145 @@ class Mailbox:
         response_200, mail_bytes = response
         if not response_200:
             return None
+        return await self._parse_email(email_id=email_id, mail_bytes=mail_bytes)
 
-        letter = mailparser.parse_from_bytes(mail_bytes)
+    async def get_emails(self, emails_ids: Sequence[str]) -> dict[str, IncomingEmail]:
+        """
+        Fetches several emails with one `UID FETCH id,id,... (UID RFC822)` round trip.
+        :return: emails by their ids. Ids that weren't found in mailbox are absent.
+        :raises EmailFetchError: if server didn't answer OK: absent ids don't mean removed emails then
+        """
 
-        subject = None
+        if not emails_ids:
+            return dict()
+        status, data = await self._client.uid("fetch", ",".join(emails_ids), "(UID RFC822)")
+        if status != "OK":
+            raise EmailFetchError(f"Emails {','.join(emails_ids)} weren't fetched: {status}")
+        fetched_emails = dict(_get_fetched_emails_from_response(data))
+        emails = await asyncio.gather(*(
+            self._parse_email(email_id=email_id, mail_bytes=mail_bytes) for email_id, mail_bytes in fetched_emails.items()
+        ))
+        return dict(zip(fetched_emails, emails))
 
-        all_text = get_email_text(email.message_from_bytes(mail_bytes))
-        if all_text:
-            text_nodes = parser.form_mail_text_nodes(all_text)
-        else:
-            text_nodes = None
+    async def get_emails_structures(self, emails_ids: Sequence[str]) -> dict[str, EmailStructure]:
+        """
+        First phase of two-phase fetching: BODYSTRUCTURE & main headers of several emails, without bodies.
+        :return: structures by email ids. Ids that weren't found in mailbox are absent.
+        :raises EmailFetchError: if server didn't answer OK: absent ids don't mean removed emails then
+        """
 
-        if letter.subject:
-            subject = letter.subject
+        if not emails_ids:
+            return dict()
+        status, data = await self._client.uid("fetch", ",".join(emails_ids), f"(UID BODYSTRUCTURE {_HEADERS_SECTION})")
+        if status != "OK":
+            raise EmailFetchError(f"Structures of emails {','.join(emails_ids)} weren't fetched: {status}")
+        structures = dict()
+        for attributes in parse_fetch_response(data):
+            if "UID" not in attributes or "BODYSTRUCTURE" not in attributes:
+                continue
+            headers = next((value for name, value in attributes.items() if name.startswith("BODY[")), None)
+            structures[attributes["UID"].decode()] = EmailStructure(
+                headers=headers or b"",
+                parts=parse_body_structure(attributes["BODYSTRUCTURE"])
+            )
+        return structures
 
-        attachments_paths = self._cache_dir.save_attachments(email=letter, email_id=int(email_id))
+    async def get_email_preview(self, email_id: str, structure: EmailStructure) -> IncomingEmail:
+        """: Returns email with text only. Only the text part is downloaded, attachments aren't"""
+        text_nodes = None
+        text_part = structure.get_text_part()
+        if text_part:
+            payload = await self._get_part(email_id=email_id, part=text_part)
+            text_nodes = await self._parsing_pool.get_part_text_nodes(
+                payload=payload, content_type=text_part.content_type, encoding=text_part.encoding,
+                charset=text_part.charset
+            )
 
+        headers = parser.parse_email_headers(structure.headers)
         return IncomingEmail(
             id_=str(email_id),
-            from_name=str(letter.from_[0][0]),
-            from_address=str(letter.from_[0][1]),
+            from_name=headers.from_name,
+            from_address=headers.from_address,
             to_=str(self._email_address),
-            date=letter.date,
-            subject=str(subject),
-            text=text_nodes,
-            attachments_paths=attachments_paths
+            date=headers.date,
+            subject=str(headers.subject),
+            text=text_nodes
         )
+
+    async def save_attachment(self, email_id: str, part: BodyPart) -> str | None:
+        """
+        Second phase of two-phase fetching: downloads one attachment part by ATTACHMENT_CHUNK_SIZE partial fetches
+        (`BODY.PEEK[<part>]<offset.size>`), each chunk is decoded straight to file.
+        :return: saved attachment path, or None if attachment exceeds Telegram document size limit.
+        """
+
+        if part.decoded_size > TELEGRAM_DOCUMENT_SIZE_LIMIT:
+            return None
+        with self._cache_dir.open_attachment(email_id=int(email_id), filename=part.filename or "attachment",
+                                             encoding=part.encoding) as writer:
+            offset = 0
+            while offset < part.size:
+                chunk = await self._get_part_chunk(email_id=email_id, part=part, offset=offset)
+                if not chunk:
+                    break
+                writer.write(chunk)
+                offset += len(chunk)
+        return writer.path
+
+    async def _get_part(self, email_id: str, part: BodyPart) -> bytes:
+        status, data = await self._client.uid("fetch", email_id, f"(BODY.PEEK[{part.number}])")
+        if status != "OK":
+            raise EmailFetchError(f"Part {part.number} of email {email_id} wasn't fetched: {status}")
+        for attributes in parse_fetch_response(data):
+            payload = attributes.get(f"BODY[{part.number}]")
+            if payload:
+                return payload
+        return b""
+
+    async def _get_part_chunk(self, email_id: str, part: BodyPart, offset: int) -> bytes:
+        status, data = await self._client.uid(
+            "fetch", email_id, f"(BODY.PEEK[{part.number}]<{offset}.{ATTACHMENT_CHUNK_SIZE}>)"
+        )
+        if status != "OK":  # Truncated attachment mustn't be sent as complete one
+            raise EmailFetchError(f"Part {part.number} of email {email_id} wasn't fetched from {offset}: {status}")
+        for attributes in parse_fetch_response(data):
+            chunk = attributes.get(f"BODY[{part.number}]<{offset}>")
+            if chunk:
+                return chunk
+        return b""
+
+    async def _parse_email(self, email_id: str, mail_bytes: bytes) -> IncomingEmail:
+        parsed_email = await self._parsing_pool.parse_email(
+            EmailParsingTask(email_id=int(email_id), mail_bytes=bytes(mail_bytes), cache_dir=self._cache_dir)
+        )
+        return IncomingEmail(
+            id_=str(email_id),
+            from_name=parsed_email.from_name,
+            from_address=parsed_email.from_address,
+            to_=str(self._email_address),
+            date=parsed_email.date,
+            subject=str(parsed_email.subject),
+            text=parsed_email.text,
+            attachments_paths=parsed_email.attachments_paths
+        )
+
+
+def _get_fetched_emails_from_response(response_data: list) -> Iterator[tuple[str, bytes]]:
+    """
+    Yields (uid, raw email) from multi-message FETCH response. Each message is a header line with literal size
+    (`1 FETCH (UID 5 RFC822 {1234}`), the literal itself and a closing line, which may carry UID too (` UID 5)`).
+    """
+
+    email_id, email_bytes = None, None
+    for line in response_data:
+        if isinstance(line, bytearray):  # Literal with raw email
+            email_bytes = bytes(line)
+            continue
+        if b" FETCH (" in line:  # Next message starts
+            email_id, email_bytes = None, None
+        uid_match = _FETCH_UID_PATTERN.search(line)
+        if uid_match:
+            email_id = uid_match.group(1).decode()
+        if email_id and email_bytes is not None and line.endswith(b")"):
+            yield email_id, email_bytes
+            email_id, email_bytes = None, None
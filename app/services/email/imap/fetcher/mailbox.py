@@ -1,56 +1,90 @@
 from __future__ import annotations
 
-import asyncio
-from contextlib import suppress
+import re
 
-from aioimaplib import aioimaplib
-
-from app.services.email.base.entities import EmailFlagPattern
+from app.exceptions import EmailFetchError
+from app.services.email.base.entities import MailboxStatus
 from app.services.email.imap.fetcher.base import Mailbox
 from app.settings import settings
 
+_CONDSTORE_CAPABILITY = "CONDSTORE"
+_SEARCH_RESPONSE_KEYWORD = b"SEARCH"
+_SELECT_CODE_PATTERN = re.compile(rb"\[([A-Z]+) (\d+)\]")
+_SELECT_EXISTS_PATTERN = re.compile(rb"^(\d+) EXISTS", re.IGNORECASE)
+
 
 class BroadcastMailbox(Mailbox):
 
     async def __aenter__(self) -> BroadcastMailbox:
-        while connection_attempts := 0 < settings.EMAIL_BROADCASTER_CONNECTIONS_ATTEMPTS_COUNT:
-            with suppress(TimeoutError):
-                self._client = aioimaplib.IMAP4_SSL(
-                    host=self._email_service.imap.server,
-                    port=self._email_service.imap.port
-                )
-                await self._client.wait_hello_from_server()
-                await self._client.login(self._email_address, self._email_auth_key)
-                await self._client.select("inbox")
-                break
-
-            await asyncio.sleep(0.1)
-            connection_attempts += 1
+        if self._owns_client:
+            self._client = await self._connect(attempts_count=settings.EMAIL_BROADCASTER_CONNECTIONS_ATTEMPTS_COUNT)
         return self
 
+    async def get_status(self) -> MailboxStatus:
+        """
+        : Returns inbox state from responses to inbox re-selection. STATUS mustn't be used for the selected mailbox
+        (RFC 3501, 6.3.10): servers may answer it with cached values. HIGHESTMODSEQ is requested only from servers
+        with CONDSTORE capability
+        """
+        supports_condstore = self._client.has_capability(_CONDSTORE_CAPABILITY)
+        status, data = await self._client.select("INBOX (CONDSTORE)" if supports_condstore else "INBOX")
+        items = self._get_select_items_from_response(data)
+        if status != "OK" or "UIDVALIDITY" not in items or "EXISTS" not in items:
+            raise EmailFetchError(f"Inbox of {self._email_address} wasn't selected: {status}")
+        return MailboxStatus(
+            uid_validity=items["UIDVALIDITY"],
+            uid_next=items.get("UIDNEXT"),
+            messages_count=items["EXISTS"],
+            highest_modseq=items.get("HIGHESTMODSEQ")
+        )
+
     async def get_not_sent_emails_ids(self, last_email_id: int) -> list[int] | None:
-        status, data = await self._client.search(EmailFlagPattern.ALL.value)
-        all_ids = self._get_emails_ids_from_response(data)
-        ids: list[int] = list()
-        for email_id in all_ids:
-            if email_id > last_email_id:
-                ids.append(int(email_id))
-            else:
-                break
-        ids.reverse()
+        """: Returns UIDs greater than last_email_id. Response size depends on new emails count only"""
+        status, data = await self._client.uid_search(f"UID {last_email_id + 1}:*")
+        # `n:*` range always matches the last email, even if its UID is lower than n
+        ids = [email_id for email_id in self._get_emails_ids_from_response(data) if email_id > last_email_id]
         return ids if ids else None
 
-    async def get_initial_emails_ids(self) -> list[int] | None:
-        status, data = await self._client.search(EmailFlagPattern.ALL.value)
-        all_ids = self._get_emails_ids_from_response(data)
-        all_ids = all_ids[:settings.INITIAL_FETCH_EMAILS_COUNT]
-        return all_ids[::-1] if all_ids else None
+    async def get_initial_emails_ids(self, messages_count: int) -> list[int] | None:
+        """: Returns UIDs of INITIAL_FETCH_EMAILS_COUNT last emails"""
+        if not messages_count:
+            return None
+        first_message_number = max(messages_count - settings.INITIAL_FETCH_EMAILS_COUNT + 1, 1)
+        status, data = await self._client.uid_search(f"{first_message_number}:*")
+        ids = self._get_emails_ids_from_response(data)
+        return ids if ids else None
+
+    async def get_last_email_id(self) -> int | None:
+        status, data = await self._client.uid_search("*")
+        ids = self._get_emails_ids_from_response(data)
+        return max(ids) if ids else None
 
     @staticmethod
-    def _get_emails_ids_from_response(response_data: tuple) -> list[int]:
-        data = str(response_data[0]).split()
-        email_ids = [int(''.join(filter(str.isdigit, _id))) for _id in data]
-        # Bug in API. Last Email id doesn't fetch.
-        email_ids.append(max(email_ids) + 1)
-        email_ids.reverse()
+    def _get_emails_ids_from_response(response_data: list) -> list[int]:
+        """
+        : Returns ascending ids from untagged `* SEARCH id id ...` lines. Other untagged lines (`* 3 EXISTS`,
+        `* 1 RECENT`) may come with the response and are skipped. The last line is command completion
+        """
+        email_ids = list()
+        for line in response_data[:-1]:
+            if isinstance(line, str):
+                line = line.encode()
+            tokens = line.split()
+            if not tokens or tokens[0].upper() != _SEARCH_RESPONSE_KEYWORD:
+                continue
+            email_ids.extend(int(email_id) for email_id in tokens[1:] if email_id.isdigit())
+        email_ids.sort()
         return email_ids
+
+    @staticmethod
+    def _get_select_items_from_response(response_data: list) -> dict[str, int]:
+        """: Parses untagged `* 40 EXISTS` & `* OK [UIDNEXT 42] ...` lines of SELECT into {EXISTS: 40, UIDNEXT: 42}"""
+        items = dict()
+        for line in response_data:
+            if isinstance(line, str):
+                line = line.encode()
+            exists_match = _SELECT_EXISTS_PATTERN.match(line)
+            if exists_match:
+                items["EXISTS"] = int(exists_match.group(1))
+            items.update({name.decode(): int(value) for name, value in _SELECT_CODE_PATTERN.findall(line)})
+        return items
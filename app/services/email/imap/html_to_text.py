@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import re
+from contextlib import suppress
+from html.parser import HTMLParser
+from typing import Callable, Iterable, Mapping
+
+from lxml import etree
+
+from app.settings import settings
+
+_WHITESPACES_PATTERN = re.compile(r"\s+")
+_HIDING_STYLE_PATTERN = re.compile(r"display\s*:\s*none|visibility\s*:\s*hidden", re.IGNORECASE)
+_SKIPPED_TAGS = frozenset(("script", "style", "head", "title", "noscript", "template", "svg", "object", "iframe"))
+_VOID_TAGS = frozenset(("area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "wbr"))
+_PARAGRAPH_TAGS = frozenset(("p", "h1", "h2", "h3", "h4", "h5", "h6", "blockquote", "table", "ul", "ol", "pre", "hr"))
+_LINE_TAGS = frozenset((
+    "div", "address", "article", "aside", "center", "dl", "dt", "dd", "fieldset", "figure", "footer", "form",
+    "header", "main", "nav", "section", "tr", "li"
+))
+_LIST_TAGS = frozenset(("ul", "ol"))
+_CELL_TAGS = frozenset(("td", "th"))
+_LINK_PREFIXES = ("http://", "https://")
+_HTML_PARSER_FEED_SIZE = 64 * 1024  # Rendering stops as soon as text size limit is reached
+
+
+def html_to_text(body: str, engine: str = settings.HTML_TO_TEXT_ENGINE,
+                 max_size: int = settings.HTML_TEXT_MAX_SIZE) -> str:
+    """
+    Renders HTML email body to plain text in one pass over the document. Paragraphs, line breaks, lists, table
+    rows & link addresses are kept; scripts, styles & hidden elements are skipped.
+    :param engine: "lxml" (C parser) or "html.parser" (pure python, stdlib).
+    :param max_size: rendering stops once text reaches this size; the rest of the document isn't processed.
+    """
+
+    builder = _TextBuilder(max_size=max_size)
+    _ENGINES[engine](body, builder)
+    return builder.get_text()
+
+
+def _render_with_lxml(body: str, builder: _TextBuilder) -> None:
+    renderer = _LxmlRenderer(builder)
+    parser = etree.HTMLPullParser(events=("start", "end"), encoding="utf-8", remove_comments=True, remove_pis=True)
+    for offset in range(0, len(body), _HTML_PARSER_FEED_SIZE):
+        if builder.is_full:
+            return
+        parser.feed(body[offset:offset + _HTML_PARSER_FEED_SIZE].encode("utf-8", errors="replace"))
+        renderer.handle_events(parser.read_events())
+    with suppress(etree.XMLSyntaxError):  # Empty document
+        parser.close()
+    renderer.handle_events(parser.read_events())
+    renderer.close()
+
+
+def _render_with_html_parser(body: str, builder: _TextBuilder) -> None:
+    renderer = _HTMLParserRenderer(builder)
+    for offset in range(0, len(body), _HTML_PARSER_FEED_SIZE):
+        if builder.is_full:
+            return
+        renderer.feed(body[offset:offset + _HTML_PARSER_FEED_SIZE])
+    renderer.close()
+
+
+_ENGINES: dict[str, Callable[[str, _TextBuilder], None]] = {
+    "lxml": _render_with_lxml,
+    "html.parser": _render_with_html_parser
+}
+
+
+class _TextBuilder:
+    """Collects text from stream of visible elements' start / end / data events"""
+
+    def __init__(self, max_size: int) -> None:
+        self._max_size = max_size
+        self._parts: list[str] = list()
+        self._size = 0
+        self._pending_newlines = 0  # Line breaks are written before next text, so trailing ones are dropped
+        self._ends_with_space = True
+        self._pre_depth = 0
+        self._lists_counters: list[int | None] = list()  # Next item number for ordered lists
+        self._links: list[tuple[str | None, int]] = list()  # Link address & index of its first text part
+        self._row_cells_count = 0
+
+    @property
+    def is_full(self) -> bool:
+        return self._size >= self._max_size
+
+    def start(self, tag: str, attrs: Mapping[str, str | None]) -> None:
+        if tag == "br":
+            self._pending_newlines = min(self._pending_newlines + 1, 2)
+        elif tag in _PARAGRAPH_TAGS:
+            self._break_line(2)
+        elif tag in _LINE_TAGS:
+            self._break_line(1)
+
+        if tag == "li":
+            counter = self._lists_counters[-1] if self._lists_counters else None
+            if counter is None:
+                self._write("• ")
+            else:
+                self._write(f"{counter}. ")
+                self._lists_counters[-1] = counter + 1
+        elif tag in _LIST_TAGS:
+            self._lists_counters.append(1 if tag == "ol" else None)
+        elif tag == "tr":
+            self._row_cells_count = 0
+        elif tag in _CELL_TAGS:
+            if self._row_cells_count:
+                self._write(" | ")
+            self._row_cells_count += 1
+        elif tag == "a":
+            self._links.append((attrs.get("href"), len(self._parts)))
+        elif tag == "pre":
+            self._pre_depth += 1
+
+    def end(self, tag: str) -> None:
+        if tag == "a" and self._links:
+            href, first_part_index = self._links.pop()
+            if href and href.startswith(_LINK_PREFIXES) and href not in "".join(self._parts[first_part_index:]):
+                self._write(f" ({href})")
+        elif tag in _LIST_TAGS and self._lists_counters:
+            self._lists_counters.pop()
+        elif tag == "pre" and self._pre_depth:
+            self._pre_depth -= 1
+
+        if tag in _PARAGRAPH_TAGS:
+            self._break_line(2)
+        elif tag in _LINE_TAGS:
+            self._break_line(1)
+
+    def data(self, text: str) -> None:
+        if not self._pre_depth:
+            text = _WHITESPACES_PATTERN.sub(" ", text)
+            if self._ends_with_space or self._pending_newlines:
+                text = text.lstrip(" ")
+        if text:
+            self._write(text)
+
+    def get_text(self) -> str:
+        return "".join(self._parts)[:self._max_size].rstrip()
+
+    def _break_line(self, newlines_count: int) -> None:
+        self._pending_newlines = max(self._pending_newlines, newlines_count)
+
+    def _write(self, text: str) -> None:
+        if self.is_full:
+            return
+        if self._pending_newlines and self._parts:
+            if self._parts[-1].endswith(" "):
+                self._parts[-1] = self._parts[-1].rstrip(" ")
+            self._parts.append("\n" * self._pending_newlines)
+            self._size += self._pending_newlines
+        self._pending_newlines = 0
+        self._parts.append(text)
+        self._size += len(text)
+        self._ends_with_space = text[-1].isspace()
+
+
+class _LxmlRenderer:
+    """
+    Streams lxml pull parser events to builder. Element's text is complete only at the next event after its start
+    and element's tail at the next event after its end, so text is written one event later.
+    """
+
+    def __init__(self, builder: _TextBuilder) -> None:
+        self._builder = builder
+        self._pending_text_source: tuple[etree.ElementBase, str] | None = None  # Element & "text" / "tail"
+        self._hidden_element: etree.ElementBase | None = None
+
+    def handle_events(self, events: Iterable[tuple[str, etree.ElementBase]]) -> None:
+        for event, element in events:
+            if self._hidden_element is not None:
+                if event == "end" and element is self._hidden_element:
+                    self._hidden_element, self._pending_text_source = None, (element, "tail")
+                continue
+            self._write_pending_text()
+            if event == "start" and _is_hidden(element.tag, element.attrib):
+                self._hidden_element = element
+            elif event == "start":
+                self._builder.start(element.tag, element.attrib)
+                self._pending_text_source = (element, "text")
+            else:
+                self._builder.end(element.tag)
+                self._pending_text_source = (element, "tail")
+
+    def close(self) -> None:
+        if self._hidden_element is None:
+            self._write_pending_text()
+
+    def _write_pending_text(self) -> None:
+        if self._pending_text_source:
+            element, attribute = self._pending_text_source
+            self._pending_text_source = None
+            text = getattr(element, attribute)
+            if text:
+                self._builder.data(text)
+
+
+class _HTMLParserRenderer(HTMLParser):
+    """Streams stdlib parser events to builder. Hidden elements are skipped with their whole content"""
+
+    def __init__(self, builder: _TextBuilder) -> None:
+        super().__init__(convert_charrefs=True)
+        self._builder = builder
+        self._skipped_tag: str | None = None
+        self._skipped_tag_depth = 0
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if self._skipped_tag:
+            if tag == self._skipped_tag:
+                self._skipped_tag_depth += 1
+            return
+        attributes = dict(attrs)
+        if tag not in _VOID_TAGS and _is_hidden(tag, attributes):
+            self._skipped_tag, self._skipped_tag_depth = tag, 1
+            return
+        self._builder.start(tag, attributes)
+
+    def handle_endtag(self, tag: str) -> None:
+        if self._skipped_tag:
+            if tag == self._skipped_tag:
+                self._skipped_tag_depth -= 1
+                if not self._skipped_tag_depth:
+                    self._skipped_tag = None
+            return
+        self._builder.end(tag)
+
+    def handle_data(self, data: str) -> None:
+        if not self._skipped_tag:
+            self._builder.data(data)
+
+
+def _is_hidden(tag: str, attrs: Mapping[str, str | None]) -> bool:
+    if tag in _SKIPPED_TAGS or "hidden" in attrs or attrs.get("aria-hidden") == "true":
+        return True
+    style = attrs.get("style")
+    return bool(style and _HIDING_STYLE_PATTERN.search(style))
@@ -0,0 +1,24 @@
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from app.services.email.base.entities import EmailServers
+
+
+class IMAPSessionsLimiter:
+    """Caps simultaneous IMAP sessions: in total and per email service (Gmail / Yandex / Mail.ru)"""
+
+    def __init__(self, limit: int) -> None:
+        self._semaphore = asyncio.Semaphore(limit)
+        self._services_semaphores = {
+            service.value.id_: asyncio.Semaphore(service.value.imap.sessions_limit) for service in EmailServers
+        }
+
+    @asynccontextmanager
+    async def acquire(self, service_id: str) -> AsyncIterator[None]:
+        # Service slot is taken first: mailboxes of a saturated service mustn't hold global slots while waiting.
+        async with self._services_semaphores[service_id]:
+            async with self._semaphore:
+                yield
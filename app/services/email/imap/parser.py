@@ -1,77 +1,179 @@
 from __future__ import annotations
 
 import base64
-import codecs
 import logging
 import quopri
 import re
+from dataclasses import dataclass, replace
+from datetime import datetime
+from email import policy
+from email.headerregistry import BaseHeader
+from email.message import Message
+from email.parser import BytesParser
+from email.utils import parseaddr
 
-from bs4 import BeautifulSoup
-
-from app.settings.settings import EMAIL_NODE_SIZE
-
-
-def form_mail_text_nodes(text: str) -> list[str]:
-    max_characters = EMAIL_NODE_SIZE  # Telegram API limit per message
-    text_builder = []
-    text = re.sub(" +", " ", text)
-    text = re.sub("\n+", "\n", text)
-    text = re.sub("\t+", "  ", text)
-    nodes_count = (len(text) // max_characters) + 1
-    for node_index in range(nodes_count):
-        text_builder.append(text[node_index * max_characters:(node_index + 1) * max_characters])
-    return text_builder
-
-
-def get_email_text(msg) -> str | None:
-    if msg.is_multipart():
-        for part in msg.walk():
-            count = 0
-            if part.get_content_maintype() == "text" and count == 0:
-                extract_part = _get_letter_type(part)
-                if part.get_content_subtype() == "html":
-                    letter_text = _get_email_text_from_html(extract_part)
-                else:
-                    letter_text = extract_part.rstrip().lstrip()
-                count += 1
-                if letter_text:
-                    return letter_text.replace("<", "").replace(">", "").replace("\xa0", " ")
-                return
+from app.services.email.imap.html_to_text import html_to_text
+from app.settings.settings import EMAIL_NODE_SIZE, EMAIL_TEXT_MAX_SIZE
 
+_WHITESPACES_PATTERN = re.compile(r"[ \t]*\n[ \t\n]*|\t+| {2,}")
+_ASTRAL_SYMBOLS_PATTERN = re.compile("[\U00010000-\U0010FFFF]")  # Encoded with UTF-16 surrogate pairs
+_NODE_BOUNDARIES = ("\n\n", "\n", ". ", "! ", "? ", "; ", ", ", " ")  # In order of preference
+
+
+def form_mail_text_nodes(text: str, max_size: int = EMAIL_NODE_SIZE) -> list[str]:
+    """
+    Normalizes whitespaces & splits plain text into nodes of at most max_size UTF-16 code units, which is how
+    Telegram measures message length. Nodes are split on paragraph, line, sentence or word boundary where possible.
+    """
+
+    text = _WHITESPACES_PATTERN.sub(_normalize_whitespaces, text).strip()
+    nodes = list()
+    start = 0
+    while start < len(text):
+        end = _get_node_end(text=text, start=start, max_size=max_size)
+        node = text[start:end].strip()
+        if node:
+            nodes.append(node)
+        start = end
+    return nodes
+
+
+@dataclass(frozen=True)
+class ParsedEmail:
+    from_name: str
+    from_address: str
+    subject: str | None = None
+    date: datetime | None = None
+    text: str | None = None
+    attachments: tuple[Message, ...] = ()  # Attachment parts with still encoded payloads
+
+
+def parse_email(mail_bytes: bytes) -> ParsedEmail:
+    """
+    Parses raw email once & walks MIME tree once: headers, text (text/plain preferred over text/html) and
+    attachment parts. Tree is parsed with compat32 policy: default one parses header again on every access, e.g. each
+    get_content_type(). Only sender, subject & date are parsed into structured headers.
+    """
+
+    message = BytesParser(policy=policy.compat32).parsebytes(mail_bytes)
+    plain_part, html_part, attachments = None, None, list()
+    for part in message.walk():
+        if part.is_multipart():
+            continue
+        content_type = part.get_content_type()
+        if part.get_content_disposition() == "attachment" or part.get_filename():
+            attachments.append(part)
+        elif content_type == "text/plain" and plain_part is None:
+            plain_part = part
+        elif content_type == "text/html" and html_part is None:
+            html_part = part
+
+    letter_text = None
+    if plain_part is not None:
+        letter_text = _get_part_content(plain_part).strip()
+    elif html_part is not None:
+        letter_text = _get_email_text_from_html(_get_part_content(html_part))
+    return replace(parse_email_headers(message), text=_clean_text(letter_text), attachments=tuple(attachments))
+
+
+def parse_email_headers(headers: bytes | Message) -> ParsedEmail:
+    """: Returns email with sender, subject & date only"""
+    if isinstance(headers, bytes):
+        headers = BytesParser(policy=policy.compat32).parsebytes(headers, headersonly=True)
+    raw_headers = dict()
+    for name, value in headers.raw_items():
+        raw_headers.setdefault(name.lower(), value)  # The first one is used, like Message.get() does
+
+    from_name, from_address = _get_sender(raw_headers.get("from"))
+    subject = _parse_header("Subject", raw_headers.get("subject"))
+    return ParsedEmail(
+        from_name=from_name,
+        from_address=from_address,
+        subject=str(subject) if subject else None,
+        date=getattr(_parse_header("Date", raw_headers.get("date")), "datetime", None)
+    )
+
+
+def _parse_header(name: str, value: str | None) -> BaseHeader | None:
+    """: Returns structured header with decoded value (RFC 2047 encoded words), like header of default policy"""
+    return policy.default.header_fetch_parse(name, value) if value is not None else None
+
+
+def _get_sender(from_header: str | None) -> tuple[str, str]:
+    """: Returns sender name & address. Structured header keeps decoded non-ascii names intact, unlike parseaddr"""
+    try:
+        addresses = getattr(_parse_header("From", from_header), "addresses", ())
+    except (IndexError, ValueError):  # Malformed header
+        addresses = ()
+    if addresses:
+        return addresses[0].display_name, addresses[0].addr_spec
+    return parseaddr(from_header or "")
+
+
+def get_part_text(payload: bytes, content_type: str, encoding: str, charset: str | None) -> str | None:
+    """: Returns text of separately fetched body part (BODY[<part>] with transfer encoding applied)"""
+    if encoding == "base64":
+        payload = base64.b64decode(payload)
+    elif encoding == "quoted-printable":
+        payload = quopri.decodestring(payload)
+    body = _decode_payload(payload, charset)
+
+    if content_type == "text/html":
+        letter_text = _get_email_text_from_html(body)
     else:
-        count = 0
-        if msg.get_content_maintype() == "text" and count == 0:
-            extract_part = _get_letter_type(msg)
-            if msg.get_content_subtype() == "html":
-                letter_text = _get_email_text_from_html(extract_part)
-            else:
-                letter_text = extract_part
-            count += 1
-            if letter_text:
-                return letter_text.replace("<", "").replace(">", "").replace("\xa0", " ")
-            return
-
-
-def _get_email_text_from_html(body) -> str | None:
-    body = body.replace("<div><div>", "<div>").replace("</div></div>", "</div>")
+        letter_text = body.strip()
+    return _clean_text(letter_text)
+
+
+def _get_part_content(part: Message) -> str:
+    return _decode_payload(part.get_payload(decode=True) or b"", part.get_content_charset())
+
+
+def _decode_payload(payload: bytes, charset: str | None) -> str:
+    try:
+        return payload.decode(charset or "utf-8", errors="replace")
+    except LookupError:  # Unknown charset
+        return payload.decode("utf-8", errors="replace")
+
+
+def _clean_text(letter_text: str | None) -> str | None:
+    if letter_text:
+        # Rendered email is published as one nats message: text of huge email mustn't make it unpublishable
+        return letter_text[:EMAIL_TEXT_MAX_SIZE].replace("\xa0", " ")
+    return None
+
+
+def _normalize_whitespaces(match: re.Match) -> str:
+    whitespaces = match.group()
+    newlines_count = whitespaces.count("\n")
+    if newlines_count:
+        return "\n\n" if newlines_count > 1 else "\n"
+    return "  " if whitespaces.startswith("\t") else " "
+
+
+def _get_node_end(text: str, start: int, max_size: int) -> int:
+    """: Returns end index of node starting at start. Python strings are sliced by code points: pairs aren't split"""
+    end = min(start + max_size, len(text))
+    while (size := _get_utf16_size(text[start:end])) > max_size:
+        end -= (size - max_size + 1) // 2  # Astral symbols take two units each
+    if end == len(text):
+        return end
+
+    min_end = start + max_size // 2  # Too short nodes cost extra messages
+    for boundary in _NODE_BOUNDARIES:
+        boundary_index = text.rfind(boundary, min_end, end)
+        if boundary_index != -1:
+            return boundary_index + len(boundary)
+    return end
+
+
+def _get_utf16_size(text: str) -> int:
+    return len(text) + len(_ASTRAL_SYMBOLS_PATTERN.findall(text))
+
+
+def _get_email_text_from_html(body: str) -> str | None:
     try:
-        soup = BeautifulSoup(body, "html.parser")
-        paragraphs = soup.find_all("div")
-        text = ""
-        for paragraph in paragraphs:
-            text += paragraph.text + "\n"
-        return text.replace("\xa0", " ")
+        return html_to_text(body)
     except Exception as exp:
         logging.error(exp)
-        return
-
-
-def _get_letter_type(part):
-    if part["Content-Transfer-Encoding"] in (None, "7bit", "8bit", "binary"):
-        return part.get_payload()
-    elif part["Content-Transfer-Encoding"] == "base64":
-        return codecs.decode(base64.b64decode(part.get_payload()))
-    elif part["Content-Transfer-Encoding"] == "quoted-printable":
-        return codecs.decode(quopri.decodestring(part.get_payload()))
-    else:  # all possible types: quoted-printable, base64, 7bit, 8bit, and binary
-        return part.get_payload()
+        return None
@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime
+from functools import partial
+from typing import Callable, TypeVar
+
+from app.services.email.imap import parser
+from app.services.email.imap.attachments import IncomingAttachmentsDirectory
+from app.settings import settings
+
+_Result = TypeVar("_Result")
+
+
+@dataclass(frozen=True)
+class EmailParsingTask:
+    email_id: int
+    mail_bytes: bytes  # Raw RFC822 email
+    cache_dir: IncomingAttachmentsDirectory  # Entered directory: attachments are saved by worker process
+
+
+@dataclass(frozen=True)
+class ParsedEmailDTO:
+    from_name: str
+    from_address: str
+    subject: str | None = None
+    date: datetime | None = None
+    text: list[str] | None = None  # Text nodes ready for sending
+    attachments_paths: tuple[str] | None = None
+
+
+def parse_email(task: EmailParsingTask) -> ParsedEmailDTO:
+    """Parses raw email, splits text into nodes & saves attachments. Runs in worker process"""
+    parsed_email = parser.parse_email(task.mail_bytes)
+    return ParsedEmailDTO(
+        from_name=parsed_email.from_name,
+        from_address=parsed_email.from_address,
+        subject=parsed_email.subject,
+        date=parsed_email.date,
+        text=parser.form_mail_text_nodes(parsed_email.text) if parsed_email.text else None,
+        attachments_paths=task.cache_dir.save_attachments(parts=parsed_email.attachments, email_id=task.email_id)
+    )
+
+
+def get_part_text_nodes(payload: bytes, content_type: str, encoding: str, charset: str | None) -> list[str] | None:
+    """Decodes separately fetched text part & splits it into nodes. Runs in worker process"""
+    all_text = parser.get_part_text(payload=payload, content_type=content_type, encoding=encoding, charset=charset)
+    return parser.form_mail_text_nodes(all_text) if all_text else None
+
+
+class EmailParsingPool:
+    """
+    Runs CPU-bound MIME & HTML parsing in worker processes, so big emails don't block event loop (bot polling,
+    fetching & broadcasting). Tasks & results are picklable DTOs. With zero processes parsing runs inline.
+    """
+
+    def __init__(self, processes_count: int = settings.PARSING_PROCESSES_COUNT) -> None:
+        self._executor = ProcessPoolExecutor(max_workers=processes_count) if processes_count > 0 else None
+
+    async def parse_email(self, task: EmailParsingTask) -> ParsedEmailDTO:
+        return await self._run(partial(parse_email, task))
+
+    async def get_part_text_nodes(self, payload: bytes, content_type: str, encoding: str,
+                                  charset: str | None) -> list[str] | None:
+        return await self._run(partial(get_part_text_nodes, payload=payload, content_type=content_type,
+                                       encoding=encoding, charset=charset))
+
+    def close(self) -> None:
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, function: Callable[[], _Result]) -> _Result:
+        if not self._executor:
+            return function()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function)
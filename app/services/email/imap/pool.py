@@ -0,0 +1,223 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, defaultdict
+from contextlib import asynccontextmanager, suppress
+from dataclasses import dataclass, field
+from typing import AsyncIterator
+
+from aioimaplib import aioimaplib
+
+from app.dtos.email import UserEmailDTO
+from app.services.email.base.entities import EmailConnectionType, get_service_by_id
+from app.services.email.imap.fetcher.base import connect
+from app.settings import settings
+
+_CONNECTED_STATES = (EmailConnectionType.AUTH, EmailConnectionType.SELECTED)
+
+
+@dataclass
+class _PooledConnection:
+    client: aioimaplib.IMAP4_SSL
+    service_id: str
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class IMAPConnectionPool:
+    """
+    Long-lived IMAP sessions shared by fetcher & broadcaster. Keyed by Email database id: one session per mailbox,
+    borrowed by one coroutine at a time. Least recently used idle sessions are closed when total or per-service
+    sessions limit is reached. Dedicated sessions opened outside the pool (IDLE ones) hold slots of the same limits.
+    """
+
+    def __init__(self, max_connections: int = settings.IMAP_POOL_MAX_CONNECTIONS) -> None:
+        self._max_connections = max_connections
+        self._connections: OrderedDict[int, _PooledConnection] = OrderedDict()
+        self._borrow_locks: defaultdict[int, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._services_sessions: defaultdict[str, int] = defaultdict(int)
+        self._sessions_count = 0
+        self._services_dedicated_sessions: defaultdict[str, int] = defaultdict(int)
+        self._dedicated_sessions_count = 0
+        self._slots_released = asyncio.Condition()
+
+    @asynccontextmanager
+    async def borrow(self, user_email: UserEmailDTO,
+                     attempts_count: int = settings.EMAIL_CONNECTIONS_ATTEMPTS_COUNT
+                     ) -> AsyncIterator[aioimaplib.IMAP4_SSL | None]:
+        """
+        Yields authenticated session with selected inbox, or None if mailbox can't be connected.
+        Session is dropped from pool if borrower fails with an exception.
+        """
+
+        async with self._borrow_locks[user_email.email_db_id]:
+            connection = await self._get_healthy_connection(user_email.email_db_id)
+            if not connection:
+                connection = await self._open_connection(user_email=user_email, attempts_count=attempts_count)
+            if not connection:
+                yield None
+                return
+
+            try:
+                yield connection.client
+            except BaseException:
+                await self._close(user_email.email_db_id)
+                raise
+            connection.last_used = time.monotonic()
+            if user_email.email_db_id in self._connections:
+                self._connections.move_to_end(user_email.email_db_id)
+
+        # Returned session can be evicted now: borrowers waiting for a slot check it
+        async with self._slots_released:
+            self._slots_released.notify_all()
+
+    @asynccontextmanager
+    async def reserve_dedicated_slot(self, service_id: str) -> AsyncIterator[bool]:
+        """
+        Holds session slot for dedicated session opened outside the pool, e.g. IDLE one. Dedicated sessions may hold
+        only IMAP_POOL_DEDICATED_SESSIONS_SHARE of limits: borrowers always get the rest. Slot isn't waited for.
+        Yields False if it can't be taken now.
+        """
+
+        if not await self._reserve_slot(service_id=service_id, dedicated=True):
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            await self._release_slot(service_id=service_id, dedicated=True)
+
+    async def close_idle(self) -> None:
+        """Closes sessions which weren't borrowed for IMAP_POOL_IDLE_TIMEOUT_SEC"""
+        expired_before = time.monotonic() - settings.IMAP_POOL_IDLE_TIMEOUT_SEC
+        for email_db_id, connection in list(self._connections.items()):
+            if connection.last_used < expired_before and not self._borrow_locks[email_db_id].locked():
+                await self._close(email_db_id)
+
+    async def close(self) -> None:
+        for email_db_id in list(self._connections):
+            await self._close(email_db_id)
+
+    async def _get_healthy_connection(self, email_db_id: int) -> _PooledConnection | None:
+        connection = self._connections.get(email_db_id)
+        if not connection:
+            return None
+        if connection.client.get_state() not in _CONNECTED_STATES:
+            await self._close(email_db_id)
+            return None
+        if time.monotonic() - connection.last_used > settings.IMAP_POOL_HEALTHCHECK_SEC:
+            try:
+                status, _ = await connection.client.noop()
+                if status != "OK":
+                    raise aioimaplib.Abort("NOOP failed")
+            except Exception as e:
+                logging.warning(f"IMAP session of email {email_db_id} is broken: {e}")
+                await self._close(email_db_id)
+                return None
+        return connection
+
+    async def _open_connection(self, user_email: UserEmailDTO, attempts_count: int) -> _PooledConnection | None:
+        await self._reserve_slot(service_id=user_email.mail_server)
+        try:
+            client = await connect(
+                email_service=get_service_by_id(service_id=user_email.mail_server).value,
+                email_address=user_email.mail_address,
+                email_auth_key=user_email.mail_auth_key,
+                attempts_count=attempts_count
+            )
+        except BaseException:
+            await self._release_slot(service_id=user_email.mail_server)
+            raise
+
+        if client is None or client.get_state() not in _CONNECTED_STATES:
+            await self._release_slot(service_id=user_email.mail_server)
+            if client is not None:
+                await self._logout(client)
+            return None
+
+        connection = _PooledConnection(client=client, service_id=user_email.mail_server)
+        self._connections[user_email.email_db_id] = connection
+        return connection
+
+    async def _reserve_slot(self, service_id: str, dedicated: bool = False) -> bool:
+        """
+        Takes session slot. Sessions evicted to free it are logged out after slots condition lock is released.
+        Dedicated slot isn't waited for: False is returned if dedicated sessions' share is exhausted or nothing can be
+        evicted.
+        """
+
+        evicted_connections = list()
+        async with self._slots_released:
+            reserved = not dedicated or self._has_free_dedicated_slot(service_id)
+            while reserved and not self._has_free_slot(service_id):
+                evicted_connection = self._evict_least_recently_used(service_id)
+                if evicted_connection:
+                    evicted_connections.append(evicted_connection)
+                elif dedicated:
+                    reserved = False
+                else:
+                    await self._slots_released.wait()
+            if reserved:
+                self._sessions_count += 1
+                self._services_sessions[service_id] += 1
+                if dedicated:
+                    self._dedicated_sessions_count += 1
+                    self._services_dedicated_sessions[service_id] += 1
+
+        for evicted_connection in evicted_connections:
+            await self._logout(evicted_connection.client)
+        return reserved
+
+    async def _release_slot(self, service_id: str, dedicated: bool = False) -> None:
+        async with self._slots_released:
+            self._sessions_count -= 1
+            self._services_sessions[service_id] -= 1
+            if dedicated:
+                self._dedicated_sessions_count -= 1
+                self._services_dedicated_sessions[service_id] -= 1
+            self._slots_released.notify_all()
+
+    def _has_free_slot(self, service_id: str) -> bool:
+        service_limit = get_service_by_id(service_id).value.imap.sessions_limit
+        return self._sessions_count < self._max_connections and self._services_sessions[service_id] < service_limit
+
+    def _has_free_dedicated_slot(self, service_id: str) -> bool:
+        service_limit = get_service_by_id(service_id).value.imap.sessions_limit
+        share = settings.IMAP_POOL_DEDICATED_SESSIONS_SHARE
+        return self._dedicated_sessions_count < int(self._max_connections * share) and \
+            self._services_dedicated_sessions[service_id] < int(service_limit * share)
+
+    def _evict_least_recently_used(self, service_id: str) -> _PooledConnection | None:
+        """
+        Removes the oldest not borrowed session from pool & frees its slot: of the same service if its limit is
+        reached, of any otherwise. Called under slots condition lock, the caller logs the session out.
+        Returns None if there is nothing to evict.
+        """
+
+        service_limit_reached = (
+            self._services_sessions[service_id] >= get_service_by_id(service_id).value.imap.sessions_limit
+        )
+        for email_db_id, connection in self._connections.items():
+            if self._borrow_locks[email_db_id].locked():
+                continue
+            if service_limit_reached and connection.service_id != service_id:
+                continue
+            self._connections.pop(email_db_id)
+            self._borrow_locks.pop(email_db_id, None)
+            self._sessions_count -= 1
+            self._services_sessions[connection.service_id] -= 1
+            return connection
+        return None
+
+    async def _close(self, email_db_id: int) -> None:
+        connection = self._connections.pop(email_db_id, None)
+        if not connection:
+            return
+        await self._release_slot(connection.service_id)
+        await self._logout(connection.client)
+
+    @staticmethod
+    async def _logout(client: aioimaplib.IMAP4_SSL) -> None:
+        with suppress(Exception):
+            await asyncio.wait_for(client.logout(), timeout=settings.IMAP_POOL_HEALTHCHECK_SEC)
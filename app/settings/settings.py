@@ -1,11 +1,65 @@
 from typing import Final
 
-PAUSE_SECONDS_BETWEEN_MESSAGES: Final[float] = 0.7
-EMAIL_NODE_SIZE: Final[int] = 3000  # Symbols of Email text per message
+PAUSE_SECONDS_BETWEEN_MESSAGES: Final[float] = 0.7  # Min average pause between messages in one private chat
+TELEGRAM_MESSAGES_PER_SEC: Final[int] = 30  # Bot API global limit
+TELEGRAM_GROUP_MESSAGES_PER_MIN: Final[int] = 20  # Bot API limit per group (forum)
+TELEGRAM_CHAT_BURST_SIZE: Final[int] = 3  # Messages sent to one chat without pauses
+TELEGRAM_RETRY_AFTER_ATTEMPTS_COUNT: Final[int] = 3  # Sending attempts of one request hitting flood control
+TELEGRAM_CHATS_BUCKETS_MAX_COUNT: Final[int] = 10000  # Idle per chat rate limiters are dropped above
+EMAIL_NODE_SIZE: Final[int] = 3000  # UTF-16 code units of Email text per message (Telegram limit is 4096)
+EMAIL_TEXT_MAX_SIZE: Final[int] = 30000  # Symbols of Email text sent to forum. Keeps rendered email under nats max_payload
 INITIAL_FETCH_EMAILS_COUNT: Final[int] = 25
 EMAIL_CONNECTIONS_ATTEMPTS_COUNT: Final[int] = 10
 EMAIL_BROADCASTER_CONNECTIONS_ATTEMPTS_COUNT: Final[int] = 2
-BROADCAST_BATCH_SIZE: Final[int] = 5
-FETCHING_SEC_INTERVAL: Final[int] = 10
-BROADCASTING_SEC_INTERVAL: Final[int] = 1
+BROADCAST_BATCH_SIZE: Final[int] = 32  # Max rendered emails pulled by sender worker at once
+BROADCAST_MAX_DELIVERIES: Final[int] = 5  # Rendered email which still isn't sent after is dropped
+BROADCAST_RETRY_DELAY_SEC: Final[int] = 30  # Rendered email which failed to be sent is redelivered after
+DOWNLOAD_BATCH_SIZE: Final[int] = 16  # Max emails UIDs pulled by downloader worker at once
+DOWNLOAD_MAX_DELIVERIES: Final[int] = 5  # Email UID which rendered email still isn't published after is dropped
+DOWNLOAD_RETRY_DELAY_SEC: Final[int] = 30  # Email UID which isn't downloaded or published is redelivered after
+POLLING_TICK_SEC: Final[int] = 1  # Due mailboxes are looked up so often
+POLLING_MIN_SEC_INTERVAL: Final[int] = 10  # Busiest mailboxes are polled so often
+POLLING_MAX_SEC_INTERVAL: Final[int] = 300  # Mailboxes without new emails are polled so rarely
+POLLING_EXPECTED_EMAILS_PER_POLL: Final[float] = 0.5  # Poll interval is chosen to bring so many new emails (by rate)
+POLLING_RATE_SMOOTHING: Final[float] = 0.3  # EWMA weight of arrival rate observed by the last poll
+POLLING_MAX_BACKOFF_SEC: Final[int] = 30 * 60  # Max pause before polling mailbox failing in a row
+POLLING_SYNC_SEC_INTERVAL: Final[int] = 30  # Polled mailboxes are synced with database
+FETCHING_WORKERS_COUNT: Final[int] = 100  # Max mailboxes fetched simultaneously
+FETCHING_IN_BOT_PROCESS: Final[bool] = True  # False if mailboxes are fetched by separate `python -m app.fetcher`
+SHARD_HEARTBEAT_SEC_INTERVAL: Final[int] = 10  # Sharded fetchers check in & rebalance shards
+SHARD_WORKER_TTL_SEC: Final[int] = 30  # Sharded fetcher without heartbeat for so long is dead: its shard is taken
+DB_STREAM_BATCH_SIZE: Final[int] = 1000  # Rows fetched at once by streamed queries
+FETCHING_MAILBOX_TIMEOUT_SEC: Final[int] = 30  # Max time for one mailbox fetch (connect + search + publish)
+# Stage workers, one per subject partition (`email.<n>`, `rendered_email.<n>`). Mailbox's emails are handled in
+# order by one worker. Change only with drained stream: messages of removed partitions aren't consumed
+SENDERS_COUNT: Final[int] = 4  # Sender stage workers (Telegram)
+DOWNLOADERS_COUNT: Final[int] = 8  # Downloader stage workers (IMAP)
+PUBLISH_MAX_PENDING_ACKS: Final[int] = 64  # Published messages waiting for JetStream acknowledgement at once
+CONSUMER_FETCH_TIMEOUT_SEC: Final[int] = 30  # Long poll of consumer workers: server answers as soon as messages come
+CONSUMER_RESTART_PAUSE_SEC: Final[int] = 1  # Pause before restarting failed consumer worker
+TOPICS_CACHE_MAX_SIZE: Final[int] = 10000  # Forums' topics kept in memory by sender stage (LRU evicted above)
+TOPICS_CACHE_TTL_SEC: Final[int] = 60 * 60  # Cached topic is re-read from database after
+CHECKPOINTS_FLUSH_SEC_INTERVAL: Final[int] = 5  # Mailboxes progress is saved at least so often (within JetStream dedup window)
+CREDENTIALS_CACHE_MAX_SIZE: Final[int] = 10000  # Decrypted mailboxes' keys kept in memory
+CREDENTIALS_CACHE_TTL_SEC: Final[int] = 10 * 60  # Decrypted mailbox key is dropped after
+DELIVERY_LEDGER_RETENTION_HOURS: Final[int] = 7 * 24  # Delivered emails are remembered (must outlive redeliveries)
+DELIVERY_LEDGER_CLEANUP_SEC_INTERVAL: Final[int] = 60 * 60  # Expired delivered emails are removed
+IMAP_POOL_MAX_CONNECTIONS: Final[int] = 500  # Max kept-alive IMAP connections (LRU evicted above)
+IMAP_POOL_IDLE_TIMEOUT_SEC: Final[int] = 300  # Unused longer connections are closed
+IMAP_POOL_HEALTHCHECK_SEC: Final[int] = 30  # Connections unused longer are checked with NOOP before borrowing
+IMAP_POOL_DEDICATED_SESSIONS_SHARE: Final[float] = 0.8  # Of sessions limits may be held by IDLE sessions, the rest is borrowed
+IMAP_RECONNECT_BACKOFF_SEC: Final[float] = 0.1  # Initial pause between connection attempts, doubles every attempt
+IDLE_MODE_ENABLED: Final[bool] = True  # Watch mailboxes with IMAP IDLE instead of polling (where server supports)
+IDLE_RENEW_SEC: Final[int] = 25 * 60  # IDLE command is re-issued before servers' 29 minutes inactivity timeout
+IDLE_SYNC_SEC_INTERVAL: Final[int] = 60  # Watched mailboxes are synced with database
+IDLE_RESTART_MAX_BACKOFF_SEC: Final[int] = 300  # Max pause before restarting failed IDLE session
+IDLE_START_SPREAD_SEC: Final[int] = 60  # New mailboxes' IDLE sessions are started at random moments within it
+TWO_PHASE_FETCH_ENABLED: Final[bool] = True  # Post email text first, then download attachments one by one
+TELEGRAM_DOCUMENT_SIZE_LIMIT: Final[int] = 50 * 1024 * 1024  # Bot API upload limit. Bigger attachments are skipped
+ATTACHMENT_CHUNK_SIZE: Final[int] = 1024 * 1024  # Attachments are downloaded & decoded to disk by chunks
+ATTACHMENTS_MAX_AGE_HOURS: Final[int] = 24  # Downloaded attachments not sent for so long are removed as left over
+ATTACHMENTS_CLEANUP_SEC_INTERVAL: Final[int] = 60 * 60  # Left over attachments are looked for
+PARSING_PROCESSES_COUNT: Final[int] = 2  # Worker processes for MIME & HTML parsing. 0 parses in event loop
+HTML_TO_TEXT_ENGINE: Final[str] = "lxml"  # HTML email body parser: "lxml" (C) or "html.parser" (pure python)
+HTML_TEXT_MAX_SIZE: Final[int] = 30000  # Symbols of text rendered from HTML body. The rest of body is dropped
 MAX_EMAILS_COUNT_FOR_DEFAULT_USER: Final[int] = 1
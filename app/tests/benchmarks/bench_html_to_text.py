@@ -0,0 +1,72 @@
+"""
+Compares CPU time per HTML body of single-pass rendering engines with the former BeautifulSoup path, which
+concatenates text of every div. Former path needs dev dependency beautifulsoup4.
+
+    python -m app.tests.benchmarks.bench_html_to_text [--corpus DIR_WITH_EML_FILES] [--count 20] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from email import policy
+from email.parser import BytesParser
+from pathlib import Path
+from typing import Callable
+
+from app.services.email.imap.html_to_text import html_to_text
+from app.tests.benchmarks.bench_parsing import get_email_text_from_html_with_baseline
+from app.tests.benchmarks.corpus import get_html_body
+
+_BLOCKS_COUNTS = {"small": 3, "newsletter": 40, "huge": 2000}  # Synthetic bodies' sizes
+
+
+def load_html_bodies(corpus_dir: Path | None, count: int) -> dict[str, list[str]]:
+    """: Returns HTML bodies by kind: text/html parts of corpus_dir's .eml files or synthetic bodies of each size"""
+    if not corpus_dir:
+        random_ = random.Random(0)
+        return {kind: [get_html_body(random_, blocks_count) for _ in range(count)]
+                for kind, blocks_count in _BLOCKS_COUNTS.items()}
+
+    bodies = list()
+    for path in sorted(corpus_dir.glob("**/*.eml")):
+        message = BytesParser(policy=policy.default).parsebytes(path.read_bytes())
+        html_part = message.get_body(preferencelist=("html",))
+        if html_part is not None:
+            bodies.append(html_part.get_content())
+    return {"corpus": bodies}
+
+
+def main() -> None:
+    arguments_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    arguments_parser.add_argument("--corpus", type=Path, help="Directory with .eml files. Synthetic bodies by default")
+    arguments_parser.add_argument("--count", type=int, default=20, help="Synthetic bodies of each size")
+    arguments_parser.add_argument("--repeat", type=int, default=3, help="Best of so many runs is reported")
+    arguments = arguments_parser.parse_args()
+
+    renderers = {
+        "bs4 divs": get_email_text_from_html_with_baseline,
+        "lxml": lambda body: html_to_text(body, engine="lxml"),
+        "html.parser": lambda body: html_to_text(body, engine="html.parser"),
+    }
+    for kind, bodies in load_html_bodies(corpus_dir=arguments.corpus, count=arguments.count).items():
+        size = sum(map(len, bodies)) // max(len(bodies), 1) // 1024
+        print(f"{kind} ({len(bodies)} bodies, {size} KB on average):")
+        for name, render in renderers.items():
+            print(f"  {name + ':':<13}{_measure(render, bodies, repeat=arguments.repeat) * 1000:.3f} ms/body")
+
+
+def _measure(render: Callable[[str], str | None], bodies: list[str], repeat: int) -> float:
+    """: Returns the best CPU time per body"""
+    times = list()
+    for _ in range(repeat):
+        started_at = time.process_time()
+        for body in bodies:
+            render(body)
+        times.append((time.process_time() - started_at) / max(len(bodies), 1))
+    return min(times)
+
+
+if __name__ == "__main__":
+    main()
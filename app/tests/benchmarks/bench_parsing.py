@@ -0,0 +1,121 @@
+"""
+Compares CPU time per email of single-pass stdlib parsing with the former path: mailparser & email package parse
+the same bytes twice, then text part is decoded manually and HTML is rendered with BeautifulSoup.
+Attachments aren't saved by both paths. Former path needs dev dependencies: mail-parser & beautifulsoup4.
+
+    python -m app.tests.benchmarks.bench_parsing [--corpus DIR_WITH_EML_FILES] [--count 200] [--repeat 3]
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import codecs
+import email
+import quopri
+import re
+import time
+from pathlib import Path
+from typing import Callable
+
+import mailparser
+from bs4 import BeautifulSoup
+
+from app.services.email.imap import parser
+from app.settings.settings import EMAIL_NODE_SIZE
+from app.tests.benchmarks.corpus import load_emails
+
+
+def parse_email(mail_bytes: bytes) -> None:
+    parsed_email = parser.parse_email(mail_bytes)
+    if parsed_email.text:
+        parser.form_mail_text_nodes(parsed_email.text)
+
+
+def parse_email_with_baseline(mail_bytes: bytes) -> None:
+    """Former Mailbox.get_email parsing. Mailparser parses headers & decodes attachments eagerly"""
+    mailparser.parse_from_bytes(mail_bytes)
+    all_text = _get_email_text(email.message_from_bytes(mail_bytes))
+    if all_text:
+        _form_mail_text_nodes(all_text)
+
+
+def main() -> None:
+    arguments_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    arguments_parser.add_argument("--corpus", type=Path, help="Directory with .eml files. Synthetic emails by default")
+    arguments_parser.add_argument("--count", type=int, default=200, help="Synthetic emails of each kind")
+    arguments_parser.add_argument("--repeat", type=int, default=3, help="Best of so many runs is reported")
+    arguments = arguments_parser.parse_args()
+
+    for kind, emails in load_emails(corpus_dir=arguments.corpus, count=arguments.count).items():
+        baseline_time, baseline_errors_count = _measure(parse_email_with_baseline, emails, repeat=arguments.repeat)
+        new_time, new_errors_count = _measure(parse_email, emails, repeat=arguments.repeat)
+        size = sum(map(len, emails)) // max(len(emails), 1) // 1024
+        print(f"{kind} ({len(emails)} emails, {size} KB on average):\n"
+              f"  mailparser + bs4: {baseline_time * 1000:.3f} ms/email, {baseline_errors_count} failed\n"
+              f"  single pass:      {new_time * 1000:.3f} ms/email, {new_errors_count} failed")
+
+
+def _measure(parse: Callable[[bytes], None], emails: list[bytes], repeat: int) -> tuple[float, int]:
+    """: Returns the best CPU time per email & count of emails which weren't parsed"""
+    times, errors_count = list(), 0
+    for _ in range(repeat):
+        errors_count = 0
+        started_at = time.process_time()
+        for mail_bytes in emails:
+            try:
+                parse(mail_bytes)
+            except Exception:
+                errors_count += 1
+        times.append((time.process_time() - started_at) / max(len(emails), 1))
+    return min(times), errors_count
+
+
+# Former parser module as it was before single-pass parsing
+
+def _form_mail_text_nodes(text: str) -> list[str]:
+    max_characters = EMAIL_NODE_SIZE
+    text_builder = []
+    text = re.sub(" +", " ", text)
+    text = re.sub("\n+", "\n", text)
+    text = re.sub("\t+", "  ", text)
+    nodes_count = (len(text) // max_characters) + 1
+    for node_index in range(nodes_count):
+        text_builder.append(text[node_index * max_characters:(node_index + 1) * max_characters])
+    return text_builder
+
+
+def _get_email_text(msg) -> str | None:
+    parts = msg.walk() if msg.is_multipart() else (msg,)
+    for part in parts:
+        if part.get_content_maintype() == "text":
+            extract_part = _get_letter_type(part)
+            if part.get_content_subtype() == "html":
+                letter_text = get_email_text_from_html_with_baseline(extract_part)
+            else:
+                letter_text = extract_part.strip()
+            if letter_text:
+                return letter_text.replace("<", "").replace(">", "").replace("\xa0", " ")
+            return None
+    return None
+
+
+def get_email_text_from_html_with_baseline(body: str) -> str:
+    body = body.replace("<div><div>", "<div>").replace("</div></div>", "</div>")
+    soup = BeautifulSoup(body, "html.parser")
+    text = ""
+    for paragraph in soup.find_all("div"):
+        text += paragraph.text + "\n"
+    return text.replace("\xa0", " ")
+
+
+def _get_letter_type(part) -> str:
+    if part["Content-Transfer-Encoding"] == "base64":
+        return codecs.decode(base64.b64decode(part.get_payload()))
+    elif part["Content-Transfer-Encoding"] == "quoted-printable":
+        return codecs.decode(quopri.decodestring(part.get_payload()))
+    return part.get_payload()
+
+
+if __name__ == "__main__":
+    main()
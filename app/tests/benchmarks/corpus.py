@@ -0,0 +1,78 @@
+"""Emails for benchmarks: real ones from directory of .eml files or synthetic ones, similar to typical inbox"""
+
+from __future__ import annotations
+
+import random
+from email.message import EmailMessage
+from pathlib import Path
+
+_WORDS = ("привет", "отчёт", "meeting", "invoice", "the", "and", "за", "неделю", "schedule", "update", "please",
+          "review", "документ", "attached", "скидка", "offer", "today", "завтра", "project", "release")
+
+
+def load_emails(corpus_dir: Path | None, count: int) -> dict[str, list[bytes]]:
+    """: Returns raw emails by kind: all .eml files of corpus_dir as "corpus", otherwise count synthetic emails of each kind"""
+    if corpus_dir:
+        return {"corpus": [path.read_bytes() for path in sorted(corpus_dir.glob("**/*.eml"))]}
+
+    random_ = random.Random(0)
+    return {
+        "plain": [_get_plain_email(random_) for _ in range(count)],
+        "html newsletter": [_get_html_email(random_) for _ in range(count)],
+        "with attachments": [_get_email_with_attachments(random_) for _ in range(count)]
+    }
+
+
+def get_html_body(random_: random.Random, blocks_count: int) -> str:
+    """: Returns newsletter-like HTML: nested layout tables & divs, links, lists, styles & hidden preheader"""
+    blocks = list()
+    for index in range(blocks_count):
+        blocks.append(
+            f"<tr><td style='padding:10px'><div><div><h2>{_get_text(random_, 5)}</h2>"
+            f"<p>{_get_text(random_, 60)}<br>{_get_text(random_, 30)}</p>"
+            f"<ul><li>{_get_text(random_, 8)}</li><li>{_get_text(random_, 8)}</li></ul>"
+            f"<a href='https://example.com/item/{index}'>{_get_text(random_, 3)}</a></div></div></td></tr>"
+        )
+    return (
+        "<html><head><style>td {font-family: Arial;} .hidden {display: none;}</style></head><body>"
+        f"<div style='display:none'>{_get_text(random_, 20)}</div>"
+        f"<table width='600'>{''.join(blocks)}</table>"
+        "<script>track();</script></body></html>"
+    )
+
+
+def _get_plain_email(random_: random.Random) -> bytes:
+    message = _get_message(random_)
+    message.set_content("\n\n".join(_get_text(random_, 80) for _ in range(random_.randint(1, 10))),
+                        cte="quoted-printable")
+    return message.as_bytes()
+
+
+def _get_html_email(random_: random.Random) -> bytes:
+    message = _get_message(random_)
+    html_body = get_html_body(random_, blocks_count=random_.randint(5, 40))
+    message.set_content(html_body, subtype="html", charset="utf-8", cte="base64")
+    return message.as_bytes()
+
+
+def _get_email_with_attachments(random_: random.Random) -> bytes:
+    message = _get_message(random_)
+    message.set_content(_get_text(random_, 100), cte="base64")
+    message.add_alternative(f"<p>{_get_text(random_, 100)}</p>", subtype="html")
+    for index in range(random_.randint(1, 3)):
+        message.add_attachment(random_.randbytes(random_.randint(10, 500) * 1024), maintype="application",
+                               subtype="pdf", filename=f"документ {index}.pdf")
+    return message.as_bytes()
+
+
+def _get_message(random_: random.Random) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = f"Отправитель {random_.randint(1, 100)} <sender@example.com>"
+    message["To"] = "user@example.com"
+    message["Subject"] = _get_text(random_, 6)
+    message["Date"] = "Tue, 15 Aug 2023 10:00:00 +0300"
+    return message
+
+
+def _get_text(random_: random.Random, words_count: int) -> str:
+    return " ".join(random_.choices(_WORDS, k=words_count)).capitalize() + "."
@@ -0,0 +1,28 @@
+import configparser
+
+import pytest
+from cryptography.fernet import Fernet
+
+from app.settings import paths
+
+_CONFIG_FILE_PATH = paths.ROOT_DIR / "app.ini"
+_CONFIG_EXAMPLE_FILE_PATH = paths.ROOT_DIR / "app.ini.example"
+_CONFIG_CREATED = pytest.StashKey[bool]()  # app.ini is written by tests & removed after them
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    """Config module reads app.ini at import: without one tests use app.ini.example with generated fernet key"""
+    if _CONFIG_FILE_PATH.exists():
+        return
+
+    app_config = configparser.ConfigParser()
+    app_config.read(_CONFIG_EXAMPLE_FILE_PATH)
+    app_config["mail"]["fernet_key"] = Fernet.generate_key().decode()
+    with open(_CONFIG_FILE_PATH, "w") as config_file:
+        app_config.write(config_file)
+    config.stash[_CONFIG_CREATED] = True
+
+
+def pytest_unconfigure(config: pytest.Config) -> None:
+    if config.stash.get(_CONFIG_CREATED, False):
+        _CONFIG_FILE_PATH.unlink(missing_ok=True)
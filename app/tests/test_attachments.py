@@ -0,0 +1,31 @@
+import base64
+import logging
+from pathlib import Path
+
+import pytest
+
+from app.services.email.imap.attachments import AttachmentWriter
+
+_CONTENT = b"%PDF-1.4 attachment"
+
+
+def _write(path: Path, chunks: list[bytes]) -> bytes:
+    with AttachmentWriter(path=str(path), encoding="base64") as writer:
+        for chunk in chunks:
+            writer.write(chunk)
+    return path.read_bytes()
+
+
+@pytest.mark.parametrize("content", [_CONTENT, _CONTENT[:-1], _CONTENT[:-2]],
+                         ids=["two_symbols_tail", "no_tail", "three_symbols_tail"])
+def test_base64_tail_without_padding_is_decoded(content: bytes, tmp_path: Path):
+    encoded = base64.b64encode(content).rstrip(b"=")
+    chunks = [encoded[:5], b"\r\n", encoded[5:]]  # Chunks aren't aligned to 4 symbols
+    assert _write(tmp_path / "attachment.pdf", chunks) == content
+
+
+def test_broken_base64_tail_is_logged(tmp_path: Path, caplog: pytest.LogCaptureFixture):
+    encoded = base64.b64encode(_CONTENT[:-1])
+    with caplog.at_level(logging.WARNING):
+        assert _write(tmp_path / "attachment.pdf", [encoded, b"Q"]) == _CONTENT[:-1]
+    assert "broken base64 tail" in caplog.text
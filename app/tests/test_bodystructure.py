@@ -0,0 +1,76 @@
+from app.services.email.imap.bodystructure import BodyPart, parse_body_structure, parse_fetch_response
+
+_MIXED_BODY_STRUCTURE = (
+    b'(("TEXT" "PLAIN" ("CHARSET" "utf-8") NIL NIL "QUOTED-PRINTABLE" 120 4 NIL NIL NIL NIL)'
+    b'(("TEXT" "HTML" ("CHARSET" "windows-1251") NIL NIL "BASE64" 800 11 NIL NIL NIL NIL)'
+    b'("IMAGE" "PNG" ("NAME" "logo.png") "<logo>" NIL "BASE64" 400 NIL ("INLINE" NIL) NIL NIL) "RELATED" NIL NIL NIL)'
+    b'("APPLICATION" "PDF" ("NAME" "=?utf-8?B?0L7RgtGH0LXRgi5wZGY=?=") NIL NIL "BASE64" 4000 NIL '
+    b'("ATTACHMENT" ("FILENAME*" "utf-8\'\'%D1%81%D1%87%D0%B5%D1%82.pdf")) NIL NIL)'
+    b' "MIXED" ("BOUNDARY" "b1") NIL NIL NIL)'
+)
+
+
+def _get_body_structure(body_structure: bytes) -> tuple[BodyPart, ...]:
+    response_data = [b"1 FETCH (UID 5 BODYSTRUCTURE " + body_structure + b")", b"Fetch completed"]
+    attributes, = parse_fetch_response(response_data)
+    return parse_body_structure(attributes["BODYSTRUCTURE"])
+
+
+def test_fetch_response_attributes():
+    response_data = [
+        b"1 FETCH (UID 5 FLAGS (\\Seen) BODY[1] {11}", bytearray(b"Hello (world"), b")",
+        b'2 FETCH (UID 7 BODY[HEADER.FIELDS (SUBJECT)] "Subject: \\"quoted\\"" BODY[2]<0> NIL)',
+        b"Fetch completed"
+    ]
+
+    first_message, second_message = parse_fetch_response(response_data)
+
+    assert first_message == {"UID": b"5", "FLAGS": [b"\\Seen"], "BODY[1]": b"Hello (world"}
+    assert second_message == {
+        "UID": b"7", "BODY[HEADER.FIELDS (SUBJECT)]": b'Subject: "quoted"', "BODY[2]<0>": None
+    }
+
+
+def test_fetch_response_without_messages():
+    assert list(parse_fetch_response([b"Fetch completed"])) == []
+
+
+def test_single_part_body_structure():
+    parts = _get_body_structure(b'("TEXT" "PLAIN" ("CHARSET" "UTF-8") NIL NIL "7BIT" 42 3 NIL NIL NIL NIL)')
+
+    assert parts == (BodyPart(number="1", content_type="text/plain", encoding="7bit", size=42, charset="UTF-8"),)
+
+
+def test_nested_multipart_body_structure():
+    parts = _get_body_structure(_MIXED_BODY_STRUCTURE)
+
+    assert [part.number for part in parts] == ["1", "2.1", "2.2", "3"]
+    plain_part, html_part, image_part, pdf_part = parts
+    assert (plain_part.content_type, plain_part.encoding, plain_part.charset) == ("text/plain", "quoted-printable", "utf-8")
+    assert not plain_part.is_attachment
+    assert (html_part.content_type, html_part.charset, html_part.is_attachment) == ("text/html", "windows-1251", False)
+    assert (image_part.filename, image_part.is_attachment) == ("logo.png", True)
+    assert pdf_part.decoded_size == 3000
+
+
+def test_attachment_filename_encodings():
+    """RFC 2231 filename of disposition is preferred over RFC 2047 encoded name of content type"""
+    pdf_part = _get_body_structure(_MIXED_BODY_STRUCTURE)[-1]
+    assert pdf_part.filename == "счет.pdf"
+
+    encoded_name_part, = _get_body_structure(
+        b'("APPLICATION" "PDF" ("NAME" "=?utf-8?B?0L7RgtGH0LXRgi5wZGY=?=") NIL NIL "BASE64" 4000 NIL NIL NIL NIL)'
+    )
+    assert encoded_name_part.filename == "отчет.pdf"
+
+
+def test_attached_email_body_structure():
+    parts = _get_body_structure(
+        b'(("TEXT" "PLAIN" NIL NIL NIL "7BIT" 10 1 NIL NIL NIL NIL)'
+        b'("MESSAGE" "RFC822" NIL NIL NIL "7BIT" 300 (NIL "Subject" NIL NIL NIL NIL NIL NIL NIL NIL) '
+        b'("TEXT" "PLAIN" NIL NIL NIL "7BIT" 5 1 NIL NIL NIL NIL) 12 NIL NIL NIL NIL) "MIXED" NIL NIL NIL)'
+    )
+
+    assert [(part.number, part.content_type, part.filename, part.is_attachment) for part in parts] == [
+        ("1", "text/plain", None, False), ("2", "message/rfc822", "message.eml", True)
+    ]
@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import nullcontext
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from aiogram.exceptions import TelegramNetworkError
+from ormsgpack import ormsgpack
+
+from app.dtos.incoming_email import IncomingEmailMessageDTO, RenderedEmailMessageDTO
+from app.services.broker import broadcaster
+from app.services.email.base.entities import IncomingEmail
+from app.settings import settings
+
+
+class _PulledMessage:
+    def __init__(self, mailbox_email_id: int, is_attachments: bool = False, attachments_paths: list[str] | None = None,
+                 num_delivered: int = 1) -> None:
+        self.data = ormsgpack.packb(dict(
+            user_id=1, forum_id=-100, mailbox_email_id=mailbox_email_id, from_name="", from_address="sender@gmail.com",
+            to_="user@gmail.com", email_db_id=7, uid_validity=5, text=None if is_attachments else ["Text"],
+            attachments_paths=attachments_paths, is_attachments=is_attachments
+        ))
+        self.metadata = SimpleNamespace(num_delivered=num_delivered)
+        self.result = None
+
+    async def ack(self) -> None:
+        self.result = "ack"
+
+    async def nak(self, delay: float | None = None) -> None:
+        self.result = ("nak", delay)
+
+    async def term(self) -> None:
+        self.result = "term"
+
+
+class _Ledger:
+    """In-memory DeliveredEmailDAO"""
+
+    delivered_emails: dict[tuple[int, int, int, bool], int | None] = dict()
+
+    def __init__(self, session: object) -> None:
+        pass
+
+    async def get_delivered_emails(self, emails) -> dict[tuple[int, int, int, bool], int | None]:
+        return {email: self.delivered_emails[email] for email in emails if email in self.delivered_emails}
+
+    async def add_delivered_emails(self, emails: dict[tuple[int, int, int, bool], int | None]) -> None:
+        self.delivered_emails.update(emails)
+
+
+@pytest.fixture
+def sent_emails(monkeypatch: pytest.MonkeyPatch) -> list[tuple[str, bool, int | None]]:
+    """Sent emails' (mailbox email id, is attachments, replied message id). Sent text gets message id 100 + email id"""
+    sent_emails = list()
+
+    async def send_email(email, is_attachments: bool, reply_to_message_id: int | None, **kwargs) -> int | None:
+        sent_emails.append((email.id_, is_attachments, reply_to_message_id))
+        return None if is_attachments else 100 + int(email.id_)
+
+    monkeypatch.setattr(broadcaster, "_send_email", send_email)
+    monkeypatch.setattr(_Ledger, "delivered_emails", dict())
+    monkeypatch.setattr(broadcaster, "DeliveredEmailDAO", _Ledger)
+    return sent_emails
+
+
+def _broadcast(pulled_messages: list[_PulledMessage]) -> None:
+    asyncio.run(broadcaster.broadcast_incoming_emails(
+        pulled_email_messages=pulled_messages, bot=None, session_pool=lambda: nullcontext(), topics_cache=None
+    ))
+
+
+def test_rendered_email_is_unpacked():
+    email = IncomingEmail(id_="10", from_name="Sender", from_address="sender@gmail.com", to_="user@gmail.com",
+                          text=["Text"], attachments_paths=("/nonexistent/10/2",))
+    email_message = IncomingEmailMessageDTO(user_id=1, mailbox_email_id=10, forum_id=-100, email_db_id=7, uid_validity=5)
+    rendered_email = RenderedEmailMessageDTO.from_incoming_email(email=email, email_message=email_message)
+    pulled_message = SimpleNamespace(data=ormsgpack.packb(rendered_email))
+    assert broadcaster._unpack_email_message(pulled_message) == rendered_email
+
+
+def test_redelivered_email_isnt_sent_again(sent_emails: list[tuple[str, bool, int | None]]):
+    _broadcast([_PulledMessage(mailbox_email_id=10)])
+    redelivered_messages = [_PulledMessage(mailbox_email_id=10, num_delivered=2), _PulledMessage(mailbox_email_id=11)]
+    _broadcast(redelivered_messages)
+    assert sent_emails == [("10", False, None), ("11", False, None)]
+    assert [pulled_message.result for pulled_message in redelivered_messages] == ["ack", "ack"]
+
+
+def test_attachments_follow_up_replies_to_its_text(sent_emails: list[tuple[str, bool, int | None]]):
+    _broadcast([_PulledMessage(mailbox_email_id=10)])
+    _broadcast([_PulledMessage(mailbox_email_id=10, is_attachments=True, attachments_paths=["/nonexistent/10/2"]),
+                _PulledMessage(mailbox_email_id=10, is_attachments=True, attachments_paths=["/nonexistent/10/2"])])
+    assert sent_emails == [("10", False, None), ("10", True, 110)]
+
+
+@pytest.mark.parametrize("num_delivered, result, attachment_kept", [
+    (1, ("nak", settings.BROADCAST_RETRY_DELAY_SEC), True),
+    (settings.BROADCAST_MAX_DELIVERIES, "term", False),
+])
+def test_not_sent_email_is_redelivered_with_attachments(num_delivered: int, result: tuple | str, attachment_kept: bool,
+                                                        sent_emails: list, tmp_path: Path,
+                                                        monkeypatch: pytest.MonkeyPatch):
+    async def send_email(email, **kwargs) -> int:
+        if email.id_ == "11":
+            raise TelegramNetworkError(method=None, message="Connection reset")
+        return 100 + int(email.id_)
+
+    monkeypatch.setattr(broadcaster, "_send_email", send_email)
+    attachment_path = tmp_path / "attachment.pdf"
+    attachment_path.write_bytes(b"%PDF")
+    pulled_messages = [_PulledMessage(mailbox_email_id=10),
+                       _PulledMessage(mailbox_email_id=11, attachments_paths=[str(attachment_path)],
+                                      num_delivered=num_delivered)]
+    _broadcast(pulled_messages)
+    assert [pulled_message.result for pulled_message in pulled_messages] == ["ack", result]
+    assert attachment_path.exists() == attachment_kept
+    assert list(_Ledger.delivered_emails) == [(7, 5, 10, False)]
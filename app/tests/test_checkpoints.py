@@ -0,0 +1,46 @@
+from app.dtos.email import MailboxCheckpointDTO, UserEmailDTO
+from app.services.broker.checkpoints import _merge, merge_progress
+
+
+def _get_email(last_email_id: int, uid_validity: int | None, highest_modseq: int | None = None) -> UserEmailDTO:
+    return UserEmailDTO(user_id=1, mail_server="imap.gmail.com", mail_address="user@gmail.com", mail_auth_key="key",
+                        last_email_id=last_email_id, forum_id=-100, email_db_id=1, uid_validity=uid_validity,
+                        highest_modseq=highest_modseq)
+
+
+def test_merge_keeps_the_latest_progress():
+    old = MailboxCheckpointDTO(email_db_id=1, last_email_id=10, uid_validity=5, highest_modseq=100)
+    new = MailboxCheckpointDTO(email_db_id=1, last_email_id=8, uid_validity=5, highest_modseq=120)
+    assert _merge(old, new) == MailboxCheckpointDTO(email_db_id=1, last_email_id=10, uid_validity=5, highest_modseq=120)
+
+
+def test_merge_keeps_known_uid_validity_and_modseq():
+    old = MailboxCheckpointDTO(email_db_id=1, last_email_id=10, uid_validity=5, highest_modseq=100)
+    new = MailboxCheckpointDTO(email_db_id=1, last_email_id=12)
+    assert _merge(old, new) == MailboxCheckpointDTO(email_db_id=1, last_email_id=12, uid_validity=5, highest_modseq=100)
+
+
+def test_merge_replaces_progress_of_old_uid_validity():
+    old = MailboxCheckpointDTO(email_db_id=1, last_email_id=1000, uid_validity=5, highest_modseq=100)
+    new = MailboxCheckpointDTO(email_db_id=1, last_email_id=3, uid_validity=6)
+    assert _merge(old, new) == new
+
+
+def test_merge_progress_keeps_the_latest_progress():
+    merged_email = merge_progress(stored_email=_get_email(last_email_id=20, uid_validity=5, highest_modseq=None),
+                                  handled_email=_get_email(last_email_id=15, uid_validity=5, highest_modseq=300))
+    assert (merged_email.last_email_id, merged_email.highest_modseq) == (20, 300)
+
+    merged_email = merge_progress(stored_email=_get_email(last_email_id=20, uid_validity=5),
+                                  handled_email=_get_email(last_email_id=25, uid_validity=5))
+    assert merged_email.last_email_id == 25
+
+
+def test_merge_progress_of_different_uid_validity():
+    stored_email = _get_email(last_email_id=2, uid_validity=6)
+    assert merge_progress(stored_email=stored_email, handled_email=_get_email(last_email_id=90, uid_validity=5)) == \
+        stored_email
+
+    legacy_email = _get_email(last_email_id=90, uid_validity=None)
+    merged_email = merge_progress(stored_email=legacy_email, handled_email=_get_email(last_email_id=7, uid_validity=6))
+    assert (merged_email.last_email_id, merged_email.uid_validity) == (7, 6)
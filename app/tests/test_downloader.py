@@ -0,0 +1,165 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+
+import pytest
+from nats.js.api import PubAck
+from ormsgpack import ormsgpack
+
+from app.dtos.email import UserEmailDTO
+from app.exceptions import EmailFetchError
+from app.services.broker import downloader
+from app.services.email.base.entities import IncomingEmail
+from app.settings import settings
+
+_USER_EMAIL = UserEmailDTO(user_id=1, mail_server="imap.gmail.com", mail_address="user@gmail.com",
+                           mail_auth_key="key", forum_id=-100, email_db_id=7, uid_validity=5)
+
+
+class _PulledMessage:
+    def __init__(self, mailbox_email_id: int, num_delivered: int = 1) -> None:
+        self.data = ormsgpack.packb(dict(user_id=1, mailbox_email_id=mailbox_email_id, forum_id=-100, email_db_id=7,
+                                         uid_validity=5))
+        self.metadata = SimpleNamespace(num_delivered=num_delivered)
+        self.result = None
+
+    async def ack(self) -> None:
+        self.result = "ack"
+
+    async def nak(self, delay: float | None = None) -> None:
+        self.result = ("nak", delay)
+
+    async def term(self) -> None:
+        self.result = "term"
+
+
+class _Pool:
+    def __init__(self, client: object | None) -> None:
+        self._client = client
+
+    @asynccontextmanager
+    async def borrow(self, user_email: UserEmailDTO, attempts_count: int):
+        yield self._client
+
+
+class _Mailbox:
+    def __init__(self, emails_ids: set[str] | None = None, attachments_count: int = 0,
+                 failed_attachment_email_id: str | None = None) -> None:
+        self._emails_ids = emails_ids  # None if server doesn't answer OK
+        self._attachments_count = attachments_count  # Of every email
+        self._failed_attachment_email_id = failed_attachment_email_id
+
+    async def get_emails(self, emails_ids: list[str]) -> dict[str, IncomingEmail]:
+        if self._emails_ids is None:
+            raise EmailFetchError("NO")
+        return {email_id: IncomingEmail(id_=email_id, from_name="", from_address="sender@gmail.com",
+                                        to_="user@gmail.com")
+                for email_id in emails_ids if email_id in self._emails_ids}
+
+    async def get_emails_structures(self, emails_ids: list[str]) -> dict[str, SimpleNamespace]:
+        if self._emails_ids is None:
+            raise EmailFetchError("NO")
+        parts = [SimpleNamespace(number=str(number)) for number in range(2, 2 + self._attachments_count)]
+        return {email_id: SimpleNamespace(get_attachments_parts=lambda: parts)
+                for email_id in emails_ids if email_id in self._emails_ids}
+
+    async def get_email_preview(self, email_id: str, structure: SimpleNamespace) -> IncomingEmail:
+        return IncomingEmail(id_=email_id, from_name="", from_address="sender@gmail.com", to_="user@gmail.com",
+                             text=["Text"])
+
+    async def save_attachment(self, email_id: str, part: SimpleNamespace) -> str:
+        if email_id == self._failed_attachment_email_id:
+            raise EmailFetchError("NO")
+        return f"/nonexistent/{email_id}/{part.number}"
+
+
+class _JetStream:
+    def __init__(self, failed_msg_ids: set[str] = frozenset()) -> None:
+        self._failed_msg_ids = failed_msg_ids
+        self.published_msg_ids = list()
+        self.published_messages = list()
+
+    async def publish(self, subject: str, payload: bytes, headers: dict) -> PubAck:
+        msg_id = headers["Nats-Msg-Id"]
+        if msg_id in self._failed_msg_ids:
+            raise TimeoutError
+        self.published_msg_ids.append(msg_id)
+        self.published_messages.append(ormsgpack.unpackb(payload))
+        return PubAck(stream="rendered_emails", seq=len(self.published_msg_ids))
+
+
+@pytest.fixture(params=[True, False], ids=["two_phases", "one_phase"])
+def two_phase_fetch(request: pytest.FixtureRequest, monkeypatch: pytest.MonkeyPatch) -> bool:
+    monkeypatch.setattr(settings, "TWO_PHASE_FETCH_ENABLED", request.param)
+    return request.param
+
+
+def _download(pulled_messages: list[_PulledMessage], mailbox: _Mailbox | None, jetstream: _JetStream,
+              monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(downloader, "_build_mailbox", lambda **kwargs: mailbox)
+    mailbox_messages = [(pulled_message, downloader._unpack_email_message(pulled_message))
+                        for pulled_message in pulled_messages]
+    asyncio.run(downloader._download_mailbox_emails(
+        jetstream=jetstream, user_email=_USER_EMAIL, imap_pool=_Pool(client=mailbox and object()),
+        parsing_pool=None, mailbox_messages=mailbox_messages
+    ))
+
+
+def test_published_and_removed_emails_are_acknowledged(two_phase_fetch: bool, monkeypatch: pytest.MonkeyPatch):
+    pulled_messages = [_PulledMessage(mailbox_email_id=10), _PulledMessage(mailbox_email_id=11)]
+    jetstream = _JetStream()
+    _download(pulled_messages, mailbox=_Mailbox(emails_ids={"10"}), jetstream=jetstream, monkeypatch=monkeypatch)
+    assert jetstream.published_msg_ids == ["7.5.10"]
+    assert [pulled_message.result for pulled_message in pulled_messages] == ["ack", "ack"]
+
+
+def test_not_connected_mailbox_emails_are_redelivered(two_phase_fetch: bool, monkeypatch: pytest.MonkeyPatch):
+    pulled_messages = [_PulledMessage(mailbox_email_id=10)]
+    _download(pulled_messages, mailbox=None, jetstream=_JetStream(), monkeypatch=monkeypatch)
+    assert pulled_messages[0].result == ("nak", settings.DOWNLOAD_RETRY_DELAY_SEC)
+
+
+def test_not_fetched_emails_are_redelivered_then_dropped(two_phase_fetch: bool, monkeypatch: pytest.MonkeyPatch):
+    pulled_messages = [_PulledMessage(mailbox_email_id=10),
+                       _PulledMessage(mailbox_email_id=11, num_delivered=settings.DOWNLOAD_MAX_DELIVERIES)]
+    _download(pulled_messages, mailbox=_Mailbox(emails_ids=None), jetstream=_JetStream(), monkeypatch=monkeypatch)
+    assert [pulled_message.result for pulled_message in pulled_messages] == [
+        ("nak", settings.DOWNLOAD_RETRY_DELAY_SEC), "term"
+    ]
+
+
+def test_not_published_emails_are_redelivered(two_phase_fetch: bool, monkeypatch: pytest.MonkeyPatch):
+    pulled_messages = [_PulledMessage(mailbox_email_id=10), _PulledMessage(mailbox_email_id=11)]
+    _download(pulled_messages, mailbox=_Mailbox(emails_ids={"10", "11"}), jetstream=_JetStream({"7.5.11"}),
+              monkeypatch=monkeypatch)
+    assert [pulled_message.result for pulled_message in pulled_messages] == [
+        "ack", ("nak", settings.DOWNLOAD_RETRY_DELAY_SEC)
+    ]
+
+
+def test_text_is_published_before_attachments(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "TWO_PHASE_FETCH_ENABLED", True)
+    pulled_messages = [_PulledMessage(mailbox_email_id=10), _PulledMessage(mailbox_email_id=11)]
+    jetstream = _JetStream()
+    _download(pulled_messages, mailbox=_Mailbox(emails_ids={"10", "11"}, attachments_count=2), jetstream=jetstream,
+              monkeypatch=monkeypatch)
+    assert jetstream.published_msg_ids == ["7.5.10", "7.5.10.attachments", "7.5.11", "7.5.11.attachments"]
+    text_message, attachments_message = jetstream.published_messages[:2]
+    assert (text_message["text"], text_message["attachments_paths"], text_message["is_attachments"]) == \
+        (["Text"], None, False)
+    assert (attachments_message["text"], attachments_message["attachments_paths"],
+            attachments_message["is_attachments"]) == (None, ["/nonexistent/10/2", "/nonexistent/10/3"], True)
+    assert [pulled_message.result for pulled_message in pulled_messages] == ["ack", "ack"]
+
+
+def test_email_with_not_downloaded_attachments_is_redelivered(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "TWO_PHASE_FETCH_ENABLED", True)
+    pulled_messages = [_PulledMessage(mailbox_email_id=10), _PulledMessage(mailbox_email_id=11)]
+    jetstream = _JetStream()
+    _download(pulled_messages, mailbox=_Mailbox(emails_ids={"10", "11"}, attachments_count=1,
+                                                failed_attachment_email_id="11"),
+              jetstream=jetstream, monkeypatch=monkeypatch)
+    assert jetstream.published_msg_ids == ["7.5.10", "7.5.10.attachments", "7.5.11"]
+    assert [pulled_message.result for pulled_message in pulled_messages] == [
+        "ack", ("nak", settings.DOWNLOAD_RETRY_DELAY_SEC)
+    ]
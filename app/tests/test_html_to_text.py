@@ -0,0 +1,73 @@
+import pytest
+
+from app.services.email.imap.html_to_text import html_to_text
+
+_ENGINES = ("lxml", "html.parser")
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_blocks_are_separated(engine: str):
+    body = (
+        "<html><body><h1>Title</h1><p>First  paragraph\n with <b>bold</b> text.</p>"
+        "<div>Line<br>break</div><div>Next line</div>Text outside of divs</body></html>"
+    )
+    assert html_to_text(body, engine=engine) == (
+        "Title\n\nFirst paragraph with bold text.\n\nLine\nbreak\nNext line\nText outside of divs"
+    )
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_lists_and_tables(engine: str):
+    body = (
+        "<ul><li>Apples</li><li>Pears</li></ul>"
+        "<ol><li>First</li><li>Second</li></ol>"
+        "<table><tr><th>Name</th><th>Price</th></tr><tr><td>Tea</td><td>5</td></tr></table>"
+    )
+    assert html_to_text(body, engine=engine) == (
+        "• Apples\n• Pears\n\n1. First\n2. Second\n\nName | Price\nTea | 5"
+    )
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_links_addresses_are_kept(engine: str):
+    body = (
+        "<p><a href='https://example.com/offer'>Open offer</a>, "
+        "<a href='https://example.com'>https://example.com</a>, <a href='mailto:a@example.com'>write us</a></p>"
+    )
+    assert html_to_text(body, engine=engine) == (
+        "Open offer (https://example.com/offer), https://example.com, write us"
+    )
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_invisible_elements_are_skipped(engine: str):
+    body = (
+        "<html><head><title>Title</title><style>p {color: red}</style></head><body>"
+        "<div style='display: none'>Preheader <div>nested</div></div>"
+        "<span hidden>Hidden</span><div aria-hidden='true'>Aria hidden</div>"
+        "<script>var text = '<p>script</p>';</script><!-- comment -->"
+        "<p>Visible</p><img src='pixel.gif'>After image</body></html>"
+    )
+    assert html_to_text(body, engine=engine) == "Visible\n\nAfter image"
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_preformatted_text_keeps_whitespaces(engine: str):
+    assert html_to_text("<p>a   b</p><pre>x   y\n  z</pre>", engine=engine) == "a b\n\nx   y\n  z"
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_broken_and_empty_documents(engine: str):
+    assert html_to_text("", engine=engine) == ""
+    assert html_to_text("<div><p>Unclosed <b>tags", engine=engine) == "Unclosed tags"
+    assert html_to_text("Plain &amp; text &nbsp;without tags", engine=engine) == "Plain & text without tags"
+
+
+@pytest.mark.parametrize("engine", _ENGINES)
+def test_text_is_capped(engine: str):
+    body = "<div>" + ("<p>" + "word " * 20 + "</p>") * 10000 + "</div>"
+
+    text = html_to_text(body, engine=engine, max_size=1000)
+
+    assert len(text) <= 1000
+    assert text.startswith("word word")
@@ -0,0 +1,32 @@
+from app.services.email.imap.fetcher.mailbox import BroadcastMailbox
+
+
+def test_search_response_ids():
+    response_data = [b"SEARCH 12 3 7", b"SEARCH 15", b"Search completed (0.001 + 0.000 secs)."]
+    assert BroadcastMailbox._get_emails_ids_from_response(response_data) == [3, 7, 12, 15]
+
+
+def test_search_response_ids_skip_other_untagged_lines():
+    """Servers may send mailbox updates with response: their numbers aren't UIDs"""
+    response_data = ["3 EXISTS", b"1 RECENT", b"search 10 11", b"2 FETCH (FLAGS (\\Seen))", b"SEARCH completed 4"]
+    assert BroadcastMailbox._get_emails_ids_from_response(response_data) == [10, 11]
+
+
+def test_empty_search_response():
+    assert BroadcastMailbox._get_emails_ids_from_response([b"SEARCH", b"Search completed."]) == []
+    assert BroadcastMailbox._get_emails_ids_from_response([b"Search completed."]) == []
+
+
+def test_select_response_items():
+    response_data = [b"FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)", b"40 EXISTS", b"0 RECENT",
+                     b"OK [UNSEEN 12] Message 12 is first unseen", b"OK [UIDVALIDITY 1690000000] UIDs valid",
+                     b"OK [UIDNEXT 42] Predicted next UID", b"OK [HIGHESTMODSEQ 123456] Highest",
+                     b"[READ-WRITE] SELECT completed"]
+    items = BroadcastMailbox._get_select_items_from_response(response_data)
+    assert (items["EXISTS"], items["UIDVALIDITY"], items["UIDNEXT"], items["HIGHESTMODSEQ"]) == (40, 1690000000, 42, 123456)
+
+
+def test_select_response_items_without_condstore():
+    response_data = [b"3 EXISTS", b"OK [UIDVALIDITY 5] UIDs valid", b"OK [NOMODSEQ] No permanent modsequences",
+                     b"[READ-WRITE] SELECT completed"]
+    assert BroadcastMailbox._get_select_items_from_response(response_data) == {"EXISTS": 3, "UIDVALIDITY": 5}
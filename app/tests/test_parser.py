@@ -0,0 +1,96 @@
+from email.message import EmailMessage
+
+from app.services.email.imap import parser
+from app.services.email.imap.attachments import _get_filename
+from app.settings.settings import EMAIL_TEXT_MAX_SIZE
+
+
+def _get_utf16_size(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def test_short_text_is_one_node():
+    assert parser.form_mail_text_nodes("  Hello,\t\tworld!  \n\n\n\nBye \n ") == ["Hello,  world!\n\nBye"]
+
+
+def test_empty_text_has_no_nodes():
+    assert parser.form_mail_text_nodes(" \n\n ") == []
+
+
+def test_text_is_split_on_paragraphs():
+    paragraphs = ["Paragraph " + str(index) + ". " + "word " * 30 for index in range(10)]
+    nodes = parser.form_mail_text_nodes("\n\n".join(paragraphs), max_size=400)
+
+    assert all(_get_utf16_size(node) <= 400 for node in nodes)
+    assert all(node.endswith("word") for node in nodes)
+    assert "\n\n".join(nodes).replace("\n\n", "") == "".join(paragraph.strip() for paragraph in paragraphs)
+
+
+def test_text_without_spaces_is_split_by_size():
+    nodes = parser.form_mail_text_nodes("a" * 250, max_size=100)
+    assert [len(node) for node in nodes] == [100, 100, 50]
+
+
+def test_nodes_size_is_counted_in_utf16_units():
+    """Emoji take two UTF-16 units: node may contain only half as much of them, and pairs are never split"""
+    nodes = parser.form_mail_text_nodes("😀" * 150, max_size=101)
+
+    assert all(_get_utf16_size(node) <= 101 for node in nodes)
+    assert "".join(nodes) == "😀" * 150
+
+
+def test_parse_email_single_pass():
+    message = EmailMessage()
+    message["From"] = "Иван Петров <ivan@example.com>"
+    message["Subject"] = "Отчёт"
+    message["Date"] = "Tue, 15 Aug 2023 10:00:00 +0300"
+    message.set_content("Текст\xa0письма", charset="utf-8", cte="quoted-printable")
+    message.add_alternative("<p>HTML text</p>", subtype="html")
+    message.add_attachment(b"%PDF", maintype="application", subtype="pdf", filename="report.pdf")
+
+    parsed_email = parser.parse_email(message.as_bytes())
+
+    assert (parsed_email.from_name, parsed_email.from_address) == ("Иван Петров", "ivan@example.com")
+    assert parsed_email.subject == "Отчёт"
+    assert parsed_email.date.isoformat() == "2023-08-15T10:00:00+03:00"
+    assert parsed_email.text == "Текст письма"
+    assert [attachment.get_filename() for attachment in parsed_email.attachments] == ["report.pdf"]
+
+
+def test_attachments_filenames_are_decoded():
+    message = EmailMessage()
+    message["From"] = "sender@example.com"
+    message.set_content("Text")
+    message.add_attachment(b"%PDF", maintype="application", subtype="pdf", filename="счет.pdf")  # RFC 2231
+    message.add_attachment(b"%PDF", maintype="application", subtype="pdf",
+                           filename="=?utf-8?B?0L7RgtGH0LXRgi5wZGY=?=")  # RFC 2047, as many mail clients send it
+
+    attachments = parser.parse_email(message.as_bytes()).attachments
+
+    assert [_get_filename(attachment) for attachment in attachments] == ["счет.pdf", "отчет.pdf"]
+
+
+def test_parse_html_only_email():
+    message = EmailMessage()
+    message["From"] = "sender@example.com"
+    message.set_content("<div>Hello <b>there</b></div><script>alert(1)</script>", subtype="html")
+
+    parsed_email = parser.parse_email(message.as_bytes())
+
+    assert (parsed_email.from_name, parsed_email.subject) == ("", None)
+    assert parsed_email.text == "Hello there"
+
+
+def test_part_text_decoding():
+    assert parser.get_part_text(payload=b"0J/RgNC40LLQtdGC", content_type="text/plain", encoding="base64",
+                                charset="utf-8") == "Привет"
+    assert parser.get_part_text(payload=b"=CF=F0=E8=E2=E5=F2", content_type="text/plain",
+                                encoding="quoted-printable", charset="windows-1251") == "Привет"
+    assert parser.get_part_text(payload=b"Hi", content_type="text/plain", encoding="7bit",
+                                charset="unknown-charset") == "Hi"
+
+
+def test_email_text_is_capped():
+    text = parser.get_part_text(payload=b"a" * (EMAIL_TEXT_MAX_SIZE * 2), content_type="text/plain", encoding="7bit",
+                                charset=None)
+    assert len(text) == EMAIL_TEXT_MAX_SIZE
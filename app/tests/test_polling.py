@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from app.dtos.email import UserEmailDTO
+from app.services.broker import polling
+from app.services.broker.polling import PollingScheduler, _MailboxSchedule
+from app.settings import settings
+
+
+def _get_email(email_db_id: int, last_email_id: int = 10, uid_validity: int | None = 5) -> UserEmailDTO:
+    return UserEmailDTO(user_id=1, mail_server="imap.gmail.com", mail_address=f"user{email_db_id}@gmail.com",
+                        mail_auth_key="key", last_email_id=last_email_id, forum_id=-100, email_db_id=email_db_id,
+                        uid_validity=uid_validity)
+
+
+def _get_scheduler(due_in: dict[int, float]) -> PollingScheduler:
+    """: Returns scheduler of mailboxes due in given seconds by Email db id. Database isn't used"""
+    scheduler = PollingScheduler(session_pool=None)
+    now = time.monotonic()
+    for email_db_id, seconds in due_in.items():
+        scheduler._schedules[email_db_id] = _MailboxSchedule(email=_get_email(email_db_id), due_at=now + seconds)
+        scheduler._reschedule(scheduler._schedules[email_db_id], due_at=now + seconds)
+    return scheduler
+
+
+def _get_email_ids(emails: list[UserEmailDTO]) -> list[int]:
+    return [email.email_db_id for email in emails]
+
+
+def test_only_due_mailboxes_are_popped_in_due_order():
+    scheduler = _get_scheduler({1: -1, 2: 100, 3: -5})
+
+    assert _get_email_ids(scheduler.pop_due()) == [3, 1]
+    assert scheduler.pop_due() == []
+
+
+def test_mailbox_reported_twice_is_popped_once(monkeypatch: pytest.MonkeyPatch):
+    scheduler = _get_scheduler({1: -1})
+    scheduler.pop_due()
+    scheduler.report_skipped(1)
+    scheduler.report_skipped(1)  # The first heap entry is outdated now
+
+    due_at = scheduler._schedules[1].due_at
+    assert due_at == pytest.approx(time.monotonic() + settings.POLLING_MIN_SEC_INTERVAL, abs=1)
+    monkeypatch.setattr(polling.time, "monotonic", lambda: due_at)
+    assert _get_email_ids(scheduler.pop_due()) == [1]
+    assert scheduler._queue == []
+
+
+def test_removed_mailbox_is_not_popped():
+    scheduler = _get_scheduler({1: -1, 2: -1})
+    del scheduler._schedules[1]
+
+    assert _get_email_ids(scheduler.pop_due()) == [2]
+    scheduler.report_polled(1, fetched_email=_get_email(1))  # Removed while polled
+    assert 1 not in scheduler._schedules
+
+
+def test_failed_polls_back_off_exponentially():
+    scheduler = _get_scheduler({1: -1})
+    intervals = list()
+    for _ in range(20):
+        scheduler.pop_due()
+        scheduler.report_polled(1, fetched_email=None)
+        intervals.append(scheduler._schedules[1].due_at - time.monotonic())
+        scheduler._reschedule(scheduler._schedules[1], due_at=time.monotonic() - 1)
+
+    assert intervals[0] == pytest.approx(settings.POLLING_MIN_SEC_INTERVAL * 2, abs=1)
+    assert intervals[1] == pytest.approx(settings.POLLING_MIN_SEC_INTERVAL * 4, abs=1)
+    assert intervals[-1] == pytest.approx(settings.POLLING_MAX_BACKOFF_SEC, abs=1)
+
+
+def test_arrival_rate_is_estimated_after_two_polls():
+    schedule = _MailboxSchedule(email=_get_email(1, last_email_id=10), due_at=0)
+    PollingScheduler._update_arrival_rate(schedule, fetched_email=_get_email(1, last_email_id=12), now=100)
+    assert schedule.arrival_rate is None
+
+    schedule.polled_at = 100
+    PollingScheduler._update_arrival_rate(schedule, fetched_email=_get_email(1, last_email_id=20), now=110)
+    assert schedule.arrival_rate == pytest.approx(1)
+
+
+def test_arrival_rate_is_smoothed():
+    schedule = _MailboxSchedule(email=_get_email(1, last_email_id=10), due_at=0, polled_at=0, arrival_rate=1)
+    PollingScheduler._update_arrival_rate(schedule, fetched_email=_get_email(1, last_email_id=10), now=10)
+    assert schedule.arrival_rate == pytest.approx(1 - settings.POLLING_RATE_SMOOTHING)
+
+
+def test_arrival_rate_ignores_new_uid_validity():
+    schedule = _MailboxSchedule(email=_get_email(1, last_email_id=10), due_at=0, polled_at=0, arrival_rate=0.5)
+    PollingScheduler._update_arrival_rate(schedule, fetched_email=_get_email(1, last_email_id=1000, uid_validity=6),
+                                          now=10)
+    assert schedule.arrival_rate == 0.5
+
+
+def test_interval_follows_arrival_rate_within_bounds():
+    assert polling._get_interval(None) == settings.POLLING_MIN_SEC_INTERVAL
+    assert polling._get_interval(0) == settings.POLLING_MAX_SEC_INTERVAL
+    assert polling._get_interval(100) == settings.POLLING_MIN_SEC_INTERVAL
+    assert polling._get_interval(1e-6) == settings.POLLING_MAX_SEC_INTERVAL
+    rate = settings.POLLING_EXPECTED_EMAILS_PER_POLL / 60
+    assert polling._get_interval(rate) == pytest.approx(60)
+
+
+def test_successful_poll_schedules_by_arrival_rate():
+    scheduler = _get_scheduler({1: -1})
+    schedule = scheduler._schedules[1]
+    schedule.polled_at, schedule.arrival_rate = time.monotonic() - 100, 0
+
+    scheduler.pop_due()
+    scheduler.report_polled(1, fetched_email=_get_email(1, last_email_id=10))
+
+    assert schedule.due_at - time.monotonic() == pytest.approx(settings.POLLING_MAX_SEC_INTERVAL, abs=1)
+    assert schedule.failures_count == 0
@@ -0,0 +1,146 @@
+import asyncio
+from contextlib import AsyncExitStack
+
+import pytest
+
+from app.dtos.email import UserEmailDTO
+from app.services.email.base.entities import EmailConnectionType, EmailServers
+from app.services.email.imap import pool
+from app.services.email.imap.fetcher import base
+from app.services.email.imap.pool import IMAPConnectionPool
+from app.settings import settings
+
+
+class _Client:
+    def __init__(self) -> None:
+        self.logged_out = False
+
+    def get_state(self) -> EmailConnectionType:
+        return EmailConnectionType.NONAUTH if self.logged_out else EmailConnectionType.SELECTED
+
+    async def logout(self) -> None:
+        self.logged_out = True
+
+
+@pytest.fixture(autouse=True)
+def fake_connect(monkeypatch: pytest.MonkeyPatch) -> None:
+    async def connect(**kwargs) -> _Client:
+        return _Client()
+
+    monkeypatch.setattr(pool, "connect", connect)
+
+
+def _get_email(email_db_id: int, mail_server: str = "gmail") -> UserEmailDTO:
+    return UserEmailDTO(user_id=email_db_id, mail_server=mail_server, mail_address=f"user{email_db_id}@gmail.com",
+                        mail_auth_key="key", forum_id=-100, email_db_id=email_db_id)
+
+
+def test_least_recently_used_session_is_evicted():
+    async def borrow_sessions() -> dict[int, _Client]:
+        imap_pool = IMAPConnectionPool(max_connections=2)
+        clients = dict()
+        for email_db_id in (1, 2, 1, 3):  # Session of mailbox 1 is reused, so mailbox 2 is least recently used
+            async with imap_pool.borrow(user_email=_get_email(email_db_id)) as client:
+                clients.setdefault(email_db_id, client)
+                assert client is clients[email_db_id]
+        return clients
+
+    clients = asyncio.run(borrow_sessions())
+    assert {email_db_id: client.logged_out for email_db_id, client in clients.items()} == {1: False, 2: True, 3: False}
+
+
+def test_borrowed_session_isnt_evicted():
+    async def borrow_sessions() -> list[str]:
+        imap_pool = IMAPConnectionPool(max_connections=1)
+        events = list()
+
+        async def borrow_second_session() -> None:
+            async with imap_pool.borrow(user_email=_get_email(2)) as client:
+                events.append("second borrowed")
+                assert client is not None
+
+        async with imap_pool.borrow(user_email=_get_email(1)) as first_client:
+            second_borrowing = asyncio.create_task(borrow_second_session())
+            await asyncio.sleep(0.01)  # Slot is waited for while the only session is borrowed
+            events.append("first released")
+        await second_borrowing
+        assert first_client.logged_out
+        return events
+
+    assert asyncio.run(borrow_sessions()) == ["first released", "second borrowed"]
+
+
+def test_dedicated_slots_take_only_their_share():
+    async def reserve_slots() -> tuple[list[bool], _Client | None]:
+        imap_pool = IMAPConnectionPool(max_connections=10)
+        async with AsyncExitStack() as stack:
+            reserved = [await stack.enter_async_context(imap_pool.reserve_dedicated_slot(service_id="gmail"))
+                        for _ in range(9)]
+            async with imap_pool.borrow(user_email=_get_email(1)) as client:  # Borrowers get the rest
+                return reserved, client
+
+    reserved, client = asyncio.run(reserve_slots())
+    assert reserved == [True] * 8 + [False]
+    assert client is not None
+
+
+def test_dedicated_slot_evicts_idle_session(monkeypatch: pytest.MonkeyPatch):
+    monkeypatch.setattr(settings, "IMAP_POOL_DEDICATED_SESSIONS_SHARE", 0.5)
+
+    async def reserve_slot() -> tuple[bool, list[_Client]]:
+        imap_pool = IMAPConnectionPool(max_connections=2)
+        clients = list()
+        for email_db_id in (1, 2):
+            async with imap_pool.borrow(user_email=_get_email(email_db_id)) as client:
+                clients.append(client)
+        async with imap_pool.reserve_dedicated_slot(service_id="gmail") as reserved:
+            return reserved, clients
+
+    reserved, (first_client, second_client) = asyncio.run(reserve_slot())
+    assert reserved
+    assert first_client.logged_out and not second_client.logged_out
+
+
+class _FailingClient(_Client):
+    """IMAP4_SSL whose attempts fail with given errors in turn, None succeeds"""
+
+    attempts_results: list[type[Exception] | None] = list()
+
+    def __init__(self, host: str, port: int) -> None:
+        super().__init__()
+        self.protocol = None
+        self._error = self.attempts_results.pop(0)
+
+    async def wait_hello_from_server(self) -> None:
+        if self._error:
+            raise self._error()
+
+    async def login(self, email_address: str, email_auth_key: str) -> None:
+        pass
+
+    async def select(self, mailbox: str) -> None:
+        pass
+
+
+@pytest.mark.parametrize("attempts_results, sleeps_count", [
+    ([TimeoutError, ConnectionResetError, None], 2),
+    ([TimeoutError, OSError, TimeoutError], 2),
+])
+def test_connect_closes_failed_attempts(attempts_results: list, sleeps_count: int, monkeypatch: pytest.MonkeyPatch):
+    clients, sleeps = list(), list()
+
+    def create_client(host: str, port: int) -> _FailingClient:
+        clients.append(_FailingClient(host=host, port=port))
+        return clients[-1]
+
+    async def sleep(delay: float) -> None:
+        sleeps.append(delay)
+
+    monkeypatch.setattr(_FailingClient, "attempts_results", list(attempts_results))
+    monkeypatch.setattr(base.aioimaplib, "IMAP4_SSL", create_client)
+    monkeypatch.setattr(base.asyncio, "sleep", sleep)
+    client = asyncio.run(base.connect(email_service=EmailServers.gmail.value, email_address="user@gmail.com",
+                                      email_auth_key="key", attempts_count=len(attempts_results)))
+    assert client is clients[-1]
+    assert [client.logged_out for client in clients] == [True] * (len(clients) - 1) + [False]
+    assert len(sleeps) == sleeps_count
@@ -0,0 +1,162 @@
+"""
+Query plans of hot queries: fetcher's mailboxes, broadcaster's mailbox & delivery ledger lookups, sender's topic lookup.
+Runs against local postgres of LESST_TEST_DB_URI (`postgresql+asyncpg://postgres@localhost/postgres`): throwaway
+database is created there, migrated like database created by app versions without migrations, and dropped after tests.
+"""
+
+import asyncio
+import json
+import os
+import uuid
+from argparse import Namespace
+from typing import Awaitable, Callable, Iterator
+
+import pytest
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.services import cryptography
+from app.services.database.dao.delivery import DeliveredEmailDAO
+from app.services.database.dao.email import EmailDAO
+from app.services.database.dao.topic import TopicDAO
+from app.settings import paths
+
+_TEST_DB_URI = os.environ.get("LESST_TEST_DB_URI")
+
+_EMAILS_COUNT = 1000
+
+pytestmark = pytest.mark.skipif(not _TEST_DB_URI, reason="LESST_TEST_DB_URI isn't set")
+
+
+def _get_alembic_config(db_uri: str) -> Config:
+    config = Config(str(paths.ROOT_DIR / "alembic.ini"))
+    config.set_main_option("script_location", str(paths.ROOT_DIR / "migrations"))
+    config.cmd_opts = Namespace(x=[f"db_uri={db_uri}"])
+    return config
+
+
+async def _execute(db_uri: str, *statements: str) -> None:
+    engine = create_async_engine(db_uri, poolclass=NullPool, isolation_level="AUTOCOMMIT")
+    try:
+        async with engine.connect() as connection:
+            for statement in statements:
+                await connection.execute(text(statement))
+    finally:
+        await engine.dispose()
+
+
+@pytest.fixture(scope="module")
+def db_uri() -> Iterator[str]:
+    """Throwaway database with schema of app versions without migrations, upgraded by migrations to head"""
+    db_name = f"lesst_test_{uuid.uuid4().hex[:12]}"
+    try:
+        asyncio.run(_execute(_TEST_DB_URI, f"CREATE DATABASE {db_name}"))
+    except (SQLAlchemyError, OSError) as error:
+        pytest.skip(f"Test database is unavailable: {error}")
+    db_uri = make_url(_TEST_DB_URI).set(database=db_name).render_as_string(hide_password=False)
+
+    try:
+        alembic_config = _get_alembic_config(db_uri)
+        # Tables created by `create_all` of app versions without migrations: initial migration's schema, no version
+        command.upgrade(alembic_config, "0001")
+        asyncio.run(_execute(
+            db_uri,
+            "DROP TABLE alembic_version",
+            "INSERT INTO emails (user_id, forum_id, mail_server, mail_address, mail_auth_key, last_email_id) "
+            "SELECT n, -100 - n % 10, 'imap.gmail.com', 'user' || n || '@gmail.com', "
+            f"'{cryptography.encrypt_key('key')}', 10 FROM generate_series(1, {_EMAILS_COUNT}) n",
+            "INSERT INTO topics (forum_id, topic_id, topic_name) "
+            "VALUES (-100, 2, 'sender@gmail.com'), (-100, 3, 'sender@gmail.com')",
+        ))
+        command.stamp(alembic_config, "0001", purge=True)
+        command.upgrade(alembic_config, "head")
+        asyncio.run(_execute(db_uri, "ANALYZE"))
+        yield db_uri
+    finally:
+        asyncio.run(_execute(_TEST_DB_URI, f"DROP DATABASE IF EXISTS {db_name} WITH (FORCE)"))
+
+
+def _get_index_names(plan: dict) -> Iterator[str]:
+    if "Index Name" in plan:
+        yield plan["Index Name"]
+    for subplan in plan.get("Plans", ()):
+        yield from _get_index_names(subplan)
+
+
+async def _get_query_indexes(db_uri: str, query: Callable[[AsyncSession], Awaitable]) -> set[str]:
+    """
+    Runs DAO query & explains its statements with disabled sequential scans: with few rows planner would prefer them.
+    :return: names of indexes used by query's statements
+    """
+
+    engine = create_async_engine(db_uri, poolclass=NullPool)
+    statements = []
+
+    def save_statement(connection, cursor, statement, parameters, context, executemany) -> None:
+        if statement.lstrip().upper().startswith("SELECT"):
+            statements.append((statement, parameters))
+
+    try:
+        async with AsyncSession(engine) as session:
+            await session.execute(text("SET enable_seqscan = off"))
+            event.listen(engine.sync_engine, "before_cursor_execute", save_statement)
+            await query(session)
+            event.remove(engine.sync_engine, "before_cursor_execute", save_statement)
+
+            assert statements
+            connection = await session.connection()
+            indexes = set()
+            for statement, parameters in statements:
+                result = await connection.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {statement}", parameters)
+                plan = result.scalar_one()
+                plan = json.loads(plan) if isinstance(plan, str) else plan
+                indexes.update(_get_index_names(plan[0]["Plan"]))
+            return indexes
+    finally:
+        await engine.dispose()
+
+
+def test_migrations_remove_duplicated_topics(db_uri: str):
+    async def get_topic_ids() -> set[int]:
+        engine = create_async_engine(db_uri, poolclass=NullPool)
+        try:
+            async with AsyncSession(engine) as session:
+                return await TopicDAO(session).get_topic_ids(forum_id=-100)
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(get_topic_ids()) == {2}
+
+
+def test_fetcher_mailboxes_query_uses_index(db_uri: str):
+    async def iter_emails(session: AsyncSession) -> None:
+        emails = [email async for email in EmailDAO(session).iter_emails_with_forums()]
+        assert len(emails) == _EMAILS_COUNT
+
+    assert "emails_forum_id_idx" in asyncio.run(_get_query_indexes(db_uri, iter_emails))
+
+
+def test_broadcaster_mailbox_query_uses_index(db_uri: str):
+    async def get_email(session: AsyncSession) -> None:
+        await EmailDAO(session).get_email(user_id=1, forum_id=-101)
+
+    assert "emails_user_id_forum_id_idx" in asyncio.run(_get_query_indexes(db_uri, get_email))
+
+
+def test_delivery_ledger_query_uses_index(db_uri: str):
+    async def get_delivered_emails(session: AsyncSession) -> None:
+        await DeliveredEmailDAO(session).get_delivered_emails([(1, 100, 5, False), (1, 100, 5, True)])
+
+    assert "delivered_emails_pkey" in asyncio.run(_get_query_indexes(db_uri, get_delivered_emails))
+
+
+def test_topic_query_uses_index(db_uri: str):
+    async def get_topic(session: AsyncSession) -> None:
+        await TopicDAO(session).get_topic(forum_id=-100, email_address="sender@gmail.com")
+
+    assert "topics_forum_id_topic_name_key" in asyncio.run(_get_query_indexes(db_uri, get_topic))
@@ -0,0 +1,91 @@
+import asyncio
+from contextlib import nullcontext
+from datetime import timedelta
+
+import pytest
+
+from app.services.broker import shards
+from app.services.broker.shards import Shard, ShardMembership
+from app.settings import settings
+
+
+class _FetcherWorkerDAO:
+    """In-memory FetcherWorkerDAO with database clock moved by tests"""
+
+    now: float = 0
+    heartbeats: dict[str, float] = dict()
+    is_available: bool = True
+
+    def __init__(self, session: object) -> None:
+        pass
+
+    async def heartbeat(self, worker_id: str, ttl: timedelta) -> list[str]:
+        if not self.is_available:
+            raise ConnectionRefusedError("Database is down")
+        self.heartbeats[worker_id] = self.now
+        for dead_worker_id in [worker_id for worker_id, heartbeat_date in self.heartbeats.items()
+                               if heartbeat_date < self.now - ttl.total_seconds()]:
+            del self.heartbeats[dead_worker_id]
+        return sorted(self.heartbeats)
+
+    async def remove_worker(self, worker_id: str) -> None:
+        self.heartbeats.pop(worker_id, None)
+
+
+@pytest.fixture(autouse=True)
+def fetcher_worker_dao(monkeypatch: pytest.MonkeyPatch) -> type[_FetcherWorkerDAO]:
+    monkeypatch.setattr(_FetcherWorkerDAO, "now", 0)
+    monkeypatch.setattr(_FetcherWorkerDAO, "heartbeats", dict())
+    monkeypatch.setattr(_FetcherWorkerDAO, "is_available", True)
+    monkeypatch.setattr(shards, "FetcherWorkerDAO", _FetcherWorkerDAO)
+    return _FetcherWorkerDAO
+
+
+def _heartbeat(*memberships: ShardMembership) -> None:
+    async def heartbeat() -> None:
+        for membership in memberships:
+            await membership.heartbeat()
+
+    asyncio.run(heartbeat())
+
+
+def _join(memberships_count: int) -> list[ShardMembership]:
+    """: Returns memberships of fetchers balanced by their second heartbeats: the first ones see earlier joined only"""
+    memberships = [ShardMembership(session_pool=nullcontext) for _ in range(memberships_count)]
+    _heartbeat(*memberships)
+    _heartbeat(*memberships)
+    return memberships
+
+
+def test_every_mailbox_is_owned_by_one_shard():
+    shards_group = [Shard(index=index, count=3) for index in range(3)]
+    assert all(sum(shard.owns(email_db_id) for shard in shards_group) == 1 for email_db_id in range(1, 100))
+
+
+def test_dead_fetcher_shard_is_taken_over_after_ttl(fetcher_worker_dao: type[_FetcherWorkerDAO]):
+    first_membership, second_membership = _join(2)
+    assert {first_membership.shard, second_membership.shard} == {Shard(index=0, count=2), Shard(index=1, count=2)}
+
+    fetcher_worker_dao.now = settings.SHARD_WORKER_TTL_SEC  # Second fetcher died right after heartbeat
+    _heartbeat(first_membership)
+    assert first_membership.shard.count == 2  # Not dead until TTL passes
+
+    fetcher_worker_dao.now += 1
+    _heartbeat(first_membership)
+    assert first_membership.shard == Shard(index=0, count=1)
+
+
+def test_left_fetcher_shard_is_taken_over_by_next_heartbeat():
+    first_membership, second_membership = _join(2)
+    asyncio.run(second_membership.leave())
+    _heartbeat(first_membership)
+    assert first_membership.shard == Shard(index=0, count=1)
+
+
+def test_shard_is_kept_while_database_is_down(fetcher_worker_dao: type[_FetcherWorkerDAO]):
+    first_membership, _ = _join(2)
+    shard = first_membership.shard
+
+    fetcher_worker_dao.is_available = False
+    _heartbeat(first_membership)
+    assert first_membership.shard == shard
@@ -0,0 +1,79 @@
+import asyncio
+import time
+
+from app.core.middlewares.throttling import ATTACHMENT_PRIORITY, TEXT_PRIORITY, TokenBucket
+
+
+def test_burst_is_not_throttled():
+    async def acquire_burst() -> float:
+        bucket = TokenBucket(rate=1, capacity=5)
+        started_at = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started_at
+
+    assert asyncio.run(acquire_burst()) < 0.1
+
+
+def test_acquisitions_follow_rate():
+    async def acquire_over_burst() -> float:
+        bucket = TokenBucket(rate=20, capacity=1)
+        started_at = time.monotonic()
+        for _ in range(5):
+            await bucket.acquire()
+        return time.monotonic() - started_at
+
+    assert 0.18 <= asyncio.run(acquire_over_burst()) < 0.5  # The first one is taken from burst, the rest by rate
+
+
+def test_waiters_are_served_by_priority_then_arrival_order():
+    async def acquire_concurrently() -> list[str]:
+        bucket = TokenBucket(rate=50, capacity=1)
+        await bucket.acquire()  # Bucket is empty: the rest wait
+        served = list()
+
+        async def acquire(name: str, priority: int) -> None:
+            await bucket.acquire(priority)
+            served.append(name)
+
+        await asyncio.gather(acquire("attachment 1", ATTACHMENT_PRIORITY), acquire("text 1", TEXT_PRIORITY),
+                             acquire("attachment 2", ATTACHMENT_PRIORITY), acquire("text 2", TEXT_PRIORITY))
+        return served
+
+    assert asyncio.run(acquire_concurrently()) == ["text 1", "text 2", "attachment 1", "attachment 2"]
+
+
+def test_cancelled_waiter_does_not_take_token():
+    async def acquire_after_cancelled() -> float:
+        bucket = TokenBucket(rate=10, capacity=1)
+        await bucket.acquire()
+        cancelled_waiter = asyncio.create_task(bucket.acquire())
+        await asyncio.sleep(0)
+        cancelled_waiter.cancel()
+        started_at = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started_at
+
+    assert asyncio.run(acquire_after_cancelled()) < 0.15
+
+
+def test_pause_delays_waiters_and_drops_burst():
+    async def acquire_after_pause() -> float:
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.2)
+        started_at = time.monotonic()
+        await bucket.acquire()
+        return time.monotonic() - started_at
+
+    assert 0.2 <= asyncio.run(acquire_after_pause()) < 0.4
+
+
+def test_bucket_is_idle_once_refilled():
+    async def check_idle() -> tuple[bool, bool]:
+        bucket = TokenBucket(rate=100, capacity=1)
+        await bucket.acquire()
+        is_idle_after_acquire = bucket.is_idle
+        await asyncio.sleep(0.05)
+        return is_idle_after_acquire, bucket.is_idle
+
+    assert asyncio.run(check_idle()) == (False, True)
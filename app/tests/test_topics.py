@@ -0,0 +1,76 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.dtos.topic import TopicDTO
+from app.services.broker import topics
+from app.services.broker.topics import TopicsCache
+
+
+class _Bot:
+    def __init__(self) -> None:
+        self.created_topics_ids = list()
+        self.deleted_topics_ids = list()
+
+    async def create_forum_topic(self, chat_id: int, name: str) -> SimpleNamespace:
+        await asyncio.sleep(0.01)  # Other emails of sender arrive while topic is created
+        self.created_topics_ids.append(len(self.created_topics_ids) + 2)
+        return SimpleNamespace(message_thread_id=self.created_topics_ids[-1])
+
+    async def delete_forum_topic(self, chat_id: int, message_thread_id: int) -> None:
+        self.deleted_topics_ids.append(message_thread_id)
+
+
+class _TopicDAO:
+    """In-memory TopicDAO"""
+
+    topics: dict[tuple[int, str], TopicDTO] = dict()
+
+    def __init__(self, session: object) -> None:
+        pass
+
+    async def get_topic(self, forum_id: int, email_address: str) -> TopicDTO | None:
+        return self.topics.get((forum_id, email_address))
+
+    async def get_or_create_topic(self, topic: TopicDTO) -> TopicDTO:
+        return self.topics.setdefault((topic.forum_id, topic.topic_name), topic)
+
+
+@pytest.fixture(autouse=True)
+def topic_dao(monkeypatch: pytest.MonkeyPatch) -> type[_TopicDAO]:
+    monkeypatch.setattr(_TopicDAO, "topics", dict())
+    monkeypatch.setattr(topics, "TopicDAO", _TopicDAO)
+    return _TopicDAO
+
+
+def test_concurrent_emails_of_new_sender_create_one_topic():
+    async def get_topics() -> tuple[list[TopicDTO], TopicsCache]:
+        topics_cache = TopicsCache()
+        return await asyncio.gather(*(
+            topics_cache.get_or_create_topic(bot=bot, session=None, forum_id=-100, email_address="sender@gmail.com")
+            for _ in range(5)
+        )), topics_cache
+
+    bot = _Bot()
+    sender_topics, topics_cache = asyncio.run(get_topics())
+    assert bot.created_topics_ids == [2]
+    assert {topic.topic_id for topic in sender_topics} == {2}
+    assert not topics_cache._creation_locks
+
+
+def test_topic_created_by_another_instance_is_kept(topic_dao: type[_TopicDAO]):
+    async def create_topic() -> TopicDTO:
+        async def create_other_instance_topic(**kwargs) -> SimpleNamespace:
+            topic_dao.topics[(-100, "sender@gmail.com")] = TopicDTO(forum_id=-100, topic_id=7,
+                                                                    topic_name="sender@gmail.com")
+            return await create_forum_topic(**kwargs)
+
+        create_forum_topic = bot.create_forum_topic
+        bot.create_forum_topic = create_other_instance_topic
+        return await TopicsCache().get_or_create_topic(bot=bot, session=None, forum_id=-100,
+                                                       email_address="sender@gmail.com")
+
+    bot = _Bot()
+    assert asyncio.run(create_topic()).topic_id == 7
+    assert bot.deleted_topics_ids == [2]
@@ -0,0 +1,63 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import pool
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.services.database import models
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+# Models' metadata for `alembic revision --autogenerate`
+target_metadata = models.BASE.metadata
+
+
+def get_url() -> str:
+    """
+    Returns database url: `alembic -x db_uri=postgresql+asyncpg://...` if set, otherwise database url of app.ini.
+    """
+    db_uri = context.get_x_argument(as_dictionary=True).get("db_uri")
+    if db_uri:
+        return db_uri
+
+    # app.ini is required by config module import, so it's imported only if database url isn't set
+    from app.settings.config import load_config
+    return load_config().db.get_uri()
+
+
+def run_migrations_offline() -> None:
+    """Emits migrations SQL to output instead of running it: `alembic upgrade head --sql`"""
+    context.configure(
+        url=get_url(),
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def do_run_migrations(connection: Connection) -> None:
+    context.configure(connection=connection, target_metadata=target_metadata)
+
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+async def run_async_migrations() -> None:
+    engine = create_async_engine(get_url(), poolclass=pool.NullPool)
+    async with engine.connect() as connection:
+        await connection.run_sync(do_run_migrations)
+
+    await engine.dispose()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    asyncio.run(run_async_migrations())
@@ -0,0 +1,60 @@
+"""Initial schema: tables created by app versions without migrations
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "users",
+        sa.Column("id", sa.BigInteger(), autoincrement=False, nullable=False),
+        sa.Column("username", sa.String(), nullable=True),
+        sa.Column("firstname", sa.String(), nullable=True),
+        sa.Column("lastname", sa.String(), nullable=True),
+        sa.Column("language_code", sa.String(), nullable=True),
+        sa.Column("registered_date", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("id"),
+    )
+    op.create_table(
+        "emails",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("user_id", sa.BigInteger(), nullable=True),
+        sa.Column("forum_id", sa.BigInteger(), nullable=True),
+        sa.Column("mail_server", sa.String(), nullable=True),
+        sa.Column("mail_address", sa.String(), nullable=True),
+        sa.Column("mail_auth_key", sa.String(), nullable=True),
+        sa.Column("last_email_id", sa.Integer(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("id"),
+        sa.UniqueConstraint("mail_address"),
+    )
+    op.create_table(
+        "topics",
+        sa.Column("id", sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column("forum_id", sa.BigInteger(), nullable=True),
+        sa.Column("topic_id", sa.Integer(), nullable=True),
+        sa.Column("topic_name", sa.String(), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+        sa.UniqueConstraint("id"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("topics")
+    op.drop_table("emails")
+    op.drop_table("users")
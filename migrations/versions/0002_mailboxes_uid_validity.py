@@ -0,0 +1,28 @@
+"""Mailboxes UIDVALIDITY, last_email_id as IMAP UID
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 12:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.alter_column("emails", "last_email_id", type_=sa.BigInteger(), existing_type=sa.Integer())
+    op.add_column("emails", sa.Column("uid_validity", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("emails", "uid_validity")
+    op.alter_column("emails", "last_email_id", type_=sa.Integer(), existing_type=sa.BigInteger())
@@ -0,0 +1,26 @@
+"""Mailboxes CONDSTORE HIGHESTMODSEQ
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 12:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0003"
+down_revision: Union[str, None] = "0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("emails", sa.Column("highest_modseq", sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column("emails", "highest_modseq")
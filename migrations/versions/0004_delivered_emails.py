@@ -0,0 +1,34 @@
+"""Delivery ledger of sent emails
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0004"
+down_revision: Union[str, None] = "0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "delivered_emails",
+        sa.Column("email_db_id", sa.BigInteger(), nullable=False),
+        sa.Column("mailbox_email_id", sa.BigInteger(), nullable=False),
+        sa.Column("delivered_date", sa.DateTime(timezone=True), server_default=sa.text("now()"), nullable=True),
+        sa.PrimaryKeyConstraint("email_db_id", "mailbox_email_id"),
+    )
+    op.create_index("ix_delivered_emails_delivered_date", "delivered_emails", ["delivered_date"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_delivered_emails_delivered_date", table_name="delivered_emails")
+    op.drop_table("delivered_emails")
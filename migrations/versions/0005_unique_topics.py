@@ -0,0 +1,31 @@
+"""Unique topic of sender in forum
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 12:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0005"
+down_revision: Union[str, None] = "0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Duplicated topics break topic lookups. The oldest topic of sender is kept
+    op.execute(
+        "DELETE FROM topics duplicate USING topics original "
+        "WHERE duplicate.forum_id = original.forum_id AND duplicate.topic_name = original.topic_name "
+        "AND duplicate.id > original.id"
+    )
+    op.create_unique_constraint("topics_forum_id_topic_name_key", "topics", ["forum_id", "topic_name"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("topics_forum_id_topic_name_key", "topics", type_="unique")
@@ -0,0 +1,28 @@
+"""Indexes for hot queries
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-18 12:50:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0006"
+down_revision: Union[str, None] = "0005"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("emails_user_id_forum_id_idx", "emails", ["user_id", "forum_id"])
+    op.create_index("emails_forum_id_idx", "emails", ["forum_id"], postgresql_where=sa.text("forum_id IS NOT NULL"))
+
+
+def downgrade() -> None:
+    op.drop_index("emails_forum_id_idx", table_name="emails")
+    op.drop_index("emails_user_id_forum_id_idx", table_name="emails")
@@ -0,0 +1,43 @@
+"""UIDVALIDITY in delivery ledger key
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0008"
+down_revision: Union[str, None] = "0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("delivered_emails", sa.Column("uid_validity", sa.BigInteger(), nullable=True))
+    # Delivered emails belong to the current inbox of their mailbox. Ones of unknown inbox can't be matched anymore
+    op.execute(
+        "UPDATE delivered_emails SET uid_validity = emails.uid_validity FROM emails "
+        "WHERE emails.id = delivered_emails.email_db_id"
+    )
+    op.execute("DELETE FROM delivered_emails WHERE uid_validity IS NULL")
+    op.alter_column("delivered_emails", "uid_validity", nullable=False, existing_type=sa.BigInteger())
+    op.drop_constraint("delivered_emails_pkey", "delivered_emails", type_="primary")
+    op.create_primary_key("delivered_emails_pkey", "delivered_emails", ["email_db_id", "uid_validity", "mailbox_email_id"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("delivered_emails_pkey", "delivered_emails", type_="primary")
+    # Keys of different inboxes may collide without UIDVALIDITY: the latest delivery is kept
+    op.execute(
+        "DELETE FROM delivered_emails duplicate USING delivered_emails original "
+        "WHERE duplicate.email_db_id = original.email_db_id AND duplicate.mailbox_email_id = original.mailbox_email_id "
+        "AND duplicate.delivered_date < original.delivered_date"
+    )
+    op.create_primary_key("delivered_emails_pkey", "delivered_emails", ["email_db_id", "mailbox_email_id"])
+    op.drop_column("delivered_emails", "uid_validity")
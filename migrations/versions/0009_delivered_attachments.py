@@ -0,0 +1,36 @@
+"""Attachments follow-ups & text message id in delivery ledger
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-20 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "0009"
+down_revision: Union[str, None] = "0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Delivered emails were sent with their attachments: existing rows are texts
+    op.add_column("delivered_emails", sa.Column("is_attachments", sa.Boolean(), server_default=sa.text("false"),
+                                                nullable=False))
+    op.add_column("delivered_emails", sa.Column("message_id", sa.BigInteger(), nullable=True))
+    op.drop_constraint("delivered_emails_pkey", "delivered_emails", type_="primary")
+    op.create_primary_key("delivered_emails_pkey", "delivered_emails",
+                          ["email_db_id", "uid_validity", "mailbox_email_id", "is_attachments"])
+
+
+def downgrade() -> None:
+    op.drop_constraint("delivered_emails_pkey", "delivered_emails", type_="primary")
+    op.execute("DELETE FROM delivered_emails WHERE is_attachments")
+    op.create_primary_key("delivered_emails_pkey", "delivered_emails", ["email_db_id", "uid_validity", "mailbox_email_id"])
+    op.drop_column("delivered_emails", "message_id")
+    op.drop_column("delivered_emails", "is_attachments")